@@ -0,0 +1,114 @@
+"""
+VCF parsing benchmark: the byte-level parser against the original
+decode-everything parser, on a synthetic WGS-style upload.
+
+    python benchmarks/vcf_parse.py --lines 200000 --tagged 0.05 --repeat 7
+
+Reports the best wall time of each parser, and peak traced allocations,
+for the same input. Both parsers must find the same variants.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.vcf_parser import SUPPORTED_GENES, VCFParser  # noqa: E402
+
+
+def make_vcf(lines: int, tagged: float, seed: int = 7) -> bytes:
+    """`lines` data lines; a `tagged` share carry GENE= for a supported gene."""
+    rng = random.Random(seed)
+    out = [
+        '##fileformat=VCFv4.2',
+        '##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+        '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE'
+    ]
+    for i in range(lines):
+        gt = rng.choice(('0/1', '1/1', '0|1'))
+        info = f"DP={rng.randint(10, 90)};AF=0.5;MQ=60"
+        rsid = f"rs{rng.randint(1, 10 ** 8)}"
+        if rng.random() < tagged:
+            info = f"GENE={rng.choice(SUPPORTED_GENES)};RS={rsid};{info}"
+        out.append(f"chr1\t{i + 1}\t{rsid}\tA\tG\t50\tPASS\t{info}\tGT:DP:GQ\t{gt}:30:99")
+    return ('\n'.join(out) + '\n').encode()
+
+
+def reference_parse(content: bytes) -> Dict[str, List[Dict]]:
+    """The original parser: decode the upload, split every line and INFO column."""
+    variants_by_gene = {gene: [] for gene in SUPPORTED_GENES}
+    for line in content.decode('utf-8').strip().split('\n'):
+        if line.startswith('#') or not line.strip():
+            continue
+        fields = line.split('\t')
+        if len(fields) < 9:
+            continue
+        info = {}
+        for item in fields[7].split(';'):
+            key, _, value = item.partition('=')
+            info[key] = value if _ else True
+        gene = info.get('GENE')
+        if gene not in variants_by_gene:
+            continue
+        genotype = 'Unknown'
+        if len(fields) > 9:
+            keys, values = fields[8].split(':'), fields[9].split(':')
+            if 'GT' in keys and keys.index('GT') < len(values):
+                genotype = values[keys.index('GT')].replace('|', '/')
+        variants_by_gene[gene].append({
+            'chrom': fields[0], 'pos': fields[1],
+            'rsid': info.get('RS', fields[2] if fields[2] != '.' else None),
+            'ref': fields[3], 'alt': fields[4], 'gene': gene,
+            'star': info.get('STAR'), 'genotype': genotype
+        })
+    return variants_by_gene
+
+
+def measure(parse, content: bytes, repeat: int) -> Dict:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse(content)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'result': result, 'best_ms': best * 1000, 'peak_mb': peak / 1024 / 1024}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--tagged', type=float, default=0.05,
+                        help='Share of lines tagged with a supported gene')
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    content = make_vcf(args.lines, args.tagged)
+    vcf_parser = VCFParser()
+    reference = measure(reference_parse, content, args.repeat)
+    current = measure(vcf_parser.parse_vcf, content, args.repeat)
+    encoding_check = measure(vcf_parser.is_utf8, content, args.repeat)
+
+    found = {gene: len(v) for gene, v in current['result'].items()}
+    expected = {gene: len(v) for gene, v in reference['result'].items()}
+    if found != expected:
+        print(f"Parsers disagree: {found} != {expected}", file=sys.stderr)
+        return 1
+
+    print(f"{args.lines} lines ({len(content) / 1024 / 1024:.1f} MB), "
+          f"{sum(found.values())} variants kept, best of {args.repeat}")
+    print(f"  reference parser : {reference['best_ms']:8.1f} ms  peak {reference['peak_mb']:6.1f} MB")
+    print(f"  byte parser      : {current['best_ms']:8.1f} ms  peak {current['peak_mb']:6.1f} MB  "
+          f"({reference['best_ms'] / current['best_ms']:.1f}x)")
+    print(f"  UTF-8 check      : {encoding_check['best_ms']:8.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
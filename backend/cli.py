@@ -0,0 +1,373 @@
+"""
+Offline command-line entry point for PharmaGuard.
+
+    python cli.py analyze ARCHIVE_DIR --drugs codeine,warfarin --output results.ndjson
+    python cli.py precompute-explanations --concurrency 4 --rate 2
+    python cli.py reanalyze
+
+Runs the same parser and engines as the HTTP API over a directory of VCFs
+without a server. Files are spread across a process pool; finished files
+are recorded in a checkpoint so an interrupted run resumes where it
+stopped. `precompute-explanations` fills the explanation bundle the API
+serves without calling the LLM. `reanalyze` updates the stored API
+results affected by knowledge base edits.
+"""
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from services.analysis_pipeline import AnalysisPipeline
+from services.drug_analysis import DrugAnalyzer
+from services.drug_engine import DrugEngine
+from services.vcf_parser import VCFQC
+
+logger = logging.getLogger('pharmaguard.cli')
+
+LLM_MODES = ('off', 'cache', 'on')
+
+# Per-worker state, built once by the pool initializer
+_worker_pipeline: Optional[AnalysisPipeline] = None
+_worker_analyzer: Optional[DrugAnalyzer] = None
+_worker_explain = False
+
+
+def _init_worker(llm_mode: str):
+    """Load the knowledge base (and LLM clients, if enabled) once per worker."""
+    global _worker_pipeline, _worker_analyzer, _worker_explain
+    load_dotenv()
+    _worker_pipeline = AnalysisPipeline()
+
+    llm_service = web_search_service = bundle = None
+    if llm_mode in ('cache', 'on'):
+        from services.explanation_bundle import explanation_bundle as bundle
+    if llm_mode == 'on':
+        from services.llm_service import LLMService
+        from services.web_search_service import WebSearchService
+        llm_service = LLMService()
+        web_search_service = WebSearchService()
+
+    _worker_analyzer = DrugAnalyzer(
+        DrugEngine(), _worker_pipeline.phenotype_engine, llm_service, web_search_service, bundle
+    )
+    _worker_explain = llm_mode != 'off'
+
+
+def _read_vcf(path: str) -> bytes:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        return f.read()
+
+
+def _analyze_file(path: str, sample_id: str, drugs: List[str]) -> Dict:
+    """Worker task: parse, profile and assess one VCF for every drug."""
+    start = time.perf_counter()
+    content = _read_vcf(path)
+    if not _worker_pipeline.vcf_parser.validate_vcf_header(content):
+        raise ValueError("File does not contain valid VCF v4.2 header")
+
+    qc = VCFQC()
+    variants_by_gene = _worker_pipeline.parse(content, qc)
+    # Genes whose signature this worker has called before reuse that call
+    signatures = _worker_pipeline.signatures(variants_by_gene)
+    computed = _worker_pipeline.calls_computed
+    gene_calls = _worker_pipeline.call_genes(variants_by_gene, signatures)
+    profile = _worker_pipeline.build_profile(variants_by_gene, gene_calls)
+    analyses = _worker_analyzer.analyze_panel(
+        variants_by_gene, profile, drugs, explain=_worker_explain, vcf_qc=qc
+    )
+
+    return {
+        'path': path,
+        'sample_id': sample_id,
+        'analyses': [a.model_dump() for a in analyses],
+        'bytes': len(content),
+        'variants': qc.records_kept,
+        'low_quality': qc.low_quality,
+        'signatures': signatures,
+        'gene_calls_computed': _worker_pipeline.calls_computed - computed,
+        'seconds': time.perf_counter() - start
+    }
+
+
+# ── Input / checkpoint / output ────────────────────────────────────────────
+
+def find_vcfs(input_dir: str) -> Dict[str, str]:
+    """Map every VCF under input_dir to a sample id (its relative path)."""
+    paths = sorted(
+        glob.glob(os.path.join(input_dir, '**', '*.vcf'), recursive=True) +
+        glob.glob(os.path.join(input_dir, '**', '*.vcf.gz'), recursive=True)
+    )
+    samples = {}
+    for path in paths:
+        rel = os.path.relpath(path, input_dir)
+        for ext in ('.vcf.gz', '.vcf'):
+            if rel.endswith(ext):
+                rel = rel[:-len(ext)]
+                break
+        samples[os.path.abspath(path)] = rel.replace(os.sep, '/')
+    return samples
+
+
+def load_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+class NDJSONWriter:
+    """One line per (sample, drug) analysis."""
+
+    def __init__(self, path: str, append: bool):
+        self._file = open(path, 'a' if append else 'w')
+
+    def write(self, sample_id: str, source: str, analyses: List[Dict]):
+        for analysis in analyses:
+            self._file.write(json.dumps({
+                'sample_id': sample_id,
+                'source': source,
+                'analysis': analysis
+            }) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetPartWriter:
+    """Writes each run as a new part directory so resumed runs never rewrite files."""
+
+    def __init__(self, out_dir: str, drug_genes: Dict[str, str]):
+        from services.columnar_export import ColumnarExporter
+        part = os.path.join(out_dir, f"part-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}")
+        self._exporter = ColumnarExporter(part, drug_genes=drug_genes)
+
+    def write(self, sample_id: str, source: str, analyses: List[Dict]):
+        self._exporter.write_results(sample_id, analyses)
+
+    def close(self):
+        self._exporter.close()
+
+
+# ── Commands ───────────────────────────────────────────────────────────────
+
+def run_analyze(args) -> int:
+    drug_engine = DrugEngine()
+    if args.drugs == 'all':
+        drugs = drug_engine.get_supported_drugs()
+    else:
+        requested = [d.strip() for d in args.drugs.split(',') if d.strip()]
+        unsupported = [d for d in requested if not drug_engine.is_drug_supported(d)]
+        if unsupported:
+            logger.error(f"Unsupported drugs: {', '.join(unsupported)}")
+            return 2
+        drugs = [drug_engine.resolve_drug(d) for d in requested]
+
+    samples = find_vcfs(args.input_dir)
+    checkpoint_path = args.checkpoint or f"{args.output.rstrip(os.sep)}.checkpoint"
+    done = set() if args.restart else load_checkpoint(checkpoint_path)
+    pending = [(path, sample_id) for path, sample_id in samples.items() if path not in done]
+    skipped = len(samples) - len(pending)
+
+    if args.format == 'parquet':
+        drug_genes = {d: drug_engine.get_relevant_gene(d) for d in drugs}
+        writer = ParquetPartWriter(args.output, drug_genes)
+    else:
+        writer = NDJSONWriter(args.output, append=bool(done))
+
+    logger.info(
+        f"{len(pending)} VCFs to analyze ({skipped} already done) with "
+        f"{args.workers} workers, drugs: {', '.join(drugs)}"
+    )
+
+    stats = {'files': 0, 'failed': 0, 'bytes': 0, 'variants': 0, 'cpu_seconds': 0.0,
+             'gene_calls': 0, 'gene_calls_computed': 0}
+    # Distinct per-gene genotype signatures, and whole-sample combinations of them
+    gene_signatures = set()
+    sample_signatures = set()
+    start = time.perf_counter()
+    # Bound in-flight tasks so results never pile up in memory
+    max_in_flight = args.workers * 4
+
+    with open(checkpoint_path, 'w' if args.restart else 'a') as checkpoint, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                initargs=(args.llm,)) as executor:
+        queue = iter(pending)
+        in_flight = {}
+
+        def submit_next():
+            for path, sample_id in queue:
+                in_flight[executor.submit(_analyze_file, path, sample_id, drugs)] = path
+                return True
+            return False
+
+        for _ in range(max_in_flight):
+            if not submit_next():
+                break
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    stats['failed'] += 1
+                    logger.error(f"Failed to analyze {path}: {e}")
+                else:
+                    writer.write(result['sample_id'], path, result['analyses'])
+                    # Checkpoint only after the output is written
+                    checkpoint.write(path + '\n')
+                    checkpoint.flush()
+                    stats['files'] += 1
+                    stats['bytes'] += result['bytes']
+                    stats['variants'] += result['variants']
+                    stats['cpu_seconds'] += result['seconds']
+                    stats['gene_calls'] += len(result['signatures'])
+                    stats['gene_calls_computed'] += result['gene_calls_computed']
+                    gene_signatures.update(result['signatures'])
+                    sample_signatures.add(tuple(result['signatures']))
+                    if stats['files'] % args.progress_every == 0:
+                        logger.info(f"{stats['files']}/{len(pending)} files done")
+                submit_next()
+
+    writer.close()
+    stats['gene_signatures'] = len(gene_signatures)
+    stats['sample_signatures'] = len(sample_signatures)
+    _print_report(stats, skipped, args.workers, time.perf_counter() - start)
+    return 1 if stats['failed'] else 0
+
+
+def run_precompute_explanations(args) -> int:
+    from services.explanation_bundle import precompute_bundle
+    from services.llm_service import LLMService
+    from services.star_engine import StarAlleleEngine
+    from services.phenotype_engine import PhenotypeEngine
+
+    # Offline batch: no latency target, so no hedged requests
+    llm_service = LLMService(hedge=False)
+    if llm_service.client is None:
+        logger.error("GROQ_API_KEY is not set; cannot generate explanations")
+        return 2
+
+    web_search_service = None
+    if args.web_search:
+        from services.web_search_service import WebSearchService
+        web_search_service = WebSearchService()
+
+    start = time.perf_counter()
+    stats = precompute_bundle(
+        llm_service, StarAlleleEngine(), PhenotypeEngine(), DrugEngine(),
+        path=args.output, concurrency=args.concurrency, rate=args.rate,
+        web_search_service=web_search_service
+    )
+    print(
+        f"{stats['combinations']} combinations: {stats['cached']} already bundled, "
+        f"{stats['generated']} generated, {stats['failed']} failed "
+        f"in {time.perf_counter() - start:.1f}s -> {args.output}",
+        file=sys.stderr
+    )
+    return 1 if stats['failed'] else 0
+
+
+def run_reanalyze(args) -> int:
+    from services.reanalysis import reanalyzer, REANALYSIS_BATCH_SIZE
+
+    stats = reanalyzer.run(batch_size=args.batch_size or REANALYSIS_BATCH_SIZE)
+    if stats.get('skipped'):
+        logger.error("Another reanalysis is running on this result store")
+        return 2
+    print(
+        f"{stats['stale']} stale results: {stats['updated']} updated, "
+        f"{stats['unchanged']} unchanged, {stats['unsupported']} no longer supported, "
+        f"{stats['failed']} failed "
+        f"({stats['without_variants']} stored without variants) in {stats['seconds']:.1f}s",
+        file=sys.stderr
+    )
+    return 1 if stats['failed'] else 0
+
+
+def _print_report(stats: Dict, skipped: int, workers: int, elapsed: float):
+    elapsed = max(elapsed, 1e-9)
+    print(
+        f"Analyzed {stats['files']} files ({stats['failed']} failed, "
+        f"{skipped} skipped from checkpoint) in {elapsed:.2f}s\n"
+        f"  throughput: {stats['files'] / elapsed:.1f} files/s, "
+        f"{stats['bytes'] / elapsed / 1024 / 1024:.1f} MB/s, "
+        f"{stats['variants'] / elapsed:,.0f} kept variants/s\n"
+        f"  workers: {workers}, parallel efficiency: "
+        f"{stats['cpu_seconds'] / elapsed / workers:.0%}\n"
+        f"  genotypes: {stats['sample_signatures']} distinct sample genotypes, "
+        f"{stats['gene_signatures']} distinct gene genotypes; "
+        f"{stats['gene_calls_computed']} of {stats['gene_calls']} gene calls computed",
+        file=sys.stderr
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='pharmaguard', description=__doc__.split('\n\n')[0].strip())
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    analyze = subparsers.add_parser('analyze', help='Analyze every VCF in a directory')
+    analyze.add_argument('input_dir', help='Directory searched recursively for *.vcf / *.vcf.gz')
+    analyze.add_argument('--drugs', required=True,
+                         help="Comma-separated drug list, or 'all' for every supported drug")
+    analyze.add_argument('--output', required=True,
+                         help='NDJSON file, or output directory for --format parquet')
+    analyze.add_argument('--format', choices=('ndjson', 'parquet'), default='ndjson')
+    analyze.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    analyze.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint)')
+    analyze.add_argument('--restart', action='store_true',
+                         help='Ignore an existing checkpoint and start over')
+    analyze.add_argument('--llm', choices=LLM_MODES, default='cache',
+                         help="'off' uses template explanations; 'cache' serves the "
+                              "precomputed bundle only (no network); 'on' also calls "
+                              "the LLM for combinations missing from the bundle")
+    analyze.add_argument('--progress-every', type=int, default=100)
+    analyze.set_defaults(func=run_analyze)
+
+    from services.explanation_bundle import EXPLANATION_BUNDLE_PATH
+    precompute = subparsers.add_parser(
+        'precompute-explanations',
+        help='Generate LLM explanations for every reachable result combination'
+    )
+    precompute.add_argument('--output', default=EXPLANATION_BUNDLE_PATH,
+                            help='Bundle file; existing entries are kept and skipped')
+    precompute.add_argument('--concurrency', type=int, default=4,
+                            help='Maximum LLM requests in flight')
+    precompute.add_argument('--rate', type=float, default=2.0,
+                            help='Maximum external requests per second')
+    precompute.add_argument('--web-search', action='store_true',
+                            help='Add web search context to each prompt')
+    precompute.set_defaults(func=run_precompute_explanations)
+
+    reanalyze = subparsers.add_parser(
+        'reanalyze',
+        help='Recompute stored API results affected by knowledge base changes'
+    )
+    reanalyze.add_argument('--batch-size', type=int,
+                           help='Results recomputed per transaction (default: REANALYSIS_BATCH_SIZE)')
+    reanalyze.set_defaults(func=run_reanalyze)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,7 +3,25 @@ from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
 
-from routes.analyze import router as analyze_router
+from routes.analyze import router as analyze_router, analysis_pipeline, MAX_FILE_SIZE
+from routes.results import router as results_router
+from routes.debug import router as debug_router
+from routes.profiling import router as profiling_router
+from services.process_pool import process_pool_service
+from services.result_store import result_store
+from services.reanalysis import reanalyzer, REANALYZE_ON_STARTUP
+from services.drug_engine import DrugEngine
+from services.admission_control import (
+    AdmissionControlMiddleware,
+    admission_controller,
+    ADMISSION_CONTROL_ENABLED,
+    MULTIPART_OVERHEAD_BYTES
+)
+from services.tracing import TracingMiddleware, tracer
+from services.profiling import ADMIN_TOKEN
+from services.cache_backend import cache_stats
+from services.llm_service import llm_stats
+from services.vcf_parser import qc_stats
 
 # Load environment variables
 load_dotenv()
@@ -15,7 +33,22 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Configure CORS
+# Bound concurrent analyses; shed or degrade the excess
+if ADMISSION_CONTROL_ENABLED:
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        controller=admission_controller,
+        paths=["/api/analyze"],
+        panel_size=len(DrugEngine().get_supported_drugs()),
+        max_body_bytes=MAX_FILE_SIZE + MULTIPART_OVERHEAD_BYTES
+    )
+
+# Outside admission control, so traces include admission queueing; no-op unless sampled
+if tracer.enabled:
+    app.add_middleware(TracingMiddleware, tracer=tracer, prefix="/api")
+
+# Configure CORS. Added last so it is the outermost layer and admission
+# rejections (503, 429, oversized uploads) are readable cross-origin too
 cors_origins = os.getenv('CORS_ORIGINS', 'http://localhost:3000').split(',')
 
 app.add_middleware(
@@ -24,10 +57,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-PharmaGuard-Degraded"],
 )
 
 # Include routers
 app.include_router(analyze_router, prefix="/api", tags=["analysis"])
+app.include_router(results_router, prefix="/api", tags=["results"])
+
+# Trace inspection; off by default as traces reveal request details
+if os.getenv('DEBUG_ENDPOINTS_ENABLED', 'false').lower() == 'true':
+    app.include_router(debug_router, prefix="/api", tags=["debug"])
+
+# On-demand request profiling, gated by the admin token
+if ADMIN_TOKEN:
+    app.include_router(profiling_router, prefix="/api", tags=["debug"])
+
+
+@app.on_event("startup")
+async def start_reanalysis():
+    """Bring stored results up to date with the knowledge base, off the request path."""
+    if REANALYZE_ON_STARTUP and result_store.enabled:
+        reanalyzer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_process_pool():
+    """Stop profiling worker processes with the server."""
+    process_pool_service.shutdown()
+
+
+@app.on_event("shutdown")
+async def shutdown_result_store():
+    """Commit any queued results before exiting."""
+    result_store.close()
 
 
 @app.get("/")
@@ -45,7 +107,12 @@ async def health_check():
     """Health check endpoint."""
     return {
         "status": "healthy",
-        "service": "PharmaGuard API"
+        "service": "PharmaGuard API",
+        "admission": admission_controller.stats(),
+        "caches": cache_stats(),
+        "llm": llm_stats(),
+        "vcf_qc": qc_stats.stats(),
+        "gene_calls": analysis_pipeline.call_stats()
     }
 
 
@@ -1,55 +1,100 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from datetime import datetime
-from typing import List
-import uuid
-
-from services.vcf_parser import VCFParser
-from services.star_engine import StarAlleleEngine
-from services.diplotype_engine import DiplotypeEngine
-from services.phenotype_engine import PhenotypeEngine
+from fastapi import APIRouter, Request, Response, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+import hashlib
+import logging
+
+from services.analysis_pipeline import AnalysisPipeline
+from services.process_pool import process_pool_service
+from services.result_store import result_store
 from services.drug_engine import DrugEngine
+from services.drug_analysis import DrugAnalyzer, UnsupportedDrugError
 from services.llm_service import LLMService
 from services.web_search_service import WebSearchService
+from services.explanation_bundle import explanation_bundle
+from services.vcf_parser import VCFQC, qc_stats
+from services.tracing import tracer, bind_context
+from services.profiling import (
+    request_profiler,
+    is_admin,
+    ProfilerBusy,
+    PROFILE_HEADER,
+    ADMIN_TOKEN_HEADER,
+    PROFILE_ID_HEADER
+)
+from services.response_cache import (
+    response_cache,
+    cache_key,
+    etag_matches,
+    CachedResponse,
+    MODE_FULL,
+    MODE_DETERMINISTIC,
+    RESPONSE_CACHE_CONTROL
+)
 from schemas.response_schema import (
     AnalysisResponse,
     GeneProfile,
-    DetectedVariant,
-    RiskAssessment,
-    ClinicalRecommendation,
-    LLMExplanation,
-    QualityMetrics,
     ErrorResponse
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 # Initialize services — static JSON only (no runtime API calls)
-vcf_parser = VCFParser()
-star_engine = StarAlleleEngine(use_api=False)
-diplotype_engine = DiplotypeEngine()
-phenotype_engine = PhenotypeEngine(use_api=False)
+analysis_pipeline = AnalysisPipeline()
+vcf_parser = analysis_pipeline.vcf_parser
+phenotype_engine = analysis_pipeline.phenotype_engine
 drug_engine = DrugEngine()
 llm_service = LLMService()
 web_search_service = WebSearchService()
+drug_analyzer = DrugAnalyzer(
+    drug_engine, phenotype_engine, llm_service, web_search_service, explanation_bundle
+)
 
 # File size limit (5MB)
 MAX_FILE_SIZE = 5 * 1024 * 1024
 
+# `drug` value that requests every supported drug
+PANEL_ALL = 'all'
+
+# Serializes responses once, for the cache and its ETag
+_responses_adapter = TypeAdapter(List[AnalysisResponse])
+
 
 @router.post("/analyze", response_model=List[AnalysisResponse])
 async def analyze_vcf(
+    request: Request,
+    response: Response,
     file: UploadFile = File(...),
-    drug: str = Form(...)
+    drug: str = Form(...),
+    sample_id: Optional[str] = Form(None)
 ):
     """
     Analyze VCF file and provide pharmacogenomic recommendations.
 
-    Accepts a single drug name or comma-separated list of drugs.
+    Accepts a single drug name, a comma-separated list of drugs, or "all"
+    for the full panel of supported drugs.
     Always returns a list of AnalysisResponse objects (one per drug).
+    Results are stored under `sample_id`, which defaults to a digest of the
+    VCF contents so re-uploads of the same file share an id.
+    Under overload, admission control may run the request deterministic-only
+    (template explanations, no LLM or web search).
+    Admins can send `X-Profile: 1` with `X-Admin-Token` to capture a CPU and
+    allocation profile of this request (id returned in `X-Profile-Id`).
+
+    Responses are cached per (VCF bytes, drugs, sample_id, knowledge base version) and
+    carry a strong ETag; send it back in `If-None-Match` (here or on the
+    `Content-Location` URL) to get 304 Not Modified.
     """
     # Step 1: Validate input
     try:
-        validation_result = await validate_input(file, drug)
+        profiling = _profiling_requested(request)
+
+        with tracer.span('validate_input'):
+            validation_result = await validate_input(file, drug)
         if not validation_result['valid']:
             raise HTTPException(
                 status_code=400,
@@ -63,25 +108,42 @@ async def analyze_vcf(
             )
 
         file_content = validation_result['content']
-
-        # Step 2: Parse VCF once (shared across all drugs)
-        variants_by_gene = vcf_parser.parse_vcf(file_content)
-
-        # Step 3: Build pharmacogenomic profile (shared across all drugs)
-        pharmacogenomic_profile = _build_pharmacogenomic_profile(variants_by_gene)
-
-        # Step 4: Process each drug
-        drugs = [d.strip() for d in drug.split(',') if d.strip()]
-        results = []
-        for single_drug in drugs:
-            result = _analyze_single_drug(
-                single_drug,
+        file_digest = hashlib.sha256(file_content).hexdigest()
+        sample_id = sample_id or file_digest[:16]
+        drugs = _requested_drugs(drug)
+        explain = not getattr(request.state, 'deterministic_only', False)
+
+        if not profiling:
+            cached = _lookup_cached(file_digest, drugs, explain, sample_id)
+            if cached is not None:
+                return _cached_response(request, *cached, cache_status='HIT')
+
+        if profiling:
+            variants_by_gene, results = await _profile_analysis(file_content, drugs, explain, response)
+        else:
+            # Steps 2-3: Parse VCF and build the pharmacogenomic profile once
+            # (shared across all drugs); large uploads go to the process pool
+            variants_by_gene, pharmacogenomic_profile, qc = await _parse_and_profile(file_content)
+
+            # Step 4: Assess every requested drug against the shared profile
+            results = await _analyze_drugs(
+                drugs,
                 variants_by_gene,
-                pharmacogenomic_profile
+                pharmacogenomic_profile,
+                explain=explain,
+                vcf_qc=qc
             )
-            results.append(result)
 
-        return results
+        # Persist off the request path (batched by the store's writer thread)
+        result_store.submit(sample_id, results, variants_by_gene)
+
+        if profiling:
+            return results
+
+        key = cache_key(file_digest, drugs, MODE_FULL if explain else MODE_DETERMINISTIC, sample_id)
+        body = _responses_adapter.dump_json(results)
+        entry = CachedResponse(response_cache.put(key, body), body)
+        return _cached_response(request, key, entry, cache_status='MISS')
 
     except HTTPException:
         raise
@@ -98,174 +160,214 @@ async def analyze_vcf(
         )
 
 
+async def _parse_and_profile(file_content: bytes) -> tuple:
+    """
+    Parse the VCF and build the profile. Uploads above the size threshold
+    are parsed and gene-called in a worker process so they don't stall the
+    event loop; small ones keep the in-process fast path.
+    Returns (variants_by_gene, profile, qc).
+    """
+    with tracer.span('parse_and_profile', bytes=len(file_content)) as span:
+        if process_pool_service.should_offload(len(file_content)):
+            span.set_attribute('offloaded', True)
+            try:
+                variants_by_gene, gene_calls, qc = await process_pool_service.parse_and_call(file_content)
+                _record_qc(qc)
+                return variants_by_gene, analysis_pipeline.build_profile(variants_by_gene, gene_calls), qc
+            except BrokenProcessPool:
+                logger.warning("Process pool unavailable, profiling in-process")
+
+        with tracer.span('vcf_parse') as parse_span:
+            qc = VCFQC()
+            variants_by_gene = analysis_pipeline.parse(file_content, qc)
+            parse_span.set_attribute('records', qc.records_seen)
+            parse_span.set_attribute('kept', qc.records_kept)
+        _record_qc(qc)
+        with tracer.span('gene_calling'):
+            return variants_by_gene, _build_pharmacogenomic_profile(variants_by_gene), qc
+
+
+def _record_qc(qc: VCFQC):
+    qc_stats.record(qc)
+    if qc.low_quality:
+        logger.warning(f"Low-quality VCF upload: {qc.to_dict()}")
+
+
 def _build_pharmacogenomic_profile(variants_by_gene: dict) -> List[GeneProfile]:
     """
     Build a complete pharmacogenomic profile for all supported genes.
     This is computed once and shared across all drug analyses.
     """
-    profile = []
+    return analysis_pipeline.build_profile(variants_by_gene)
 
-    for gene in vcf_parser.supported_genes:
-        variants = variants_by_gene[gene]
 
-        # Determine star alleles (ALL required variants must match)
-        star_alleles = star_engine.determine_star_alleles(gene, variants)
-
-        # Form diplotype
-        star_allele_1, star_allele_2, diplotype = diplotype_engine.form_diplotype(
-            star_alleles, variants
-        )
-
-        # Determine phenotype
-        phenotype, confidence = phenotype_engine.determine_phenotype(
-            gene, diplotype, star_allele_1, star_allele_2
-        )
-
-        # Build detected variants list
-        detected_variants = []
-        for variant in variants:
-            detected_variants.append(DetectedVariant(
-                rsid=variant['rsid'] or 'Unknown',
-                gene=variant['gene'],
-                ref=variant['ref'],
-                alt=variant['alt'],
-                genotype=variant['genotype'],
-                star_allele=star_alleles[0] if star_alleles else '*1'
-            ))
-
-        detected_variants.sort(key=lambda x: x.rsid)
-
-        gene_profile = GeneProfile(
-            gene=gene,
-            star_allele_1=star_allele_1,
-            star_allele_2=star_allele_2,
-            diplotype=diplotype,
-            phenotype=phenotype,
-            detected_variants=detected_variants
-        )
-        profile.append(gene_profile)
-
-    profile.sort(key=lambda x: x.gene)
-    return profile
+def _requested_drugs(drug: str) -> Optional[List[str]]:
+    """
+    Drug form field as the requested names, checked to resolve to
+    supported drugs; None for the whole panel ("all").
+    Raises HTTPException on unsupported drug.
+    """
+    if drug.strip().lower() == PANEL_ALL:
+        return None
+    drugs = [d.strip() for d in drug.split(',') if d.strip()]
+    try:
+        drug_analyzer.resolve_drugs(drugs)
+    except UnsupportedDrugError as e:
+        raise _unsupported_drug_error(e)
+    return drugs
 
 
-def _analyze_single_drug(
-    drug: str,
+async def _analyze_drugs(
+    drugs: Optional[List[str]],
     variants_by_gene: dict,
-    pharmacogenomic_profile: List[GeneProfile]
-) -> AnalysisResponse:
+    pharmacogenomic_profile: List[GeneProfile],
+    explain: bool = True,
+    vcf_qc: Optional[VCFQC] = None
+) -> List[AnalysisResponse]:
     """
-    Run drug-specific recommendation and LLM explanation for one drug.
+    Run drug recommendations and LLM explanations for the requested drugs
+    (every supported drug when `drugs` is None). Explanations may call
+    out to the LLM, so the batch runs off the event loop; `explain=False`
+    skips them.
     Raises HTTPException on unsupported drug.
-    Clinical decision (risk_label, phenotype) is deterministic;
-    LLM only generates explanation text.
     """
-    quality_metrics = {
-        'vcf_parsing_success': True,
-        'gene_variants_found': sum(len(v) for v in variants_by_gene.values()) > 0,
-        'star_allele_determined': False,
-        'phenotype_determined': False,
-        'recommendation_generated': False,
-        'llm_explanation_generated': False
-    }
+    try:
+        with tracer.span('analyze_drugs', drugs=len(drugs) if drugs else 'all', explain=explain):
+            # bind_context so spans in the worker thread join this trace
+            return await run_in_threadpool(
+                bind_context(drug_analyzer.analyze_panel),
+                variants_by_gene, pharmacogenomic_profile, drugs, explain, vcf_qc
+            )
+    except UnsupportedDrugError as e:
+        raise _unsupported_drug_error(e)
 
-    # Identify relevant gene for this drug
-    relevant_gene = drug_engine.get_relevant_gene(drug)
-    if not relevant_gene:
+
+@router.get("/analyze/cached/{key}", response_model=List[AnalysisResponse])
+async def get_cached_analysis(key: str, request: Request):
+    """
+    Fetch a cached analysis by the key in a previous response's
+    `Content-Location`, without re-uploading. Supports `If-None-Match`.
+    The key is a capability: it is keyed with a server-side secret, so
+    only clients that were given it can fetch the analysis.
+    404 means the entry was evicted or the knowledge base changed.
+    """
+    entry = response_cache.get(key)
+    if entry is None:
         raise HTTPException(
-            status_code=400,
+            status_code=404,
             detail={
                 "error": {
-                    "code": "UNSUPPORTED_DRUG",
-                    "message": f"Drug '{drug}' is not supported",
-                    "details": f"Supported drugs: {', '.join(drug_engine.get_supported_drugs())}"
+                    "code": "CACHE_ENTRY_NOT_FOUND",
+                    "message": "Cached analysis not found",
+                    "details": "The entry expired or the knowledge base changed; re-upload the VCF"
                 }
             }
         )
-
-    # Find relevant gene profile
-    relevant_profile = next(
-        (p for p in pharmacogenomic_profile if p.gene == relevant_gene),
-        None
-    )
-    if not relevant_profile:
-        raise HTTPException(status_code=500, detail="Failed to generate gene profile")
-
-    # Update quality flags
-    quality_metrics['star_allele_determined'] = relevant_profile.diplotype != "Unknown"
-    quality_metrics['phenotype_determined'] = relevant_profile.phenotype != "Unknown"
-
-    # Retrieve phenotype confidence
-    _, phenotype_confidence = phenotype_engine.determine_phenotype(
-        relevant_gene,
-        relevant_profile.diplotype,
-        relevant_profile.star_allele_1,
-        relevant_profile.star_allele_2
-    )
-
-    # Get deterministic drug recommendation (LLM must NOT change these values)
-    drug_rec = drug_engine.get_drug_recommendation(
-        drug, relevant_gene, relevant_profile.phenotype, phenotype_confidence
-    )
-    quality_metrics['recommendation_generated'] = True
-
-    # Web search for optional additional context (non-blocking; errors silenced)
-    web_search_results = web_search_service.search_pharmacogenomics_context(
-        gene=relevant_gene,
-        diplotype=relevant_profile.diplotype,
-        phenotype=relevant_profile.phenotype,
-        drug=drug,
-        max_results=3
-    )
-    web_context = web_search_service.format_search_results_for_llm(web_search_results)
-
-    # LLM generates explanation text ONLY — does not affect clinical decision
-    llm_explanation_data = llm_service.generate_explanation(
-        relevant_gene,
-        relevant_profile.diplotype,
-        relevant_profile.phenotype,
-        drug,
-        drug_rec['risk_label'],
-        drug_rec['recommendation'],
-        variants_by_gene[relevant_gene],
-        web_search_results=web_context
+    return _cached_response(request, key, entry, cache_status='HIT')
+
+
+def _lookup_cached(file_digest: str, drugs: Optional[List[str]], explain: bool, sample_id: str):
+    """(key, entry) for these inputs, if cached. A full result also serves a degraded request."""
+    modes = (MODE_FULL,) if explain else (MODE_FULL, MODE_DETERMINISTIC)
+    for mode in modes:
+        key = cache_key(file_digest, drugs, mode, sample_id)
+        entry = response_cache.get(key)
+        if entry is not None:
+            return key, entry
+    return None
+
+
+def _cached_response(request: Request, key: str, entry: CachedResponse, cache_status: str) -> Response:
+    headers = {
+        'ETag': entry.etag,
+        'Cache-Control': RESPONSE_CACHE_CONTROL,
+        'Content-Location': f"{request.scope.get('root_path', '')}/api/analyze/cached/{key}",
+        'X-Cache': cache_status
+    }
+    if etag_matches(request.headers.get('if-none-match'), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type='application/json', headers=headers)
+
+
+def _unsupported_drug_error(e: UnsupportedDrugError) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail={
+            "error": {
+                "code": "UNSUPPORTED_DRUG",
+                "message": str(e),
+                "details": f"Supported drugs: {', '.join(e.supported_drugs)}"
+            }
+        }
     )
-    quality_metrics['llm_explanation_generated'] = True
 
-    # Build response objects
-    risk_assessment = RiskAssessment(
-        risk_label=drug_rec['risk_label'],
-        severity=drug_rec['severity'],
-        confidence_score=min(max(drug_rec['confidence_score'], 0.0), 1.0)
-    )
 
-    clinical_rec = drug_engine.format_clinical_recommendation(
-        drug_rec['recommendation'],
-        drug_rec['risk_label'],
-        drug_rec['severity']
-    )
-    clinical_recommendation = ClinicalRecommendation(
-        summary=clinical_rec['summary'],
-        dosing_guidance=clinical_rec['dosing'],
-        monitoring_requirements=clinical_rec['monitoring']
+def _profiling_requested(request: Request) -> bool:
+    """True if an admin asked for a profile. Raises HTTPException for non-admins."""
+    if request.headers.get(PROFILE_HEADER, '').lower() not in ('1', 'true'):
+        return False
+    if not is_admin(request.headers.get(ADMIN_TOKEN_HEADER)):
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "error": {
+                    "code": "PROFILING_FORBIDDEN",
+                    "message": "Profiling requires a valid admin token",
+                    "details": f"Send the configured ADMIN_TOKEN in the {ADMIN_TOKEN_HEADER} header"
+                }
+            }
+        )
+    return True
+
+
+def _analyze_in_process(
+    file_content: bytes,
+    drugs: Optional[List[str]],
+    explain: bool
+) -> tuple:
+    """The whole analysis on the calling thread, so one profiler sees all of it."""
+    qc = VCFQC()
+    variants_by_gene = analysis_pipeline.parse(file_content, qc)
+    _record_qc(qc)
+    pharmacogenomic_profile = _build_pharmacogenomic_profile(variants_by_gene)
+    return variants_by_gene, drug_analyzer.analyze_panel(
+        variants_by_gene, pharmacogenomic_profile, drugs, explain, qc
     )
 
-    llm_explanation = LLMExplanation(
-        mechanism=llm_explanation_data['mechanism'],
-        clinical_context=llm_explanation_data['clinical_context'],
-        patient_friendly_summary=llm_explanation_data['patient_friendly_summary']
-    )
 
-    return AnalysisResponse(
-        patient_id=str(uuid.uuid4()),
-        drug=drug,
-        timestamp=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
-        risk_assessment=risk_assessment,
-        pharmacogenomic_profile=pharmacogenomic_profile,
-        clinical_recommendation=clinical_recommendation,
-        llm_generated_explanation=llm_explanation,
-        quality_metrics=QualityMetrics(**quality_metrics)
-    )
+async def _profile_analysis(
+    file_content: bytes,
+    drugs: Optional[List[str]],
+    explain: bool,
+    response: Response
+) -> tuple:
+    """
+    Run the analysis under cProfile and tracemalloc on one worker thread
+    (never the process pool) and store the profile for download.
+    Returns (variants_by_gene, results).
+    """
+    label = f"{len(file_content)} bytes, drugs={','.join(drugs) if drugs else PANEL_ALL}"
+    try:
+        analysis, profile_id = await run_in_threadpool(
+            bind_context(request_profiler.run),
+            _analyze_in_process, file_content, drugs, explain, label=label
+        )
+    except UnsupportedDrugError as e:
+        raise _unsupported_drug_error(e)
+    except ProfilerBusy as e:
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "error": {
+                    "code": "PROFILER_BUSY",
+                    "message": "Profiler busy",
+                    "details": str(e)
+                }
+            }
+        )
+    logger.info(f"Profiled analysis stored as {profile_id}")
+    response.headers[PROFILE_ID_HEADER] = profile_id
+    return analysis
 
 
 async def validate_input(file: UploadFile, drug: str) -> dict:
@@ -288,9 +390,11 @@ async def validate_input(file: UploadFile, drug: str) -> dict:
             'details': f'Maximum file size is 5MB. Your file is {len(content) / 1024 / 1024:.2f}MB'
         }
 
-    try:
-        content_str = content.decode('utf-8')
-    except UnicodeDecodeError:
+    # Only the header is decoded up front; data lines are decoded per field
+    # by the parser, and only for the columns the engines use. The encoding
+    # of the rest is still checked so no line is silently dropped.
+    header = vcf_parser.decode_header(content)
+    if header is None or not vcf_parser.is_utf8(content):
         return {
             'valid': False,
             'code': 'INVALID_ENCODING',
@@ -298,7 +402,7 @@ async def validate_input(file: UploadFile, drug: str) -> dict:
             'details': 'File must be UTF-8 encoded'
         }
 
-    if not vcf_parser.validate_vcf_header(content_str):
+    if not vcf_parser.validate_vcf_header(header):
         return {
             'valid': False,
             'code': 'INVALID_VCF_FORMAT',
@@ -316,5 +420,5 @@ async def validate_input(file: UploadFile, drug: str) -> dict:
 
     return {
         'valid': True,
-        'content': content_str
+        'content': content
     }
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from services.tracing import tracer
+
+router = APIRouter()
+
+
+@router.get("/debug/traces/slowest")
+def slowest_traces(limit: int = Query(10, ge=1, le=50)):
+    """Slowest sampled requests since startup, with their span trees."""
+    return {
+        'sample_rate': tracer.sample_rate,
+        'traces': tracer.slowest(limit)
+    }
+
+
+@router.get("/debug/traces/{trace_id}")
+def get_trace(trace_id: str):
+    """A recent or slow sampled trace by id (see the X-Trace-Id header)."""
+    trace = tracer.get(trace_id)
+    if trace is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": {
+                    "code": "TRACE_NOT_FOUND",
+                    "message": "Trace not found",
+                    "details": f"No retained trace with id {trace_id}"
+                }
+            }
+        )
+    return trace
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from typing import Optional
+
+from services.profiling import request_profiler, is_admin
+
+router = APIRouter()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Profiling and stored-result endpoints need the configured admin token."""
+    if not is_admin(x_admin_token):
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "error": {
+                    "code": "FORBIDDEN",
+                    "message": "Admin token required",
+                    "details": "Send the configured ADMIN_TOKEN in the X-Admin-Token header"
+                }
+            }
+        )
+
+
+def _not_found(profile_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=404,
+        detail={
+            "error": {
+                "code": "PROFILE_NOT_FOUND",
+                "message": "Profile not found",
+                "details": f"No stored profile with id {profile_id}"
+            }
+        }
+    )
+
+
+@router.get("/debug/profiles", dependencies=[Depends(require_admin)])
+def list_profiles():
+    """Stored request profiles, newest first."""
+    return {'profiles': request_profiler.list()}
+
+
+@router.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def get_profile(profile_id: str):
+    """
+    Summary of one profiled request: CPU time and allocations grouped per
+    module (services.vcf_parser, services.star_engine, ...) plus the top
+    functions and allocation sites.
+    """
+    summary = request_profiler.get_summary(profile_id)
+    if summary is None:
+        raise _not_found(profile_id)
+    return summary
+
+
+@router.get("/debug/profiles/{profile_id}/cpu.prof", dependencies=[Depends(require_admin)])
+def download_profile(profile_id: str):
+    """Raw cProfile output, for pstats or snakeviz."""
+    path = request_profiler.stats_path(profile_id)
+    if path is None:
+        raise _not_found(profile_id)
+    return FileResponse(path, media_type='application/octet-stream',
+                        filename=f"pharmaguard-{profile_id}.prof")
@@ -0,0 +1,152 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi.responses import FileResponse
+from typing import Optional
+import shutil
+import tempfile
+
+from services.result_store import result_store
+from services.reanalysis import reanalyzer
+from services.drug_engine import DrugEngine
+from services.columnar_export import (
+    export_result_store,
+    EXPORT_TABLES,
+    EXPORT_FORMATS
+)
+from schemas.response_schema import ResultPage, StoredResult, CohortStats, StatsAudit
+from routes.profiling import require_admin
+
+# Stored results hold every patient's genotypes and risks: admin only
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+MAX_PAGE_SIZE = 500
+
+drug_engine = DrugEngine()
+
+
+@router.get("/results", response_model=ResultPage)
+def list_results(
+    sample_id: Optional[str] = None,
+    gene: Optional[str] = None,
+    diplotype: Optional[str] = None,
+    phenotype: Optional[str] = None,
+    drug: Optional[str] = None,
+    risk_label: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(None, ge=1)
+):
+    """
+    Page through stored analysis results without recomputing them.
+
+    Pass the returned `next_cursor` as `cursor` to fetch the next page.
+    """
+    results, next_cursor = result_store.query(
+        sample_id=sample_id,
+        gene=gene,
+        diplotype=diplotype,
+        phenotype=phenotype,
+        # Brand or misspelled names find results stored under the generic name
+        drug=(drug_engine.resolve_drug(drug) or drug) if drug else None,
+        risk_label=risk_label,
+        limit=limit,
+        cursor=cursor
+    )
+    return {'results': results, 'next_cursor': next_cursor}
+
+
+@router.get("/stats", response_model=CohortStats)
+def cohort_stats():
+    """
+    Diplotype and phenotype frequencies per gene and risk label counts per
+    drug across all stored samples (each sample counted once, by its
+    latest result). Served from counters maintained as results are
+    stored, so the cost does not grow with the number of results.
+    """
+    return result_store.stats()
+
+
+@router.get("/stats/audit", response_model=StatsAudit)
+def audit_stats(repair: bool = False):
+    """
+    Recompute the statistics exactly from every stored result and compare
+    them with the counters; `repair=true` resets the counters to the
+    exact values when they differ.
+    """
+    counters = result_store.stats()
+    exact = result_store.stats(exact=True)
+    consistent = counters == exact
+    if repair and not consistent:
+        result_store.rebuild_stats()
+    return {'consistent': consistent, 'repaired': repair and not consistent, 'counters': counters, 'exact': exact}
+
+
+@router.get("/results/export")
+def export_results(
+    background_tasks: BackgroundTasks,
+    table: str = Query('gene_profiles', enum=list(EXPORT_TABLES)),
+    format: str = Query('parquet', enum=list(EXPORT_FORMATS))
+):
+    """
+    Export every stored result as a columnar file (Parquet or Arrow IPC)
+    for analytics: per-sample gene profiles or per-drug risk assessments.
+    """
+    out_dir = tempfile.mkdtemp(prefix='pharmaguard-export-')
+    try:
+        drug_genes = {
+            d: drug_engine.get_relevant_gene(d) for d in drug_engine.get_supported_drugs()
+        }
+        paths = export_result_store(
+            result_store, out_dir, fmt=format, tables=[table], drug_genes=drug_genes
+        )
+    except RuntimeError as e:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        raise HTTPException(
+            status_code=501,
+            detail={
+                "error": {
+                    "code": "EXPORT_UNAVAILABLE",
+                    "message": "Columnar export unavailable",
+                    "details": str(e)
+                }
+            }
+        )
+
+    background_tasks.add_task(shutil.rmtree, out_dir, ignore_errors=True)
+    return FileResponse(
+        paths[table],
+        media_type='application/octet-stream',
+        filename=f"{table}{EXPORT_FORMATS[format]}"
+    )
+
+
+@router.post("/results/reanalyze", status_code=202)
+def start_reanalysis():
+    """
+    Recompute, in the background, the stored results affected by
+    knowledge base changes since they were computed. Also runs at
+    startup unless REANALYZE_ON_STARTUP=false.
+    """
+    return {'started': reanalyzer.start(), **reanalyzer.status()}
+
+
+@router.get("/results/reanalyze")
+def reanalysis_status():
+    """Whether a reanalysis is running, and the statistics of the last one."""
+    return reanalyzer.status()
+
+
+@router.get("/results/{result_id}", response_model=StoredResult)
+def get_result(result_id: int):
+    """Fetch a single stored analysis result."""
+    result = result_store.get(result_id)
+    if result is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": {
+                    "code": "RESULT_NOT_FOUND",
+                    "message": "Result not found",
+                    "details": f"No stored result with id {result_id}"
+                }
+            }
+        )
+    return result
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Literal
+from typing import Dict, List, Literal, Optional
 from datetime import datetime
 
 
@@ -39,6 +39,20 @@ class LLMExplanation(BaseModel):
     patient_friendly_summary: str
 
 
+class VCFQualityStats(BaseModel):
+    records_seen: int
+    records_kept: int
+    malformed_records: int
+    variants_per_gene: Dict[str, int]
+    missing_genotypes: int
+    malformed_genotypes: int
+    genotype_missing_rate: float
+    filtered_records: int
+    multiallelic_sites: int
+    uncovered_definition_sites: Dict[str, int]
+    low_quality: bool
+
+
 class QualityMetrics(BaseModel):
     vcf_parsing_success: bool
     gene_variants_found: bool
@@ -46,11 +60,16 @@ class QualityMetrics(BaseModel):
     phenotype_determined: bool
     recommendation_generated: bool
     llm_explanation_generated: bool
+    # Absent on results stored before VCF QC was recorded
+    vcf_qc: Optional[VCFQualityStats] = None
 
 
 class AnalysisResponse(BaseModel):
     patient_id: str
+    # As requested (brand, salt or misspelling included)
     drug: str
+    # The supported drug it resolved to; None only in results stored before the field existed
+    canonical_drug: Optional[str] = None
     timestamp: str
     risk_assessment: RiskAssessment
     pharmacogenomic_profile: List[GeneProfile]
@@ -59,6 +78,43 @@ class AnalysisResponse(BaseModel):
     quality_metrics: QualityMetrics
 
 
+class StoredResult(BaseModel):
+    result_id: int
+    sample_id: str
+    stored_at: str
+    analysis: AnalysisResponse
+
+
+class ResultPage(BaseModel):
+    results: List[StoredResult]
+    next_cursor: Optional[int] = None
+
+
+class GeneStats(BaseModel):
+    samples: int
+    diplotypes: Dict[str, int]
+    phenotypes: Dict[str, int]
+
+
+class DrugStats(BaseModel):
+    samples: int
+    risk_labels: Dict[str, int]
+
+
+class CohortStats(BaseModel):
+    samples: int
+    results: int
+    genes: Dict[str, GeneStats]
+    drugs: Dict[str, DrugStats]
+
+
+class StatsAudit(BaseModel):
+    consistent: bool
+    repaired: bool
+    counters: CohortStats
+    exact: CohortStats
+
+
 class ErrorResponse(BaseModel):
     error: dict = Field(
         ...,
@@ -0,0 +1,135 @@
+"""
+Production launcher for the PharmaGuard API.
+
+    python serve.py --workers 4 --port 8000
+
+Loads the app, knowledge base and explanation bundle once in a master
+process, moves them out of the garbage collector's reach with
+gc.freeze(), then forks the workers. The workers share those pages
+copy-on-write instead of each parsing its own copy, which matters once
+the star allele definitions grow to the full PharmVar catalogue.
+
+The master binds the listening socket and the workers accept on it; the
+master only supervises, restarting workers that die and forwarding
+SIGTERM/SIGINT. POSIX only (needs os.fork).
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger('pharmaguard.serve')
+
+
+def _bind(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, args: argparse.Namespace):
+    """Child process: its own event loop on the shared socket."""
+    import uvicorn
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    gc.enable()
+    config = uvicorn.Config(
+        app,
+        log_level=args.log_level,
+        access_log=args.access_log,
+        timeout_keep_alive=args.keep_alive
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(app, sock: socket.socket, args: argparse.Namespace) -> int:
+    pid = os.fork()
+    if pid == 0:
+        # Own process group: a terminal Ctrl-C reaches only the master,
+        # which forwards a single SIGTERM
+        os.setpgid(0, 0)
+        code = 0
+        try:
+            _run_worker(app, sock, args)
+        except Exception:
+            logger.exception("Worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1)))
+    parser.add_argument('--backlog', type=int, default=2048)
+    parser.add_argument('--keep-alive', type=int, default=5)
+    parser.add_argument('--log-level', default='info')
+    parser.add_argument('--no-access-log', dest='access_log', action='store_false')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    if not hasattr(os, 'fork'):
+        logger.error("serve.py needs os.fork; use `uvicorn main:app` on this platform")
+        return 2
+
+    # Before importing the app, so module-level settings see .env
+    load_dotenv()
+
+    # No collections while loading: they would only interleave short-lived
+    # garbage with the long-lived objects we want packed together
+    gc.disable()
+    from services.knowledge_base import preload_knowledge_base
+    preload_knowledge_base()
+    from main import app
+    gc.freeze()
+
+    sock = _bind(args.host, args.port, args.backlog)
+    logger.info(f"Listening on {args.host}:{args.port} with {args.workers} workers")
+
+    workers = {_spawn(app, sock, args) for _ in range(max(1, args.workers))}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited ({status}), restarting")
+            # Avoid a tight loop if workers die at startup
+            time.sleep(1)
+            workers.add(_spawn(app, sock, args))
+
+    sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
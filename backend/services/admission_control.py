@@ -0,0 +1,406 @@
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Optional
+
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+# Total weight of analyses running at once in this process
+ADMISSION_CAPACITY = int(os.getenv('ADMISSION_CAPACITY', 64))
+# Weight one client may hold before further requests get 429
+ADMISSION_CLIENT_CAPACITY = int(os.getenv('ADMISSION_CLIENT_CAPACITY', ADMISSION_CAPACITY // 2))
+# Requests allowed to wait for capacity, and for how long
+ADMISSION_QUEUE_LIMIT = int(os.getenv('ADMISSION_QUEUE_LIMIT', 32))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10.0))
+# Admit without LLM/search when the full request does not fit
+ADMISSION_DEGRADE = os.getenv('ADMISSION_DEGRADE', 'true').lower() == 'true'
+# Upload bytes per unit of weight (parsing and profiling cost)
+ADMISSION_BYTES_PER_UNIT = int(os.getenv('ADMISSION_BYTES_PER_UNIT', 1024 * 1024))
+# Reverse proxies whose X-Forwarded-For is believed, comma-separated IPs.
+# Without it every user behind a proxy shares its address, and so one
+# per-client allowance
+ADMISSION_TRUSTED_PROXIES = frozenset(
+    ip.strip() for ip in os.getenv('ADMISSION_TRUSTED_PROXIES', '').split(',') if ip.strip()
+)
+# Multipart framing and form fields allowed on top of the file size limit
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Header set on responses that were served deterministic-only
+DEGRADED_HEADER = b'x-pharmaguard-degraded'
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted."""
+
+    def __init__(self, status_code: int, code: str, message: str, retry_after: int,
+                 details: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+        self.details = details or f"Retry after {retry_after} seconds"
+
+
+class Ticket:
+    """Capacity held by one admitted request."""
+
+    __slots__ = ('weight', 'client', 'degraded', 'admitted_at')
+
+    def __init__(self, weight: int, client: str, degraded: bool):
+        self.weight = weight
+        self.client = client
+        self.degraded = degraded
+        self.admitted_at = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Weighted admission control for one event loop.
+
+    A request costs `light` (parsing and profiling, from upload size) and
+    `full` (light plus one unit per drug for the LLM and search calls).
+    It runs in full when `full` fits, deterministic-only when only
+    `light` fits, and otherwise waits in a FIFO queue. Requests are
+    rejected with 429 when their client already holds too much, and with
+    503 when the queue is full or the wait times out.
+
+    State is per process; with several server workers each has its own.
+    """
+
+    def __init__(
+        self,
+        capacity: int = ADMISSION_CAPACITY,
+        client_capacity: int = ADMISSION_CLIENT_CAPACITY,
+        queue_limit: int = ADMISSION_QUEUE_LIMIT,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        degrade: bool = ADMISSION_DEGRADE
+    ):
+        self.capacity = max(1, capacity)
+        self.client_capacity = client_capacity
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self.degrade = degrade
+
+        self.in_flight = 0
+        self.active = 0
+        self._by_client: Dict[str, int] = {}
+        self._waiters: Deque = deque()
+        # Moving average of request duration, for Retry-After estimates
+        self._avg_seconds = 1.0
+        self.counters = {
+            'admitted': 0, 'degraded': 0, 'queued': 0,
+            'rejected_client': 0, 'rejected_overload': 0
+        }
+
+    def _fits(self, weight: int) -> bool:
+        return self.in_flight + weight <= self.capacity
+
+    def _grant(self, full: int, light: int, client: str) -> Optional[Ticket]:
+        if self._fits(full):
+            ticket = Ticket(full, client, degraded=False)
+        elif self.degrade and self._fits(light):
+            ticket = Ticket(light, client, degraded=True)
+            self.counters['degraded'] += 1
+        else:
+            return None
+        self.in_flight += ticket.weight
+        self.active += 1
+        self._by_client[client] = self._by_client.get(client, 0) + ticket.weight
+        self.counters['admitted'] += 1
+        return ticket
+
+    def retry_after(self) -> int:
+        """Seconds until a retry is likely to be admitted."""
+        backlog = (len(self._waiters) + 1) / max(self.active, 1)
+        return min(120, max(1, math.ceil(self._avg_seconds * backlog)))
+
+    def can_queue(self) -> bool:
+        """Cheap pre-check, before the request body has been read."""
+        return self._fits(1) or len(self._waiters) < self.queue_limit
+
+    async def acquire(self, full: int, light: int, client: str) -> Ticket:
+        full = min(full, self.capacity)
+        light = min(light, full)
+
+        if self.client_capacity and self._by_client.get(client, 0) + light > self.client_capacity:
+            self.counters['rejected_client'] += 1
+            raise AdmissionRejected(
+                429, 'TOO_MANY_REQUESTS', 'Too many concurrent analyses from this client',
+                self.retry_after()
+            )
+
+        # Waiting requests go first, so new arrivals never overtake them
+        if not self._waiters:
+            ticket = self._grant(full, light, client)
+            if ticket is not None:
+                return ticket
+
+        if len(self._waiters) >= self.queue_limit:
+            self.counters['rejected_overload'] += 1
+            raise AdmissionRejected(
+                503, 'SERVER_OVERLOADED', 'Server is at capacity', self.retry_after()
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, full, light, client)
+        self._waiters.append(entry)
+        self.counters['queued'] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the wait expired
+                return waiter.result()
+            waiter.cancel()
+            self.counters['rejected_overload'] += 1
+            raise AdmissionRejected(
+                503, 'SERVER_OVERLOADED', 'Timed out waiting for capacity', self.retry_after()
+            )
+        except asyncio.CancelledError:
+            # Client went away: give back capacity granted in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self.release(waiter.result())
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            try:
+                self._waiters.remove(entry)
+            except ValueError:
+                pass
+            # A waiter leaving the head may unblock smaller ones behind it
+            self._wake()
+
+    def release(self, ticket: Ticket):
+        self.in_flight -= ticket.weight
+        self.active -= 1
+        remaining = self._by_client.get(ticket.client, 0) - ticket.weight
+        if remaining > 0:
+            self._by_client[ticket.client] = remaining
+        else:
+            self._by_client.pop(ticket.client, None)
+
+        elapsed = time.monotonic() - ticket.admitted_at
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            waiter, full, light, client = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            ticket = self._grant(full, light, client)
+            if ticket is None:
+                return
+            self._waiters.popleft()
+            waiter.set_result(ticket)
+
+    def stats(self) -> Dict:
+        return {
+            'capacity': self.capacity,
+            'in_flight_weight': self.in_flight,
+            'active_requests': self.active,
+            'queued_requests': len(self._waiters),
+            **self.counters
+        }
+
+
+def _form_field(body: bytes, content_type: str, name: str) -> Optional[str]:
+    """Pull one small text field out of a multipart body without parsing the file parts."""
+    marker = content_type.find('boundary=')
+    if marker < 0:
+        return None
+    boundary = b'--' + content_type[marker + 9:].split(';')[0].strip().strip('"').encode()
+    start = body.find(f'name="{name}"'.encode())
+    if start < 0:
+        return None
+    start = body.find(b'\r\n\r\n', start)
+    end = body.find(b'\r\n' + boundary, start)
+    if start < 0 or end < 0:
+        return None
+    return body[start + 4:end].decode('utf-8', errors='replace')
+
+
+def client_address(scope, trusted_proxies: Iterable[str] = ()) -> str:
+    """
+    Address the per-client allowance is charged to. A request from a
+    trusted proxy is attributed to the nearest untrusted address in
+    X-Forwarded-For (earlier entries can be forged by the client).
+    """
+    peer = scope['client'][0] if scope.get('client') else 'unknown'
+    if peer not in trusted_proxies:
+        return peer
+    forwarded = b','.join(value for name, value in scope['headers'] if name == b'x-forwarded-for')
+    hops = [hop.strip() for hop in forwarded.decode('latin-1').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return hop
+    return hops[0] if hops else peer
+
+
+def request_weights(body: bytes, content_type: str, panel_size: int) -> tuple:
+    """(full, light) weight of an analysis upload."""
+    light = 1 + len(body) // ADMISSION_BYTES_PER_UNIT
+    drug = _form_field(body, content_type, 'drug') or ''
+    if drug.strip().lower() == 'all':
+        drugs = panel_size
+    else:
+        drugs = max(1, sum(1 for d in drug.split(',') if d.strip()))
+    return light + drugs, light
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware applying an AdmissionController to analysis uploads.
+    The body is read before admission (to count drugs) and replayed to
+    the app; bodies over `max_body_bytes` are refused before they are
+    buffered, with the route's 400 FILE_TOO_LARGE error. Requests are
+    charged to client_address(), which sees through `trusted_proxies`.
+    Degraded requests get `scope["state"]["deterministic_only"]` and an
+    X-PharmaGuard-Degraded response header.
+    """
+
+    def __init__(
+        self,
+        app,
+        controller: AdmissionController,
+        paths: Iterable[str] = ('/api/analyze',),
+        panel_size: int = 1,
+        max_body_bytes: Optional[int] = None,
+        trusted_proxies: Iterable[str] = ADMISSION_TRUSTED_PROXIES
+    ):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+        self.panel_size = panel_size
+        self.max_body_bytes = max_body_bytes
+        self.trusted_proxies = frozenset(trusted_proxies)
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or scope['method'] != 'POST'
+                or scope['path'] not in self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controller
+        if not controller.can_queue():
+            # Shed before reading the upload at all
+            controller.counters['rejected_overload'] += 1
+            await self._reject(send, AdmissionRejected(
+                503, 'SERVER_OVERLOADED', 'Server is at capacity', controller.retry_after()
+            ))
+            return
+
+        headers = dict(scope['headers'])
+        try:
+            declared = int(headers.get(b'content-length', b'0'))
+        except ValueError:
+            declared = 0
+        if self._too_large(declared):
+            await self._reject(send, self._too_large_error())
+            return
+
+        body, size, more_body = [], 0, True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if self._too_large(size):
+                # Content-Length was missing or understated
+                await self._reject(send, self._too_large_error())
+                return
+            body.append(chunk)
+            more_body = message.get('more_body', False)
+        body = b''.join(body)
+
+        content_type = headers.get(b'content-type', b'').decode('latin-1')
+        full, light = request_weights(body, content_type, self.panel_size)
+        client = client_address(scope, self.trusted_proxies)
+
+        try:
+            with tracer.span('admission', weight=full) as span:
+                ticket = await controller.acquire(full, light, client)
+                span.set_attribute('degraded', ticket.degraded)
+        except AdmissionRejected as e:
+            logger.warning(f"Rejected analysis from {client}: {e.message}")
+            await self._reject(send, e)
+            return
+
+        scope.setdefault('state', {})['deterministic_only'] = ticket.degraded
+        try:
+            await self.app(
+                scope, _replay(body, receive), _mark_degraded(send) if ticket.degraded else send
+            )
+        finally:
+            controller.release(ticket)
+
+    def _too_large(self, size: int) -> bool:
+        return self.max_body_bytes is not None and size > self.max_body_bytes
+
+    def _too_large_error(self) -> AdmissionRejected:
+        return AdmissionRejected(
+            400, 'FILE_TOO_LARGE', 'File size exceeds limit', 0,
+            details=f"Maximum request size is {self.max_body_bytes / 1024 / 1024:.2f}MB"
+        )
+
+    async def _reject(self, send, error: AdmissionRejected):
+        payload = json.dumps({
+            'detail': {
+                'error': {
+                    'code': error.code,
+                    'message': error.message,
+                    'details': error.details
+                }
+            }
+        }).encode()
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode()),
+        ]
+        if error.retry_after:
+            headers.append((b'retry-after', str(error.retry_after).encode()))
+        await send({
+            'type': 'http.response.start',
+            'status': error.status_code,
+            'headers': headers
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+
+def _replay(body: bytes, receive) -> Callable:
+    """Hand the buffered body to the app, then pass through (disconnects)."""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+
+    return replay
+
+
+def _mark_degraded(send) -> Callable:
+    async def wrapped(message):
+        if message['type'] == 'http.response.start':
+            message = {**message, 'headers': [
+                *message.get('headers', []), (DEGRADED_HEADER, b'deterministic-only')
+            ]}
+        await send(message)
+    return wrapped
+
+
+# Singleton instance
+admission_controller = AdmissionController()
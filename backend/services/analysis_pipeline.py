@@ -0,0 +1,202 @@
+import os
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from services.vcf_parser import VCFParser, VCFQC, Variant
+from services.star_engine import StarAlleleEngine
+from services.diplotype_engine import DiplotypeEngine
+from services.phenotype_engine import PhenotypeEngine
+from schemas.response_schema import GeneProfile, DetectedVariant
+
+# (gene, star_allele_1, star_allele_2, diplotype, phenotype, confidence, variant_star_allele)
+GeneCall = Tuple[str, str, str, str, str, float, str]
+
+# (gene, records that can define an allele, genotypes of the other records)
+GenotypeSignature = Tuple[str, Tuple[Tuple, ...], FrozenSet[str]]
+
+# Distinct genotype signatures whose gene calls each pipeline keeps
+GENE_CALL_CACHE_SIZE = int(os.getenv('GENE_CALL_CACHE_SIZE', 100000))
+
+
+class AnalysisPipeline:
+    """
+    VCF parsing plus the deterministic engines (star allele, diplotype,
+    phenotype). Holds no request state, so one instance can serve the
+    event loop and another can live in each process-pool worker.
+
+    Gene calls are memoized by genotype signature: in a screened
+    population most samples share a few genotype combinations per gene,
+    so calling work grows with the distinct combinations, not the samples.
+    """
+
+    def __init__(self):
+        self.vcf_parser = VCFParser()
+        self.star_engine = StarAlleleEngine(use_api=False)
+        self.diplotype_engine = DiplotypeEngine()
+        self.phenotype_engine = PhenotypeEngine(use_api=False)
+        # rsIDs some allele definition of the gene reads
+        self.definition_sites = {
+            gene: frozenset(site['rsid'] for definition in definitions.values() for site in definition)
+            for gene, definitions in self.star_engine.star_definitions.items()
+        }
+        self._calls: Dict[GenotypeSignature, GeneCall] = {}
+        self._calls_lock = threading.Lock()
+        self.calls_computed = 0
+        self.calls_reused = 0
+
+    @property
+    def supported_genes(self) -> List[str]:
+        return self.vcf_parser.supported_genes
+
+    def parse(self, file_content: bytes, qc: Optional[VCFQC] = None) -> Dict[str, List[Variant]]:
+        """
+        Parse raw VCF bytes into variants grouped by gene, filling in `qc`
+        (definition coverage included) if given.
+        """
+        variants_by_gene = self.vcf_parser.parse_vcf(file_content, qc)
+        if qc is not None:
+            qc.uncovered_definition_sites = self.uncovered_definition_sites(
+                {gene: (v.rsid for v in variants) for gene, variants in variants_by_gene.items()}
+            )
+        return variants_by_gene
+
+    def uncovered_definition_sites(self, rsids_by_gene: Dict[str, Iterable[Optional[str]]]) -> Dict[str, int]:
+        """Per supported gene, how many allele-definition sites have no record in the VCF."""
+        return {
+            gene: len(self.definition_sites.get(gene, frozenset()).difference(rsids_by_gene.get(gene, ())))
+            for gene in self.supported_genes
+        }
+
+    def call_genes(
+        self,
+        variants_by_gene: Dict[str, List[Variant]],
+        signatures: Optional[List[GenotypeSignature]] = None
+    ) -> List[GeneCall]:
+        """
+        Run star allele, diplotype and phenotype calling for every supported
+        gene, once per distinct genotype signature. Returns plain tuples so
+        the result is cheap to ship between processes.
+        """
+        if signatures is None:
+            signatures = self.signatures(variants_by_gene)
+        return [
+            self.call_signature(signature, variants_by_gene[signature[0]])
+            for signature in signatures
+        ]
+
+    def signatures(self, variants_by_gene: Dict[str, List[Variant]]) -> List[GenotypeSignature]:
+        """Genotype signature of every supported gene, in call_genes order."""
+        return [self.genotype_signature(gene, variants_by_gene[gene]) for gene in self.supported_genes]
+
+    def genotype_signature(self, gene: str, variants: List[Variant]) -> GenotypeSignature:
+        """
+        Everything the calling engines read from a gene's variants, as a
+        hashable value: (rsid, alt, genotype, phased, STAR tag) of records
+        at the gene's definition sites or carrying a STAR tag, plus the
+        distinct genotypes of the other records (only the fallback
+        diplotype heuristics look at those). Equal signatures get equal
+        calls under the same knowledge base.
+        """
+        sites = self.definition_sites.get(gene, frozenset())
+        defining = []
+        others = set()
+        for variant in variants:
+            if variant.star or variant.rsid in sites:
+                defining.append((variant.rsid or '', variant.alt, variant.genotype,
+                                 variant.phased, variant.star or ''))
+            else:
+                others.add(variant.genotype)
+        defining.sort()
+        return gene, tuple(defining), frozenset(others)
+
+    def call_signature(self, signature: GenotypeSignature, variants: List[Variant]) -> GeneCall:
+        """call_gene for the gene of `signature`, reusing the call of an earlier equal signature."""
+        call = self._calls.get(signature)
+        if call is not None:
+            self.calls_reused += 1
+            return call
+        call = self.call_gene(signature[0], variants)
+        with self._calls_lock:
+            self.calls_computed += 1
+            if GENE_CALL_CACHE_SIZE > 0:
+                if len(self._calls) >= GENE_CALL_CACHE_SIZE:
+                    # Oldest first; screening cohorts rarely come close
+                    del self._calls[next(iter(self._calls))]
+                self._calls[signature] = call
+        return call
+
+    def call_stats(self) -> Dict:
+        calls = self.calls_computed + self.calls_reused
+        return {
+            'signatures': len(self._calls),
+            'computed': self.calls_computed,
+            'reused': self.calls_reused,
+            'reuse_rate': round(self.calls_reused / calls, 3) if calls else 0.0
+        }
+
+    def call_gene(self, gene: str, variants: List[Variant]) -> GeneCall:
+        """Star allele, diplotype and phenotype calling for one gene."""
+        # Determine star alleles (ALL required variants must match)
+        star_alleles = self.star_engine.determine_star_alleles(gene, variants)
+
+        # Form diplotype from the haplotype pairs that explain the genotypes
+        candidates = self.star_engine.get_candidate_alleles(gene, variants)
+        star_allele_1, star_allele_2, diplotype = self.diplotype_engine.form_diplotype(
+            star_alleles, variants, candidates
+        )
+
+        # Determine phenotype
+        phenotype, confidence = self.phenotype_engine.determine_phenotype(
+            gene, diplotype, star_allele_1, star_allele_2
+        )
+
+        return (
+            gene,
+            star_allele_1,
+            star_allele_2,
+            diplotype,
+            phenotype,
+            confidence,
+            star_alleles[0] if star_alleles else '*1'
+        )
+
+    def build_profile(
+        self,
+        variants_by_gene: Dict[str, List[Variant]],
+        gene_calls: Optional[List[GeneCall]] = None
+    ) -> List[GeneProfile]:
+        """
+        Build the response-model profile for all supported genes, calling
+        genes first unless precomputed calls are passed in.
+        """
+        if gene_calls is None:
+            gene_calls = self.call_genes(variants_by_gene)
+
+        profile = [self.gene_profile(call, variants_by_gene[call[0]]) for call in gene_calls]
+        profile.sort(key=lambda x: x.gene)
+        return profile
+
+    def gene_profile(self, gene_call: GeneCall, variants: List[Variant]) -> GeneProfile:
+        """Response-model profile of one called gene."""
+        gene, star_allele_1, star_allele_2, diplotype, phenotype, _, variant_star = gene_call
+        detected_variants = [
+            DetectedVariant(
+                rsid=variant.rsid or 'Unknown',
+                gene=variant.gene,
+                ref=variant.ref,
+                alt=variant.alt,
+                genotype=variant.genotype,
+                star_allele=variant_star
+            )
+            for variant in variants
+        ]
+        detected_variants.sort(key=lambda x: x.rsid)
+
+        return GeneProfile(
+            gene=gene,
+            star_allele_1=star_allele_1,
+            star_allele_2=star_allele_2,
+            diplotype=diplotype,
+            phenotype=phenotype,
+            detected_variants=detected_variants
+        )
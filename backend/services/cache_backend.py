@@ -0,0 +1,415 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 'memory' keeps each cache in-process; 'sqlite' shares it between all
+# worker processes on the node through one WAL-mode database file
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_PATH = os.getenv(
+    'CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache.db')
+)
+# Reads refresh an entry's LRU position at most this often (SQLite backend)
+CACHE_TOUCH_INTERVAL = float(os.getenv('CACHE_TOUCH_INTERVAL', 30.0))
+
+
+class CacheBackend(ABC):
+    """
+    Byte-valued cache for one namespace, bounded by total value size,
+    with optional per-entry TTL. Evicts least recently used entries.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int, ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def size(self) -> Tuple[int, int]:
+        """(entries, bytes) currently stored."""
+
+    def get_json(self, key: str) -> Any:
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def set_json(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.set(key, json.dumps(value).encode(), ttl)
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def stats(self) -> Dict:
+        """Sizes are shared (for SQLite); hit counters are this process only."""
+        entries, size = self.size()
+        return {
+            'backend': type(self).__name__,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU."""
+
+    def __init__(self, namespace: str, max_bytes: int, ttl: Optional[float] = None):
+        super().__init__(namespace, max_bytes, ttl)
+        # key -> (value, expires_at)
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, self._expires_at(ttl))
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def size(self) -> Tuple[int, int]:
+        with self._lock:
+            return len(self._entries), self._size
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace    TEXT NOT NULL,
+    key          TEXT NOT NULL,
+    value        BLOB NOT NULL,
+    size         INTEGER NOT NULL,
+    expires_at   REAL,
+    accessed_at  REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache_entries(namespace, accessed_at);
+CREATE TABLE IF NOT EXISTS cache_usage (
+    namespace    TEXT PRIMARY KEY,
+    bytes        INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name         TEXT PRIMARY KEY,
+    next_at      REAL NOT NULL
+);
+"""
+
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def _thread_connection(local: threading.local, path: str) -> sqlite3.Connection:
+    """This thread's autocommit connection to the cache file, reopened after fork."""
+    pid = os.getpid()
+    conn = getattr(local, 'conn', None)
+    if conn is None or local.pid != pid:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with _schema_lock:
+            if (path, pid) not in _schema_ready:
+                conn.executescript(SQLITE_SCHEMA)
+                _schema_ready.add((path, pid))
+        local.conn = conn
+        local.pid = pid
+    return conn
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache shared by every process on the node: one WAL-mode SQLite file,
+    so readers never block the writer. Per-namespace byte usage is kept
+    in a side table, updated in the same transaction as each write.
+    Connections are per thread and reopened after fork.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int, ttl: Optional[float] = None,
+                 path: str = CACHE_PATH):
+        super().__init__(namespace, max_bytes, ttl)
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        return _thread_connection(self._local, self.path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed_at FROM cache_entries "
+                "WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            now = time.time()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self.delete(key)
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[2] > CACHE_TOUCH_INTERVAL:
+                conn.execute(
+                    "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key)
+                )
+            self.hits += 1
+            return row[0]
+        except sqlite3.Error as e:
+            # A cache failure must never fail the request
+            logger.error(f"Cache read failed ({self.namespace}): {e}")
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if len(value) > self.max_bytes:
+            return
+        try:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                old = conn.execute(
+                    "SELECT size FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries "
+                    "(namespace, key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.namespace, key, value, len(value), self._expires_at(ttl), time.time())
+                )
+                usage = self._add_usage(conn, len(value) - (old[0] if old else 0))
+                if usage > self.max_bytes:
+                    self._evict(conn, usage)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.error(f"Cache write failed ({self.namespace}): {e}")
+
+    def _add_usage(self, conn: sqlite3.Connection, delta: int) -> int:
+        conn.execute(
+            "INSERT INTO cache_usage (namespace, bytes) VALUES (?, ?) "
+            "ON CONFLICT(namespace) DO UPDATE SET bytes = bytes + excluded.bytes",
+            (self.namespace, delta)
+        )
+        return conn.execute(
+            "SELECT bytes FROM cache_usage WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, usage: int):
+        """Drop expired entries, then least recently used ones, until under the limit."""
+        freed = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries "
+            "WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+            (self.namespace, time.time())
+        ).fetchone()[0]
+        if freed:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? "
+                "AND expires_at IS NOT NULL AND expires_at <= ?",
+                (self.namespace, time.time())
+            )
+            usage = self._add_usage(conn, -freed)
+        if usage <= self.max_bytes:
+            return
+
+        freed = 0
+        victims = conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at",
+            (self.namespace,)
+        )
+        doomed = []
+        for key, size in victims:
+            if usage - freed <= self.max_bytes:
+                break
+            doomed.append((self.namespace, key))
+            freed += size
+        victims.close()
+        conn.executemany(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", doomed
+        )
+        self.evictions += len(doomed)
+        self._add_usage(conn, -freed)
+
+    def delete(self, key: str):
+        try:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                old = conn.execute(
+                    "SELECT size FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+                if old:
+                    conn.execute(
+                        "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                        (self.namespace, key)
+                    )
+                    self._add_usage(conn, -old[0])
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.error(f"Cache delete failed ({self.namespace}): {e}")
+
+    def clear(self):
+        try:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+                conn.execute("DELETE FROM cache_usage WHERE namespace = ?", (self.namespace,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.error(f"Cache clear failed ({self.namespace}): {e}")
+
+    def size(self) -> Tuple[int, int]:
+        try:
+            row = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+                (self.namespace,)
+            ).fetchone()
+            return row[0], row[1]
+        except sqlite3.Error:
+            return 0, 0
+
+
+class SharedRateLimiter:
+    """
+    At most one call per `interval` seconds across every process using the
+    cache file. Each call reserves the next free slot in a SQLite row (one
+    short write transaction) and sleeps until it. If the file is unusable
+    the limit is kept per process instead.
+    """
+
+    def __init__(self, name: str, interval: float, path: str = CACHE_PATH):
+        self.name = name
+        self.interval = interval
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self):
+        now = time.time()
+        try:
+            slot = self._reserve(now)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared rate limit '{self.name}' unavailable, limiting per process: {e}")
+            with self._lock:
+                slot = max(now, self._next_at)
+                self._next_at = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _reserve(self, now: float) -> float:
+        conn = _thread_connection(self._local, self.path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT next_at FROM rate_limits WHERE name = ?", (self.name,)).fetchone()
+            slot = max(now, row[0] if row else 0.0)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (name, next_at) VALUES (?, ?)",
+                (self.name, slot + self.interval)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return slot
+
+
+_caches: Dict[str, CacheBackend] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(namespace: str, max_bytes: int, ttl: Optional[float] = None,
+              persistent: bool = False) -> CacheBackend:
+    """
+    The cache for `namespace` on the configured backend (CACHE_BACKEND),
+    or always on the SQLite file if `persistent` (kept across restarts).
+    Services call this once at construction; the same namespace always
+    returns the same instance within a process.
+    """
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            if CACHE_BACKEND == 'sqlite' or persistent:
+                cache = SQLiteCache(namespace, max_bytes, ttl)
+            else:
+                if CACHE_BACKEND != 'memory':
+                    logger.warning(f"Unknown CACHE_BACKEND '{CACHE_BACKEND}', using memory")
+                cache = MemoryCache(namespace, max_bytes, ttl)
+            _caches[namespace] = cache
+        return cache
+
+
+def cache_stats() -> Dict[str, Dict]:
+    with _caches_lock:
+        caches = dict(_caches)
+    return {namespace: cache.stats() for namespace, cache in caches.items()}
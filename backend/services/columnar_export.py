@@ -0,0 +1,232 @@
+import os
+import logging
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed for exports
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Rows buffered per table before a row group is flushed to disk
+EXPORT_ROW_GROUP_SIZE = int(os.getenv('EXPORT_ROW_GROUP_SIZE', 50000))
+
+GENE_PROFILES = 'gene_profiles'
+RISK_ASSESSMENTS = 'risk_assessments'
+EXPORT_TABLES = (GENE_PROFILES, RISK_ASSESSMENTS)
+EXPORT_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def _schemas() -> Dict[str, "pa.Schema"]:
+    return {
+        GENE_PROFILES: pa.schema([
+            ('sample_id', pa.string()),
+            ('gene', pa.dictionary(pa.int8(), pa.string())),
+            ('star_allele_1', pa.string()),
+            ('star_allele_2', pa.string()),
+            ('diplotype', pa.string()),
+            ('phenotype', pa.dictionary(pa.int8(), pa.string())),
+            ('variant_count', pa.int32()),
+        ]),
+        RISK_ASSESSMENTS: pa.schema([
+            ('sample_id', pa.string()),
+            ('patient_id', pa.string()),
+            ('drug', pa.dictionary(pa.int16(), pa.string())),
+            ('gene', pa.dictionary(pa.int8(), pa.string())),
+            ('phenotype', pa.dictionary(pa.int8(), pa.string())),
+            ('risk_label', pa.dictionary(pa.int8(), pa.string())),
+            ('severity', pa.dictionary(pa.int8(), pa.string())),
+            ('confidence_score', pa.float32()),
+            ('timestamp', pa.string()),
+        ]),
+    }
+
+
+def _without_dictionaries(schema: "pa.Schema") -> "pa.Schema":
+    """
+    `schema` with dictionary columns as their plain value type. Each row
+    group builds its own dictionaries, and an Arrow IPC file allows only
+    one dictionary per field.
+    """
+    return pa.schema([
+        field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type) else field
+        for field in schema
+    ])
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for columnar export (pip install pyarrow)")
+
+
+class ColumnarExporter:
+    """
+    Streams analysis results into columnar files, one per table:
+
+      gene_profiles     one row per (sample, gene): diplotype and phenotype
+      risk_assessments  one row per (sample, drug) result
+
+    Rows are buffered per table and written out as a row group every
+    `row_group_size` rows, so memory stays bounded however many results
+    are streamed through. Parquet keeps the low-cardinality columns
+    dictionary-encoded; Arrow files store them as plain strings.
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        fmt: str = 'parquet',
+        tables: Sequence[str] = EXPORT_TABLES,
+        row_group_size: int = EXPORT_ROW_GROUP_SIZE,
+        drug_genes: Optional[Dict[str, str]] = None
+    ):
+        _require_pyarrow()
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format '{fmt}'")
+
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.tables = tuple(tables)
+        self.row_group_size = row_group_size
+        # drug -> relevant gene, to attach the driving phenotype to each risk row
+        self.drug_genes = drug_genes or {}
+
+        self._schemas = {name: schema for name, schema in _schemas().items() if name in self.tables}
+        if fmt == 'arrow':
+            self._schemas = {name: _without_dictionaries(schema) for name, schema in self._schemas.items()}
+        self._buffers = {name: {f: [] for f in schema.names} for name, schema in self._schemas.items()}
+        self._writers = {}
+        self.row_counts = {name: 0 for name in self.tables}
+
+        os.makedirs(out_dir, exist_ok=True)
+
+    def path_for(self, table: str) -> str:
+        return os.path.join(self.out_dir, f"{table}{EXPORT_FORMATS[self.fmt]}")
+
+    def write_results(self, sample_id: str, analyses: Iterable[Dict]):
+        """
+        Add the AnalysisResponse dicts of one sample. A sample's gene
+        profile is identical across its drug results, so it is written once
+        per call; pass all of an upload's results together.
+        """
+        profile_written = False
+        for analysis in analyses:
+            profile = {p['gene']: p for p in analysis['pharmacogenomic_profile']}
+
+            if GENE_PROFILES in self._buffers and not profile_written:
+                profile_written = True
+                for gene_profile in profile.values():
+                    self._append(GENE_PROFILES, (
+                        sample_id,
+                        gene_profile['gene'],
+                        gene_profile['star_allele_1'],
+                        gene_profile['star_allele_2'],
+                        gene_profile['diplotype'],
+                        gene_profile['phenotype'],
+                        len(gene_profile['detected_variants']),
+                    ))
+
+            if RISK_ASSESSMENTS in self._buffers:
+                drug = (analysis.get('canonical_drug') or analysis['drug']).lower()
+                gene = self.drug_genes.get(drug)
+                risk = analysis['risk_assessment']
+                self._append(RISK_ASSESSMENTS, (
+                    sample_id,
+                    analysis['patient_id'],
+                    drug,
+                    gene,
+                    profile[gene]['phenotype'] if gene in profile else None,
+                    risk['risk_label'],
+                    risk['severity'],
+                    risk['confidence_score'],
+                    analysis['timestamp'],
+                ))
+
+    def _append(self, table: str, row: tuple):
+        buffer = self._buffers[table]
+        for column, value in zip(buffer.values(), row):
+            column.append(value)
+        self.row_counts[table] += 1
+        if len(buffer['sample_id']) >= self.row_group_size:
+            self._flush(table)
+
+    def _flush(self, table: str):
+        buffer = self._buffers[table]
+        if not buffer['sample_id']:
+            return
+        schema = self._schemas[table]
+        batch = pa.Table.from_pydict(buffer, schema=schema)
+
+        writer = self._writers.get(table)
+        if writer is None:
+            if self.fmt == 'parquet':
+                writer = pq.ParquetWriter(self.path_for(table), schema, compression='zstd')
+            else:
+                writer = pa.ipc.new_file(self.path_for(table), schema)
+            self._writers[table] = writer
+
+        writer.write_table(batch)
+        for column in buffer.values():
+            column.clear()
+
+    def close(self) -> Dict[str, str]:
+        """Flush remaining rows, finish every file and return their paths."""
+        paths = {}
+        for table in self.tables:
+            self._flush(table)
+            writer = self._writers.pop(table, None)
+            if writer is None:
+                # Nothing written: still produce an empty, schema-typed file
+                schema = self._schemas[table]
+                empty = schema.empty_table()
+                if self.fmt == 'parquet':
+                    pq.write_table(empty, self.path_for(table))
+                else:
+                    with pa.ipc.new_file(self.path_for(table), schema) as w:
+                        w.write_table(empty)
+            else:
+                writer.close()
+            paths[table] = self.path_for(table)
+        logger.info(f"Columnar export finished: {self.row_counts}")
+        return paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def export_result_store(store, out_dir: str, fmt: str = 'parquet',
+                        tables: Sequence[str] = EXPORT_TABLES,
+                        drug_genes: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Stream every stored result into columnar files. An upload's results
+    are stored with consecutive ids, so they are passed on together.
+    """
+    with ColumnarExporter(out_dir, fmt=fmt, tables=tables, drug_genes=drug_genes) as exporter:
+        for sample_id, rows in groupby(store.iter_results(), key=lambda row: row['sample_id']):
+            exporter.write_results(sample_id, (row['analysis'] for row in rows))
+    return {table: exporter.path_for(table) for table in exporter.tables}
+
+
+def read_columns(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[list] = None
+) -> "pa.Table":
+    """
+    Read an exported file back, loading only the requested columns.
+    `filters` (Parquet only) use pyarrow's predicate form, e.g.
+    [('gene', '=', 'CYP2C19')], and skip row groups that cannot match.
+    """
+    _require_pyarrow()
+    if path.endswith(EXPORT_FORMATS['arrow']):
+        # Memory-mapped, so unselected columns are never read from disk
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        return table.select(columns) if columns else table
+    return pq.read_table(path, columns=columns, filters=filters)
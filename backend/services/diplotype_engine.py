@@ -1,4 +1,6 @@
-from typing import List, Tuple
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from services.vcf_parser import Variant
 
 
 class DiplotypeEngine:
@@ -8,13 +10,24 @@ class DiplotypeEngine:
     def form_diplotype(
         self,
         star_alleles: List[str],
-        variants: List[dict]
+        variants: List[Variant],
+        candidates: Optional[Dict[str, FrozenSet[Tuple[str, str]]]] = None
     ) -> Tuple[str, str, str]:
         """
         Form diplotype from star alleles and variants.
+
+        When candidate alleles (allele -> defining sites) are supplied, the
+        diplotype is called by enumerating haplotype pairs that explain the
+        observed genotypes; the star-allele heuristics below are used only
+        if no pair explains them.
         
         Returns: (star_allele_1, star_allele_2, diplotype_string)
         """
+        if candidates is not None:
+            called = self.call_diplotype(candidates, variants)
+            if called is not None:
+                return called
+
         if not star_alleles:
             return ("*1", "*1", "*1/*1")
         
@@ -34,7 +47,95 @@ class DiplotypeEngine:
             # Multiple alleles detected - ambiguous
             return ("Unknown", "Unknown", "Unknown")
     
-    def _analyze_genotypes(self, variants: List[dict]) -> dict:
+    def call_diplotype(
+        self,
+        candidates: Dict[str, FrozenSet[Tuple[str, str]]],
+        variants: List[Variant]
+    ) -> Optional[Tuple[str, str, str]]:
+        """
+        Pick the best haplotype pair that exactly explains the genotypes at
+        the candidates' defining sites.
+
+        Sites become bits, so each allele is a mask. For a pair (a, b) every
+        het site must be on exactly one haplotype and every hom site on
+        both, i.e. a | b == observed and a & b == hom. Given a, that fixes b
+        to (observed & ~a) | hom, so partners are found with one dict lookup
+        instead of a nested loop. Phased het calls must also agree with one
+        orientation of the pair.
+
+        Among explaining pairs the most specific wins (largest sum of
+        squared definition sizes), then the lowest allele numbers.
+        Returns None if no pair explains the observed genotypes.
+        """
+        site_bits: Dict[Tuple[str, str], int] = {}
+        for sites in candidates.values():
+            for site in sites:
+                if site not in site_bits:
+                    site_bits[site] = 1 << len(site_bits)
+
+        het = hom = phased = hap_1 = hap_2 = 0
+        for variant in variants:
+            bit = site_bits.get((variant.rsid, variant.alt))
+            if bit is None:
+                continue
+            alleles = variant.genotype.split('/')
+            dosage = sum(1 for a in alleles if a.isdigit() and a != '0')
+            if dosage >= 2:
+                hom |= bit
+            elif dosage == 1:
+                het |= bit
+                if variant.phased and len(alleles) == 2:
+                    phased |= bit
+                    if alleles[0] != '0':
+                        hap_1 |= bit
+                    else:
+                        hap_2 |= bit
+        observed = het | hom
+
+        # *1 (reference) carries no defining variants
+        alleles_by_mask: Dict[int, List[str]] = {0: ['*1']}
+        sizes = {'*1': 0}
+        for star_allele, sites in candidates.items():
+            mask = 0
+            for site in sites:
+                mask |= site_bits[site]
+            alleles_by_mask.setdefault(mask, []).append(star_allele)
+            sizes[star_allele] = len(sites)
+
+        best = None
+        for mask_a, alleles_a in alleles_by_mask.items():
+            if hom & ~mask_a or mask_a & ~observed:
+                continue
+            mask_b = (observed & ~mask_a) | hom
+            alleles_b = alleles_by_mask.get(mask_b)
+            if not alleles_b:
+                continue
+            if phased and not (
+                (mask_a & phased == hap_1 and mask_b & phased == hap_2) or
+                (mask_a & phased == hap_2 and mask_b & phased == hap_1)
+            ):
+                continue
+            for allele_a in alleles_a:
+                for allele_b in alleles_b:
+                    pair = sorted((allele_a, allele_b), key=self._allele_order)
+                    rank = (
+                        -(sizes[allele_a] ** 2 + sizes[allele_b] ** 2),
+                        [self._allele_order(a) for a in pair]
+                    )
+                    if best is None or rank < best[0]:
+                        best = (rank, pair)
+
+        if best is None:
+            return None
+
+        allele_1, allele_2 = best[1]
+        return (allele_1, allele_2, f"{allele_1}/{allele_2}")
+
+    def _allele_order(self, allele: str) -> Tuple[int, str]:
+        """Sort key: allele number first, then name (*3A before *3B)."""
+        return (self._allele_sort_key(allele), allele)
+
+    def _analyze_genotypes(self, variants: List[Variant]) -> dict:
         """Analyze genotype patterns in variants."""
         genotype_counts = {
             '0/0': 0,
@@ -45,7 +146,7 @@ class DiplotypeEngine:
         }
         
         for variant in variants:
-            gt = variant.get('genotype', 'Unknown')
+            gt = variant.genotype
             if gt in genotype_counts:
                 genotype_counts[gt] += 1
             else:
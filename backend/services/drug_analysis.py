@@ -0,0 +1,308 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from services.drug_engine import DrugEngine
+from services.phenotype_engine import PhenotypeEngine
+from services.llm_service import LLMService
+from services.web_search_service import WebSearchService
+from services.explanation_bundle import ExplanationBundle
+from services.vcf_parser import VCFQC, Variant
+from services.tracing import tracer, bind_context
+from schemas.response_schema import (
+    AnalysisResponse,
+    GeneProfile,
+    RiskAssessment,
+    ClinicalRecommendation,
+    LLMExplanation,
+    QualityMetrics,
+    VCFQualityStats
+)
+
+# LLM explanation requests issued in parallel for one multi-drug analysis
+EXPLANATION_CONCURRENCY = int(os.getenv('EXPLANATION_CONCURRENCY', 4))
+
+
+class UnsupportedDrugError(ValueError):
+    """Raised when a drug has no rules in drug_rules.json."""
+
+    def __init__(self, drug: str, supported_drugs: List[str]):
+        super().__init__(f"Drug '{drug}' is not supported")
+        self.drug = drug
+        self.supported_drugs = supported_drugs
+
+
+class DrugAnalyzer:
+    """
+    Builds AnalysisResponses for one or more drugs against a finished profile.
+    Shared by the HTTP route and the offline CLI.
+
+    Clinical decision (risk_label, phenotype) is deterministic; the LLM
+    only generates explanation text. Explanations come from the
+    precomputed bundle when it has the combination, otherwise from the
+    LLM (if configured). With `explain=False` no explanation is looked
+    up and template explanations are used.
+    """
+
+    def __init__(
+        self,
+        drug_engine: DrugEngine,
+        phenotype_engine: PhenotypeEngine,
+        llm_service: Optional[LLMService] = None,
+        web_search_service: Optional[WebSearchService] = None,
+        explanation_bundle: Optional[ExplanationBundle] = None
+    ):
+        self.drug_engine = drug_engine
+        self.phenotype_engine = phenotype_engine
+        self.llm_service = llm_service
+        self.web_search_service = web_search_service
+        self.explanation_bundle = explanation_bundle
+
+    def analyze(
+        self,
+        drug: str,
+        variants_by_gene: Dict[str, List[Variant]],
+        pharmacogenomic_profile: List[GeneProfile],
+        explain: bool = True
+    ) -> AnalysisResponse:
+        """
+        Run drug-specific recommendation and explanation for one drug.
+        Raises UnsupportedDrugError on unsupported drug.
+        """
+        return self.analyze_panel(variants_by_gene, pharmacogenomic_profile, [drug], explain)[0]
+
+    def analyze_panel(
+        self,
+        variants_by_gene: Dict[str, List[Variant]],
+        pharmacogenomic_profile: List[GeneProfile],
+        drugs: Optional[List[str]] = None,
+        explain: bool = True,
+        vcf_qc: Optional[VCFQC] = None
+    ) -> List[AnalysisResponse]:
+        """
+        Assess several drugs (default: every supported drug) against one
+        profile. Each gene's phenotype is looked up once and the drug rules
+        are evaluated in a single pass; explanations for all drugs are
+        fetched together. Results follow the order of `drugs`, echo each
+        requested name in `drug` with the supported drug it resolved to
+        (brands, salts and misspellings) in `canonical_drug`, and carry the
+        parser's `vcf_qc`, if given.
+        Raises UnsupportedDrugError on the first unsupported drug.
+        """
+        if drugs is None:
+            drugs = requested = self.drug_engine.get_supported_drugs()
+        else:
+            requested, drugs = drugs, self.resolve_drugs(drugs)
+
+        profiles = {p.gene: p for p in pharmacogenomic_profile}
+        # Phenotype confidence, once per gene rather than once per drug
+        phenotypes = {
+            gene: self.phenotype_engine.determine_phenotype(
+                gene, p.diplotype, p.star_allele_1, p.star_allele_2
+            )
+            for gene, p in profiles.items()
+        }
+
+        # Deterministic drug recommendations (LLM must NOT change these values)
+        decisions = self.drug_engine.evaluate_panel(phenotypes, drugs)
+
+        assessments = []
+        for drug in drugs:
+            gene, drug_rec = decisions[drug]
+            if gene not in profiles:
+                raise RuntimeError("Failed to generate gene profile")
+            assessments.append((drug, gene, profiles[gene], drug_rec))
+
+        explanations = [None] * len(assessments)
+        if explain:
+            explanations = self._generate_explanations(assessments, variants_by_gene)
+        # As before bundles: set whenever the explanation step ran, even if
+        # the LLM failed and the template was used
+        explained = [
+            explain and (self.llm_service is not None or explanation is not None)
+            for explanation in explanations
+        ]
+
+        if vcf_qc is not None:
+            gene_variants_found = vcf_qc.records_kept > 0
+            qc_stats = VCFQualityStats(**vcf_qc.to_dict())
+        else:
+            gene_variants_found = any(variants_by_gene.values())
+            qc_stats = None
+        # One patient per call: every drug result of this sample shares the id
+        patient_id = str(uuid.uuid4())
+        return [
+            self._build_response(
+                drug, gene, profile, drug_rec, explanation,
+                pharmacogenomic_profile, gene_variants_found, ran, qc_stats, patient_id, requested_drug
+            )
+            for (drug, gene, profile, drug_rec), explanation, ran, requested_drug
+            in zip(assessments, explanations, explained, requested)
+        ]
+
+    def resolve_drugs(self, drugs: List[str]) -> List[str]:
+        """
+        Canonical names for requested drugs, in order.
+        Raises UnsupportedDrugError on the first name that does not resolve.
+        """
+        resolved = []
+        for drug in drugs:
+            canonical = self.drug_engine.resolve_drug(drug)
+            if canonical is None:
+                raise UnsupportedDrugError(drug, self.drug_engine.get_supported_drugs())
+            resolved.append(canonical)
+        return resolved
+
+    def _build_response(
+        self,
+        drug: str,
+        gene: str,
+        relevant_profile: GeneProfile,
+        drug_rec: Dict,
+        llm_explanation_data: Optional[Dict],
+        pharmacogenomic_profile: List[GeneProfile],
+        gene_variants_found: bool,
+        explained: bool,
+        vcf_qc: Optional[VCFQualityStats] = None,
+        patient_id: Optional[str] = None,
+        requested_drug: Optional[str] = None
+    ) -> AnalysisResponse:
+        quality_metrics = {
+            'vcf_parsing_success': True,
+            'gene_variants_found': gene_variants_found,
+            'star_allele_determined': relevant_profile.diplotype != "Unknown",
+            'phenotype_determined': relevant_profile.phenotype != "Unknown",
+            'recommendation_generated': True,
+            'llm_explanation_generated': explained,
+            'vcf_qc': vcf_qc
+        }
+
+        if llm_explanation_data is None:
+            llm_explanation_data = LLMService.fallback_explanation(
+                gene,
+                relevant_profile.diplotype,
+                relevant_profile.phenotype,
+                drug,
+                drug_rec['risk_label']
+            )
+
+        # Build response objects
+        risk_assessment = RiskAssessment(
+            risk_label=drug_rec['risk_label'],
+            severity=drug_rec['severity'],
+            confidence_score=min(max(drug_rec['confidence_score'], 0.0), 1.0)
+        )
+
+        clinical_rec = self.drug_engine.format_clinical_recommendation(
+            drug_rec['recommendation'],
+            drug_rec['risk_label'],
+            drug_rec['severity']
+        )
+        clinical_recommendation = ClinicalRecommendation(
+            summary=clinical_rec['summary'],
+            dosing_guidance=clinical_rec['dosing'],
+            monitoring_requirements=clinical_rec['monitoring']
+        )
+
+        llm_explanation = LLMExplanation(
+            mechanism=llm_explanation_data['mechanism'],
+            clinical_context=llm_explanation_data['clinical_context'],
+            patient_friendly_summary=llm_explanation_data['patient_friendly_summary']
+        )
+
+        return AnalysisResponse(
+            patient_id=patient_id or str(uuid.uuid4()),
+            drug=requested_drug or drug,
+            canonical_drug=drug,
+            timestamp=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            risk_assessment=risk_assessment,
+            pharmacogenomic_profile=pharmacogenomic_profile,
+            clinical_recommendation=clinical_recommendation,
+            llm_generated_explanation=llm_explanation,
+            quality_metrics=QualityMetrics(**quality_metrics)
+        )
+
+    def _generate_explanations(
+        self,
+        assessments: List[tuple],
+        variants_by_gene: Dict[str, List[Variant]]
+    ) -> List[Optional[Dict]]:
+        """
+        Bundle hits are answered in-memory; the remaining LLM requests are
+        issued concurrently, at most EXPLANATION_CONCURRENCY at a time.
+        """
+        explanations = [
+            self._bundled_explanation(drug, gene, profile, drug_rec)
+            for drug, gene, profile, drug_rec in assessments
+        ]
+        missing = [i for i, e in enumerate(explanations) if e is None]
+        tracer.current_span().set_attribute('bundled_explanations', len(assessments) - len(missing))
+        if not missing or self.llm_service is None:
+            return explanations
+
+        def generate(i: int) -> Optional[Dict]:
+            drug, gene, profile, drug_rec = assessments[i]
+            with tracer.span('explanation', drug=drug, gene=gene):
+                return self._generate_explanation(
+                    drug, gene, profile, drug_rec, variants_by_gene[gene]
+                )
+
+        if len(missing) == 1:
+            explanations[missing[0]] = generate(missing[0])
+        else:
+            with ThreadPoolExecutor(max_workers=min(EXPLANATION_CONCURRENCY, len(missing))) as executor:
+                # Each task runs in a copy of this context so its spans join the trace
+                tasks = [executor.submit(bind_context(generate), i) for i in missing]
+                for i, task in zip(missing, tasks):
+                    explanations[i] = task.result()
+        return explanations
+
+    def _bundled_explanation(
+        self,
+        drug: str,
+        gene: str,
+        profile: GeneProfile,
+        drug_rec: Dict
+    ) -> Optional[Dict]:
+        if self.explanation_bundle is None:
+            return None
+        return self.explanation_bundle.get(
+            gene, profile.diplotype, profile.phenotype, drug, drug_rec['risk_label']
+        )
+
+    def _generate_explanation(
+        self,
+        drug: str,
+        gene: str,
+        profile: GeneProfile,
+        drug_rec: Dict,
+        variants: List[Variant]
+    ) -> Optional[Dict]:
+        """Web search context plus LLM call; None if the LLM fails."""
+        web_context = ""
+        if self.web_search_service is not None:
+            # Web search for optional additional context (errors silenced)
+            web_search_results = self.web_search_service.search_pharmacogenomics_context(
+                gene=gene,
+                diplotype=profile.diplotype,
+                phenotype=profile.phenotype,
+                drug=drug,
+                max_results=3
+            )
+            web_context = self.web_search_service.format_search_results_for_llm(
+                web_search_results, terms=(gene, drug, profile.diplotype)
+            )
+
+        # LLM generates explanation text ONLY — does not affect clinical decision
+        return self.llm_service.try_generate_explanation(
+            gene,
+            profile.diplotype,
+            profile.phenotype,
+            drug,
+            drug_rec['risk_label'],
+            drug_rec['recommendation'],
+            variants,
+            web_search_results=web_context
+        )
@@ -1,22 +1,24 @@
-import json
-import os
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from services.drug_resolver import DrugResolver
+from services.knowledge_base import freeze, load_frozen
+
+# Used to pick the governing result when a drug has rules under several genes
+SEVERITY_RANK = {'none': 0, 'low': 1, 'moderate': 2, 'high': 3, 'critical': 4}
 
 
 class DrugEngine:
     def __init__(self):
         self.drug_rules = self._load_drug_rules()
         self.gene_drug_mapping = self._build_gene_drug_mapping()
+        synonyms = load_frozen('drug_synonyms.json')
+        self.resolver = DrugResolver(
+            self.gene_drug_mapping, synonyms['synonyms'], synonyms['unsupported_lookalikes']
+        )
     
     def _load_drug_rules(self) -> dict:
-        """Load drug decision rules from JSON."""
-        data_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)),
-            'data',
-            'drug_rules.json'
-        )
-        with open(data_path, 'r') as f:
-            return json.load(f)
+        """Drug decision rules from JSON (frozen, shared per process)."""
+        return load_frozen('drug_rules.json')
     
     def _build_gene_drug_mapping(self) -> Dict[str, list]:
         """Build mapping of drugs to genes."""
@@ -26,14 +28,65 @@ class DrugEngine:
                 if drug not in mapping:
                     mapping[drug] = []
                 mapping[drug].append(gene)
-        return mapping
+        return freeze(mapping)
+    
+    def resolve_drug(self, drug: str) -> Optional[str]:
+        """
+        Canonical (rules) name for a generic, salt, brand or misspelled
+        drug name; None if it matches no supported drug.
+        """
+        return self.resolver.resolve(drug)
     
     def get_relevant_gene(self, drug: str) -> str:
         """Get the primary gene for a drug."""
-        drug_lower = drug.lower()
-        genes = self.gene_drug_mapping.get(drug_lower, [])
+        genes = self.get_relevant_genes(drug)
         return genes[0] if genes else None
     
+    def get_relevant_genes(self, drug: str) -> List[str]:
+        """Get every gene with rules for a drug, primary gene first."""
+        return list(self.gene_drug_mapping.get(self.resolve_drug(drug), []))
+    
+    def evaluate_panel(
+        self,
+        phenotypes: Dict[str, Tuple[str, float]],
+        drugs: Optional[List[str]] = None
+    ) -> Dict[str, Tuple[str, Dict]]:
+        """
+        Evaluate drug rules against a whole profile in one pass over the
+        rule table, looking up each gene's phenotype once.
+        
+        phenotypes: gene -> (phenotype, confidence)
+        drugs: restrict to these drugs (default: every supported drug)
+        
+        Returns: canonical drug -> (gene, recommendation dict). When a drug has rules
+        under several genes the most severe matched result is kept, ties
+        going to the primary gene.
+        """
+        wanted = None if drugs is None else {self.resolve_drug(d) for d in drugs}
+        results = {}
+        
+        for gene, gene_rules in self.drug_rules.items():
+            phenotype, confidence = phenotypes.get(gene, ("Unknown", 0.0))
+            for drug_lower, rules in gene_rules.items():
+                if wanted is not None and drug_lower not in wanted:
+                    continue
+                rule = rules.get(phenotype)
+                if rule is None:
+                    rec = self._unknown_recommendation(confidence)
+                else:
+                    rec = {
+                        'risk_label': rule['risk_label'],
+                        'severity': rule['severity'],
+                        'recommendation': rule['recommendation'],
+                        'confidence_score': confidence
+                    }
+                rank = (rule is not None, SEVERITY_RANK[rec['severity']])
+                current = results.get(drug_lower)
+                if current is None or rank > current[2]:
+                    results[drug_lower] = (gene, rec, rank)
+        
+        return {drug_lower: (gene, rec) for drug_lower, (gene, rec, _) in results.items()}
+    
     def get_drug_recommendation(
         self,
         drug: str,
@@ -46,7 +99,7 @@ class DrugEngine:
         
         Returns: Dict with risk_label, severity, recommendation
         """
-        drug_lower = drug.lower()
+        drug_lower = self.resolve_drug(drug)
         
         if gene not in self.drug_rules:
             return self._unknown_recommendation(confidence_score)
@@ -80,9 +133,8 @@ class DrugEngine:
         }
     
     def is_drug_supported(self, drug: str) -> bool:
-        """Check if drug is supported."""
-        drug_lower = drug.lower()
-        return drug_lower in self.gene_drug_mapping
+        """Check if drug is supported (under any name the resolver knows)."""
+        return self.resolve_drug(drug) is not None
     
     def get_supported_drugs(self) -> list:
         """Get list of all supported drugs."""
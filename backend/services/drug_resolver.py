@@ -0,0 +1,152 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+# Salt and formulation words dropped before lookup, so "clopidogrel
+# bisulfate 75 mg tablets" and "clopidogrel" resolve alike
+IGNORED_TOKENS = frozenset((
+    'hydrochloride', 'hcl', 'hydrobromide', 'hbr', 'sodium', 'potassium', 'calcium',
+    'magnesium', 'bisulfate', 'hydrogen', 'sulfate', 'sulphate', 'phosphate', 'oxalate',
+    'besylate', 'besilate', 'mesylate', 'maleate', 'tartrate', 'citrate', 'acetate',
+    'succinate', 'fumarate', 'monohydrate', 'dihydrate', 'trihydrate', 'anhydrous',
+    'tablet', 'tablets', 'tab', 'tabs', 'capsule', 'capsules', 'oral', 'injection',
+    'solution', 'suspension', 'cream', 'er', 'xr', 'sr', 'cr', 'extended', 'delayed',
+    'release', 'chewable', 'generic', 'mg', 'mcg', 'g', 'ml'
+))
+
+# Fuzzy index keys cover only this many leading characters (SymSpell's
+# prefix trick): far fewer deletes, candidates are checked in full anyway
+FUZZY_PREFIX = 7
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_DOSE = re.compile(r'^\d+(\.\d+)?(mg|mcg|g|ml|%)$')
+
+
+def normalize_drug_name(name: str, drop_numbers: bool = False) -> str:
+    """
+    Lowercase ASCII, punctuation to spaces, salt/formulation/dose tokens
+    removed ("Plavix®" -> "plavix", "5-FU" -> "5 fu"). Bare numbers are
+    kept unless `drop_numbers` (they are part of names like "tylenol 3").
+    """
+    text = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().lower()
+    tokens = [t for t in _NON_ALNUM.split(text) if t]
+    kept = [
+        t for t in tokens
+        if t not in IGNORED_TOKENS and not _DOSE.match(t) and not (drop_numbers and t.isdigit())
+    ]
+    return ' '.join(kept or tokens)
+
+
+def _deletes(term: str, distance: int) -> Set[str]:
+    """Every string reachable from `term` by up to `distance` deletions."""
+    result = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or limit + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def max_distance(term: str) -> int:
+    """Typos tolerated for a name of this length; short names must be exact."""
+    if len(term) <= 4:
+        return 0
+    if len(term) <= 8:
+        return 1
+    return 2
+
+
+class DrugResolver:
+    """
+    Maps user-supplied drug names to the canonical names used by the rules:
+    generic names, salts, brands and listed misspellings resolve exactly
+    through a normalized-name map; anything else falls back to a bounded
+    edit-distance lookup.
+
+    Fuzzy lookup uses a symmetric-delete index (SymSpell): every name is
+    stored under each string obtained by deleting up to two characters
+    from its prefix, so a query only generates its own deletes and probes
+    the index, with no scan over the dictionary. Look-alike drugs we do
+    not support are indexed too and resolve to None, so "citalopram" is
+    rejected rather than corrected to escitalopram; a fuzzy match equally
+    close to two different drugs is rejected as well.
+    """
+
+    def __init__(self, canonical_drugs: Iterable[str], synonyms: Mapping[str, List[str]],
+                 lookalikes: Iterable[str] = ()):
+        # name -> canonical drug, or None for a known unsupported drug
+        self._exact: Dict[str, Optional[str]] = {}
+        for name in lookalikes:
+            self._add(name, None)
+        for drug in canonical_drugs:
+            self._add(drug, drug)
+            for synonym in synonyms.get(drug, ()):
+                self._add(synonym, drug)
+
+        self._deletes: Dict[str, Set[str]] = {}
+        for name in self._exact:
+            for variant in _deletes(name[:FUZZY_PREFIX], max_distance(name)):
+                self._deletes.setdefault(variant, set()).add(name)
+
+        self._resolve = lru_cache(maxsize=4096)(self._lookup)
+
+    def _add(self, name: str, drug: Optional[str]):
+        self._exact[name.lower()] = drug
+        self._exact[normalize_drug_name(name)] = drug
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Canonical drug name, or None if `name` matches no supported drug unambiguously."""
+        if name in self._exact:
+            return self._exact[name]
+        return self._resolve(name)
+
+    def _lookup(self, name: str) -> Optional[str]:
+        for term in (name.strip().lower(), normalize_drug_name(name), normalize_drug_name(name, True)):
+            if term in self._exact:
+                return self._exact[term]
+        for drop_numbers in (False, True):
+            term = normalize_drug_name(name, drop_numbers)
+            found, drug = self._fuzzy(term)
+            if found:
+                return drug
+        return None
+
+    def _fuzzy(self, term: str) -> Tuple[bool, Optional[str]]:
+        """(matched, drug): the single closest entry within the typo bound."""
+        limit = max_distance(term)
+        if limit == 0:
+            return False, None
+        candidates = set()
+        for variant in _deletes(term[:FUZZY_PREFIX], limit):
+            candidates |= self._deletes.get(variant, set())
+
+        best, best_drugs = limit + 1, set()
+        for name in candidates:
+            distance = _edit_distance(term, name, min(limit, max_distance(name)))
+            if distance < best:
+                best, best_drugs = distance, {self._exact[name]}
+            elif distance == best:
+                best_drugs.add(self._exact[name])
+        if best <= limit and len(best_drugs) == 1:
+            return True, best_drugs.pop()
+        return False, None
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from itertools import combinations_with_replacement
+from typing import Dict, List, NamedTuple, Optional
+
+from services.knowledge_base import data_path, knowledge_base_version
+from services.vcf_parser import Variant
+
+logger = logging.getLogger(__name__)
+
+EXPLANATION_BUNDLE_PATH = os.getenv(
+    'EXPLANATION_BUNDLE_PATH', data_path('explanation_bundle.json')
+)
+
+# Bumped when the bundle file layout changes
+BUNDLE_FORMAT_VERSION = 1
+
+
+def bundle_key(gene: str, diplotype: str, phenotype: str, drug: str, risk_label: str) -> str:
+    """Key of one explanation; allele order within the diplotype is ignored."""
+    alleles = diplotype.split('/')
+    if len(alleles) == 2:
+        diplotype = '/'.join(sorted(alleles))
+    return '|'.join((gene, diplotype, phenotype, drug.lower(), risk_label))
+
+
+class Combination(NamedTuple):
+    """One reachable (gene, diplotype, phenotype, drug, risk_label) outcome."""
+    gene: str
+    diplotype: str
+    allele_1: str
+    allele_2: str
+    phenotype: str
+    drug: str
+    risk_label: str
+    recommendation: str
+
+    @property
+    def key(self) -> str:
+        return bundle_key(self.gene, self.diplotype, self.phenotype, self.drug, self.risk_label)
+
+
+class ExplanationBundle:
+    """
+    Precomputed LLM explanations keyed by bundle_key(). A bundle is tied
+    to the knowledge base version it was generated from; a stale bundle
+    is not served.
+    """
+
+    def __init__(
+        self,
+        explanations: Optional[Dict[str, Dict]] = None,
+        kb_version: Optional[str] = None,
+        model: Optional[str] = None,
+        generated_at: Optional[str] = None
+    ):
+        self.explanations = explanations or {}
+        self.kb_version = kb_version or knowledge_base_version()
+        self.model = model
+        self.generated_at = generated_at
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str = EXPLANATION_BUNDLE_PATH) -> "ExplanationBundle":
+        """Load a bundle; a missing, unreadable or stale file gives an empty one."""
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable explanation bundle {path}: {e}")
+            return cls()
+
+        if data.get('format_version') != BUNDLE_FORMAT_VERSION:
+            logger.warning(f"Ignoring explanation bundle {path}: unsupported format")
+            return cls()
+        if data.get('knowledge_base_version') != knowledge_base_version():
+            logger.warning(
+                f"Ignoring explanation bundle {path}: built for knowledge base "
+                f"{data.get('knowledge_base_version')}, current is {knowledge_base_version()}"
+            )
+            return cls()
+
+        bundle = cls(
+            data.get('explanations', {}),
+            model=data.get('model'),
+            generated_at=data.get('generated_at')
+        )
+        logger.info(f"Loaded {len(bundle)} precomputed explanations from {path}")
+        return bundle
+
+    def get(self, gene: str, diplotype: str, phenotype: str, drug: str,
+            risk_label: str) -> Optional[Dict]:
+        return self.explanations.get(bundle_key(gene, diplotype, phenotype, drug, risk_label))
+
+    def put(self, key: str, explanation: Dict):
+        with self._lock:
+            self.explanations[key] = explanation
+
+    def save(self, path: str = EXPLANATION_BUNDLE_PATH):
+        """Write atomically, so readers never see a half-written bundle."""
+        with self._lock:
+            data = {
+                'format_version': BUNDLE_FORMAT_VERSION,
+                'knowledge_base_version': self.kb_version,
+                'model': self.model,
+                'generated_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'explanations': dict(sorted(self.explanations.items()))
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.explanations
+
+    def __len__(self) -> int:
+        return len(self.explanations)
+
+
+# ── Precompute ─────────────────────────────────────────────────────────────
+
+def enumerate_combinations(star_engine, phenotype_engine, drug_engine) -> List[Combination]:
+    """
+    Every explanation the deterministic pipeline can ask for: each gene's
+    possible diplotypes (pairs of known alleles, plus "Unknown") through
+    the phenotype engine and every drug rule for that gene.
+    """
+    combos = {}
+    for gene, drugs in drug_engine.drug_rules.items():
+        pairs = [("Unknown", "Unknown")] + list(combinations_with_replacement(
+            sorted(_known_alleles(gene, star_engine, phenotype_engine)), 2
+        ))
+        for allele_1, allele_2 in pairs:
+            diplotype = "Unknown" if allele_1 == "Unknown" else f"{allele_1}/{allele_2}"
+            phenotype, confidence = phenotype_engine.determine_phenotype(
+                gene, diplotype, allele_1, allele_2
+            )
+            for drug in drugs:
+                rec = drug_engine.get_drug_recommendation(drug, gene, phenotype, confidence)
+                combo = Combination(
+                    gene, diplotype, allele_1, allele_2, phenotype, drug,
+                    rec['risk_label'], rec['recommendation']
+                )
+                combos.setdefault(combo.key, combo)
+    return list(combos.values())
+
+
+def _known_alleles(gene: str, star_engine, phenotype_engine) -> set:
+    alleles = {'*1'} | set(star_engine.star_definitions.get(gene, {}))
+    table = phenotype_engine.phenotype_tables.get(gene, {})
+    if gene == 'CYP2D6':
+        alleles |= set(table.get('activity_scores', {}))
+    else:
+        for diplotype in table:
+            alleles.update(diplotype.split('/'))
+    return alleles
+
+
+def _defining_variants(combo: Combination, star_engine) -> List[Variant]:
+    """Representative variants for the prompt: those defining either allele."""
+    definitions = star_engine.star_definitions.get(combo.gene, {})
+    variants = []
+    for allele in {combo.allele_1, combo.allele_2}:
+        for site in definitions.get(allele, []):
+            if site['rsid'].startswith('rs'):
+                variants.append(Variant('', '0', site['rsid'], '', site['alt'],
+                                        combo.gene, allele, '0/1'))
+    return variants
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def precompute_bundle(
+    llm_service,
+    star_engine,
+    phenotype_engine,
+    drug_engine,
+    path: str = EXPLANATION_BUNDLE_PATH,
+    concurrency: int = 4,
+    rate: float = 2.0,
+    web_search_service=None,
+    save_every: int = 25
+) -> Dict[str, int]:
+    """
+    Generate explanations for every reachable combination not already in
+    the bundle at `path`, at most `concurrency` in flight and `rate`
+    requests per second. The bundle is saved every `save_every` results,
+    so an interrupted run resumes where it stopped.
+    """
+    from services.llm_service import LLM_MODEL
+
+    bundle = ExplanationBundle.load(path)
+    bundle.model = LLM_MODEL
+    combos = enumerate_combinations(star_engine, phenotype_engine, drug_engine)
+    todo = [c for c in combos if c.key not in bundle]
+    stats = {'combinations': len(combos), 'cached': len(combos) - len(todo),
+             'generated': 0, 'failed': 0}
+    logger.info(f"{len(combos)} reachable combinations, {len(todo)} to generate")
+
+    limiter = RateLimiter(rate)
+
+    def generate(combo: Combination) -> Optional[Dict]:
+        web_context = ""
+        if web_search_service is not None:
+            limiter.wait()
+            results = web_search_service.search_pharmacogenomics_context(
+                gene=combo.gene, diplotype=combo.diplotype, phenotype=combo.phenotype,
+                drug=combo.drug, max_results=3
+            )
+            web_context = web_search_service.format_search_results_for_llm(
+                results, terms=(combo.gene, combo.drug, combo.diplotype)
+            )
+        limiter.wait()
+        return llm_service.try_generate_explanation(
+            combo.gene, combo.diplotype, combo.phenotype, combo.drug, combo.risk_label,
+            combo.recommendation, _defining_variants(combo, star_engine),
+            web_search_results=web_context
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {executor.submit(generate, combo): combo for combo in todo}
+        for future in as_completed(futures):
+            combo = futures[future]
+            try:
+                explanation = future.result()
+            except Exception as e:
+                logger.error(f"Explanation for {combo.key} failed: {e}")
+                explanation = None
+            if explanation is None:
+                stats['failed'] += 1
+                continue
+            bundle.put(combo.key, explanation)
+            stats['generated'] += 1
+            if stats['generated'] % save_every == 0:
+                bundle.save(path)
+                logger.info(f"{stats['generated']}/{len(todo)} explanations generated")
+
+    bundle.save(path)
+    return stats
+
+
+# Singleton instance
+explanation_bundle = ExplanationBundle.load()
@@ -0,0 +1,127 @@
+import os
+import sys
+import json
+import hashlib
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+# Files whose contents determine every deterministic result
+KNOWLEDGE_BASE_FILES = (
+    'star_definitions.json',
+    'phenotype_tables.json',
+    'drug_rules.json'
+)
+
+
+def data_path(name: str) -> str:
+    return os.path.join(DATA_DIR, name)
+
+
+@lru_cache(maxsize=None)
+def knowledge_base_version() -> str:
+    """
+    Short content digest of the knowledge base files. Anything derived
+    from the KB (precomputed explanations, cached results) records it so
+    stale artifacts can be detected after the JSON files change.
+    """
+    digest = hashlib.sha256()
+    for name in KNOWLEDGE_BASE_FILES:
+        with open(data_path(name), 'rb') as f:
+            digest.update(name.encode())
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def dependency_digests() -> Mapping[str, str]:
+    """
+    Content digest of each independently versioned part of the knowledge
+    base: `star_definitions:<gene>`, `phenotype_tables:<gene>` and
+    `drug_rules:<drug>` (that drug's rules under every gene). Stored
+    results record the digests they were computed with, so a KB edit
+    only invalidates the results that read the edited part.
+    """
+    digests = {}
+    for name in ('star_definitions.json', 'phenotype_tables.json'):
+        section = name[:-len('.json')]
+        with open(data_path(name), 'r') as f:
+            for gene, table in json.load(f).items():
+                digests[f"{section}:{gene}"] = _digest(table)
+
+    with open(data_path('drug_rules.json'), 'r') as f:
+        drug_rules = json.load(f)
+    rules_by_drug: Dict[str, Dict] = {}
+    for gene, drugs in drug_rules.items():
+        for drug, rules in drugs.items():
+            rules_by_drug.setdefault(drug.lower(), {})[gene] = rules
+    for drug, rules in rules_by_drug.items():
+        digests[f"drug_rules:{drug}"] = _digest(rules)
+    return MappingProxyType(digests)
+
+
+def result_dependencies(drug: str, genes) -> Dict[str, str]:
+    """
+    Current digests a result for `drug` depends on: the drug's rules plus
+    the allele definitions and phenotype table of every gene in its
+    profile (the response carries all of them). A drug without rules is
+    recorded with an empty digest: current while it stays unsupported,
+    stale once rules for it are added back.
+    """
+    digests = dependency_digests()
+    deps = {}
+    for gene in genes:
+        for section in ('star_definitions', 'phenotype_tables'):
+            key = f"{section}:{gene}"
+            if key in digests:
+                deps[key] = digests[key]
+    key = f"drug_rules:{drug.lower()}"
+    deps[key] = digests.get(key, '')
+    return deps
+
+
+def _digest(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def freeze(value: Any, _shared: Optional[Dict] = None) -> Any:
+    """
+    Read-only, deduplicated copy of JSON data: dicts become mapping
+    proxies, lists become tuples, strings are interned, and identical
+    subtrees (the same allele definition or rule under many keys) are
+    stored once. Fewer objects means fewer pages whose reference counts
+    get written after fork, and nothing can mutate the shared copy.
+    """
+    shared = {} if _shared is None else _shared
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        items = tuple((freeze(k, shared), freeze(v, shared)) for k, v in value.items())
+        # Children are already canonical, so identity stands for equality
+        key = ('d',) + tuple((id(k), id(v)) for k, v in items)
+        if key not in shared:
+            shared[key] = MappingProxyType(dict(items))
+        return shared[key]
+    if isinstance(value, (list, tuple)):
+        items = tuple(freeze(v, shared) for v in value)
+        key = ('t',) + tuple(id(v) for v in items)
+        return shared.setdefault(key, items)
+    return value
+
+
+@lru_cache(maxsize=None)
+def load_frozen(name: str) -> Mapping:
+    """One frozen copy of a knowledge base file per process, shared by every engine."""
+    with open(data_path(name), 'r') as f:
+        return freeze(json.load(f))
+
+
+def preload_knowledge_base():
+    """Load everything derived from the KB files, e.g. before forking workers."""
+    for name in KNOWLEDGE_BASE_FILES:
+        load_frozen(name)
+    knowledge_base_version()
+    dependency_digests()
@@ -0,0 +1,158 @@
+import os
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Optional, Tuple
+
+# Hedge after the primary model's latency at this percentile ...
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', 95))
+# ... over its most recent calls; until enough are seen, after the default delay
+LLM_HEDGE_WINDOW = int(os.getenv('LLM_HEDGE_WINDOW', 200))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', 2.0))
+# Bounds on the hedge delay, seconds
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', 0.3))
+LLM_HEDGE_MAX_DELAY = float(os.getenv('LLM_HEDGE_MAX_DELAY', 10.0))
+
+
+class HedgePolicy:
+    """
+    When to hedge, and what hedging achieved.
+
+    The delay is the LLM_HEDGE_PERCENTILE latency of recent primary calls,
+    so about (100 - percentile)% of calls get a hedge. Primary calls
+    cancelled because the hedge won are recorded at their elapsed time
+    (a lower bound): dropping them would bias the window low and let the
+    delay, and the hedge rate with it, drift.
+    """
+
+    def __init__(self, percentile: float = LLM_HEDGE_PERCENTILE, window: int = LLM_HEDGE_WINDOW):
+        self.percentile = percentile
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.failed = 0
+        self.wins: Dict[str, int] = {}
+
+    def delay(self) -> float:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            delay = LLM_HEDGE_DEFAULT_DELAY
+        else:
+            delay = latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))]
+        return min(max(delay, LLM_HEDGE_MIN_DELAY), LLM_HEDGE_MAX_DELAY)
+
+    def record_primary_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def record_call(self, hedged: bool, winner: Optional[str]):
+        with self._lock:
+            self.calls += 1
+            self.hedged += int(hedged)
+            if winner is None:
+                self.failed += 1
+            else:
+                self.wins[winner] = self.wins.get(winner, 0) + 1
+
+    def stats(self, primary: str, hedge: str) -> Dict:
+        delay = self.delay()
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls = max(self.calls, 1)
+
+            def pct(p: float) -> Optional[float]:
+                if not latencies:
+                    return None
+                return round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000, 1)
+
+            return {
+                'primary_model': primary,
+                'hedge_model': hedge,
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_rate': round(self.hedged / calls, 3),
+                'hedge_win_rate': round(self.wins.get(hedge, 0) / max(self.hedged, 1), 3),
+                'wins': dict(self.wins),
+                'failed': self.failed,
+                'hedge_delay_ms': round(delay * 1000, 1),
+                'primary_p50_ms': pct(50),
+                'primary_p99_ms': pct(99)
+            }
+
+
+async def race(
+    primary: Callable[[], Awaitable[Any]],
+    hedge: Callable[[], Awaitable[Any]],
+    delay: float,
+    accept: Callable[[Any], bool],
+    on_primary_done: Callable[[float], None] = lambda seconds: None
+) -> Tuple[Optional[Any], Optional[str], bool]:
+    """
+    Start `primary`; start `hedge` once `delay` seconds pass without an
+    accepted primary result, or as soon as the primary fails. The first
+    result passing `accept` wins and the other call is cancelled.
+
+    Returns (result, 'primary' | 'hedge' | None, hedged).
+    `on_primary_done` gets the primary's elapsed time when it finishes
+    or is cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    names = {}
+    primary_task = loop.create_task(primary())
+    names[primary_task] = 'primary'
+    pending = {primary_task}
+    hedged = False
+
+    def primary_finished(task: asyncio.Task):
+        on_primary_done(loop.time() - start)
+
+    primary_task.add_done_callback(primary_finished)
+
+    try:
+        while pending:
+            timeout = None if hedged else max(0.0, start + delay - loop.time())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None and accept(task.result()):
+                    return task.result(), names[task], hedged
+            if not hedged and (not pending or loop.time() >= start + delay):
+                hedge_task = loop.create_task(hedge())
+                names[hedge_task] = 'hedge'
+                pending.add(hedge_task)
+                hedged = True
+        return None, None, hedged
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class EventLoopThread:
+    """
+    One asyncio loop on a daemon thread, for running coroutines from
+    synchronous code (the explanation worker threads). Started lazily and
+    again after fork, since threads do not survive it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._loop.run_forever, name='llm-event-loop', daemon=True
+                ).start()
+            return self._loop
+
+    def run(self, coro: Coroutine) -> Any:
+        """Run `coro` on the loop and block until it finishes."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
@@ -1,16 +1,125 @@
 import os
 import json
-from groq import Groq
-from typing import Dict, List
+import time
+import asyncio
+import hashlib
+import threading
+from groq import Groq, AsyncGroq
+from typing import Dict, List, Optional, Tuple
 import logging
 
+from services.cache_backend import get_cache
+from services.llm_hedging import HedgePolicy, EventLoopThread, race
+from services.prompt_budget import estimate_tokens, truncate_to_tokens
+from services.tracing import tracer
+
 logger = logging.getLogger(__name__)
 
+LLM_MODEL = os.getenv('LLM_MODEL', "llama-3.3-70b-versatile")
+# Latency SLO mode: when the primary model is slower than its usual tail
+# latency (see llm_hedging), the same prompt also goes to this smaller,
+# faster model and the first valid answer wins. Opt-in: hedged calls cost
+# extra requests to a second model
+LLM_HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+LLM_HEDGE_MODEL = os.getenv('LLM_HEDGE_MODEL', "llama-3.1-8b-instant")
+# Validated explanations keyed by the model that wrote them, limits and
+# prompt (so by search context too)
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600))
+# Prompt size (system + user message, estimated) and completion cap per call.
+# Three fields of at most LLM_FIELD_WORDS words fit well inside the cap.
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv('LLM_PROMPT_TOKEN_BUDGET', 400))
+LLM_MAX_TOKENS = int(os.getenv('LLM_MAX_TOKENS', 360))
+LLM_FIELD_WORDS = int(os.getenv('LLM_FIELD_WORDS', 50))
+
+# Fixed instructions, identical for every call
+SYSTEM_PROMPT = (
+    "You are a clinical pharmacogenomics expert. Explain the finding given by the user. "
+    "Reply with a JSON object with exactly these string fields, each at most "
+    f"{LLM_FIELD_WORDS} words: "
+    '"mechanism" (how the gene and variants affect the drug\'s metabolism), '
+    '"clinical_context" (clinical implications and why this risk follows, citing CPIC or the context), '
+    '"patient_friendly_summary" (plain language, no jargon). '
+    "Do not change the risk or recommendation."
+)
+
+# Detected variants listed in the prompt; the rest are summarized as a count
+PROMPT_MAX_RSIDS = 8
+# Rule recommendations are one or two sentences; cap outliers
+PROMPT_MAX_RECOMMENDATION_TOKENS = 80
+
+
+class TokenUsage:
+    """
+    Token and latency totals of LLM calls in this process, for /health.
+    `estimated_prompt_tokens` is the budgeter's estimate, reported next to
+    the provider's count so the estimate can be checked.
+    """
 
-class LLMService:
     def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.estimated_prompt_tokens = 0
+            self.truncated = 0
+            self.seconds = 0.0
+
+    def record(self, prompt_tokens: int, completion_tokens: int, estimated_prompt_tokens: int,
+               seconds: float, truncated: bool):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.estimated_prompt_tokens += estimated_prompt_tokens
+            self.truncated += int(truncated)
+            self.seconds += seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls = max(self.calls, 1)
+            return {
+                'calls': self.calls,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'estimated_prompt_tokens': self.estimated_prompt_tokens,
+                'avg_prompt_tokens': round(self.prompt_tokens / calls, 1),
+                'avg_completion_tokens': round(self.completion_tokens / calls, 1),
+                'avg_latency_ms': round(self.seconds / calls * 1000, 1),
+                'truncated_completions': self.truncated,
+                'prompt_token_budget': LLM_PROMPT_TOKEN_BUDGET,
+                'max_completion_tokens': LLM_MAX_TOKENS
+            }
+
+
+# Shared by every LLMService in the process
+token_usage = TokenUsage()
+hedge_policy = HedgePolicy()
+_event_loop = EventLoopThread()
+
+
+def llm_stats() -> Dict:
+    """Token usage and, in latency SLO mode, hedging outcomes."""
+    stats = token_usage.stats()
+    if LLM_HEDGE_ENABLED:
+        stats['hedging'] = hedge_policy.stats(LLM_MODEL, LLM_HEDGE_MODEL)
+    return stats
+
+
+class LLMService:
+    def __init__(self, hedge: bool = LLM_HEDGE_ENABLED):
+        # Hedging trades cost for tail latency; batch callers turn it off
+        self.hedge = hedge
         self.api_key = os.getenv('GROQ_API_KEY')
         self.client = Groq(api_key=self.api_key) if self.api_key else None
+        # Created per process, on first hedged call (see _get_async_client)
+        self._async_client: Optional[AsyncGroq] = None
+        self._async_client_pid: Optional[int] = None
+        self.cache = get_cache('llm_explanations', LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL)
     
     def generate_explanation(
         self,
@@ -28,41 +137,76 @@ class LLMService:
         
         Returns: Dict with mechanism, clinical_context, patient_friendly_summary
         """
-        if not self.client:
-            logger.warning("Groq API key not configured, using fallback")
-            return self._fallback_explanation(
+        explanation = self.try_generate_explanation(
+            gene, diplotype, phenotype, drug, risk_label,
+            recommendation, variants, web_search_results
+        )
+        if explanation is None:
+            return self.fallback_explanation(
                 gene, diplotype, phenotype, drug, risk_label
             )
+        return explanation
+    
+    def try_generate_explanation(
+        self,
+        gene: str,
+        diplotype: str,
+        phenotype: str,
+        drug: str,
+        risk_label: str,
+        recommendation: str,
+        variants: list,
+        web_search_results: str = ""
+    ) -> Optional[Dict]:
+        """
+        Like generate_explanation, but returns None instead of a template
+        when the LLM is unavailable or fails.
+        """
+        if not self.client:
+            logger.warning("Groq API key not configured, using fallback")
+            return None
         
+        prompt = self._build_prompt(
+            gene, diplotype, phenotype, drug, risk_label,
+            recommendation, variants, web_search_results
+        )
+        # A hedged call may be answered by either model, so either's answer may be served
+        models = (LLM_MODEL, LLM_HEDGE_MODEL) if self.hedge else (LLM_MODEL,)
+        for model in models:
+            cached = self.cache.get_json(self._cache_key(model, prompt))
+            if cached is not None:
+                return cached
+
         try:
-            explanation = self._call_llm(
-                gene, diplotype, phenotype, drug, risk_label, 
-                recommendation, variants, web_search_results
-            )
+            if self.hedge:
+                explanation, model = self._call_llm_hedged(prompt, gene, drug)
+                if explanation is None:
+                    return None
+                self.cache.set_json(self._cache_key(model, prompt), explanation)
+                return explanation
+
+            explanation = self._call_llm(prompt, gene, drug)
             
             # Validate structure
-            if self._validate_explanation(explanation):
-                return explanation
-            else:
+            if not self._validate_explanation(explanation):
                 # Retry once
-                explanation = self._call_llm(
-                    gene, diplotype, phenotype, drug, risk_label, 
-                    recommendation, variants, web_search_results
-                )
-                if self._validate_explanation(explanation):
-                    return explanation
-                else:
-                    return self._fallback_explanation(
-                        gene, diplotype, phenotype, drug, risk_label
-                    )
+                explanation = self._call_llm(prompt, gene, drug)
+                if not self._validate_explanation(explanation):
+                    return None
+            self.cache.set_json(self._cache_key(LLM_MODEL, prompt), explanation)
+            return explanation
         
         except Exception as e:
             logger.error(f"LLM generation failed: {e}")
-            return self._fallback_explanation(
-                gene, diplotype, phenotype, drug, risk_label
-            )
+            return None
     
-    def _call_llm(
+    @staticmethod
+    def _cache_key(model: str, prompt: str) -> str:
+        return hashlib.sha256(
+            f"{model}\n{LLM_MAX_TOKENS}\n{SYSTEM_PROMPT}\n{prompt}".encode()
+        ).hexdigest()
+
+    def _build_prompt(
         self,
         gene: str,
         diplotype: str,
@@ -72,44 +216,123 @@ class LLMService:
         recommendation: str,
         variants: list,
         web_search_results: str = ""
-    ) -> Dict:
-        """Call Groq API for explanation with web search context."""
-        rsids = [v['rsid'] for v in variants if v.get('rsid')]
-        rsids_str = ', '.join(rsids) if rsids else 'N/A'
-        
-        # Include web search results in prompt
-        context_section = ""
-        if web_search_results:
-            context_section = f"\n\nAdditional Context from Recent Research:\n{web_search_results}\n"
-        
-        prompt = f"""You are a clinical pharmacogenomics expert. Generate a clear, structured explanation for the following pharmacogenomic finding:
-
-Gene: {gene}
-Diplotype: {diplotype}
-Phenotype: {phenotype}
-Drug: {drug}
-Risk Assessment: {risk_label}
-Recommendation: {recommendation}
-Detected Variants (rsIDs): {rsids_str}{context_section}
-
-Using the clinical guidelines and recent research context provided above, generate a JSON response with exactly three fields:
-1. "mechanism": Explain the molecular mechanism (how {gene} affects {drug} metabolism, mentioning specific variants if relevant). Reference research findings. 2-3 sentences.
-2. "clinical_context": Explain the clinical implications and why the risk assessment was determined. Cite relevant guidelines or research. 2-3 sentences.
-3. "patient_friendly_summary": A simple explanation suitable for patients without medical background. 2-3 sentences.
-
-Return ONLY valid JSON with these three fields. Do not modify the risk assessment or recommendation."""
-
-        response = self.client.chat.completions.create(
-            model="llama-3.3-70b-versatile",  # Groq's fast model
-            messages=[
-                {"role": "system", "content": "You are a pharmacogenomics expert providing evidence-based clinical explanations."},
+    ) -> str:
+        """
+        User prompt for one finding: the facts as compact "key: value"
+        lines, then as much of the search context (most relevant lines
+        first) as fits LLM_PROMPT_TOKEN_BUDGET alongside SYSTEM_PROMPT.
+        """
+        rsids = sorted({v.rsid for v in variants if v.rsid})
+        rsids_str = ', '.join(rsids[:PROMPT_MAX_RSIDS]) or 'none'
+        if len(rsids) > PROMPT_MAX_RSIDS:
+            rsids_str += f" (+{len(rsids) - PROMPT_MAX_RSIDS} more)"
+
+        prompt = (
+            f"Gene: {gene}\n"
+            f"Diplotype: {diplotype} ({phenotype})\n"
+            f"Drug: {drug}\n"
+            f"Risk: {risk_label}\n"
+            f"Recommendation: {truncate_to_tokens(recommendation, PROMPT_MAX_RECOMMENDATION_TOKENS)}\n"
+            f"Variants: {rsids_str}"
+        )
+
+        remaining = LLM_PROMPT_TOKEN_BUDGET - estimate_tokens(SYSTEM_PROMPT) - estimate_tokens(prompt)
+        context = []
+        for line in web_search_results.splitlines() if web_search_results else ():
+            cost = estimate_tokens(line) + 1
+            if cost > remaining:
+                break
+            context.append(line)
+            remaining -= cost
+        if context:
+            prompt += "\nContext:\n" + '\n'.join(context)
+        return prompt
+
+    def _call_llm(self, prompt: str, gene: str, drug: str) -> Dict:
+        """Call Groq API for explanation."""
+        estimated = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt)
+        with tracer.span('groq.chat_completion', model=LLM_MODEL, gene=gene, drug=drug) as span:
+            start = time.perf_counter()
+            response = self.client.chat.completions.create(**self._completion_request(LLM_MODEL, prompt))
+            return self._parse_completion(response, estimated, time.perf_counter() - start, span)
+
+    def _call_llm_hedged(self, prompt: str, gene: str, drug: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Latency SLO mode: the primary model, hedged with LLM_HEDGE_MODEL
+        after hedge_policy.delay() (or at once if the primary fails).
+        The first answer passing _validate_explanation wins and the other
+        request is cancelled. Returns (explanation, model that wrote it),
+        or (None, None) if neither produces one.
+        """
+        delay = hedge_policy.delay()
+        with tracer.span('groq.hedged_completion', model=LLM_MODEL, gene=gene, drug=drug,
+                         hedge_delay_ms=round(delay * 1000)) as span:
+            explanation, winner, hedged = _event_loop.run(race(
+                lambda: self._acall_llm(prompt, LLM_MODEL),
+                lambda: self._acall_llm(prompt, LLM_HEDGE_MODEL),
+                delay,
+                accept=self._validate_explanation,
+                on_primary_done=hedge_policy.record_primary_latency
+            ))
+            model = {'primary': LLM_MODEL, 'hedge': LLM_HEDGE_MODEL}.get(winner)
+            hedge_policy.record_call(hedged, model)
+            span.set_attribute('hedged', hedged)
+            span.set_attribute('winner', model)
+        return explanation, model
+
+    async def _acall_llm(self, prompt: str, model: str) -> Dict:
+        """One asynchronous (cancellable) completion on the hedging event loop."""
+        estimated = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt)
+        start = time.perf_counter()
+        try:
+            response = await self._get_async_client().chat.completions.create(
+                **self._completion_request(model, prompt)
+            )
+            return self._parse_completion(response, estimated, time.perf_counter() - start)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"LLM call to {model} failed: {e}")
+            raise
+
+    def _get_async_client(self) -> AsyncGroq:
+        # Its connection pool belongs to one event loop, so one per process
+        if self._async_client is None or self._async_client_pid != os.getpid():
+            self._async_client = AsyncGroq(api_key=self.api_key)
+            self._async_client_pid = os.getpid()
+        return self._async_client
+
+    def _completion_request(self, model: str, prompt: str) -> Dict:
+        return {
+            'model': model,
+            'messages': [
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7,
-            max_tokens=800
+            'temperature': 0.7,
+            'max_tokens': LLM_MAX_TOKENS,
+            'response_format': {"type": "json_object"}
+        }
+
+    def _parse_completion(self, response, estimated: int, elapsed: float, span=None) -> Dict:
+        """Record token usage and parse the JSON answer of one completion."""
+        choice = response.choices[0]
+        truncated = getattr(choice, 'finish_reason', None) == 'length'
+        usage = getattr(response, 'usage', None)
+        prompt_tokens = getattr(usage, 'prompt_tokens', None) or estimated
+        completion_tokens = getattr(usage, 'completion_tokens', None) or 0
+        token_usage.record(prompt_tokens, completion_tokens, estimated, elapsed, truncated)
+        if span is not None:
+            span.set_attribute('prompt_tokens', prompt_tokens)
+            span.set_attribute('completion_tokens', completion_tokens)
+            if truncated:
+                span.set_attribute('truncated', True)
+        logger.debug(
+            f"LLM {getattr(response, 'model', '')}: {prompt_tokens} prompt + "
+            f"{completion_tokens} completion tokens in {elapsed * 1000:.0f} ms"
         )
-        
-        content = response.choices[0].message.content.strip()
+
+        content = choice.message.content.strip()
         
         # Parse JSON
         if content.startswith('```json'):
@@ -135,15 +358,15 @@ Return ONLY valid JSON with these three fields. Do not modify the risk assessmen
         
         return True
     
-    def _fallback_explanation(
-        self,
+    @staticmethod
+    def fallback_explanation(
         gene: str,
         diplotype: str,
         phenotype: str,
         drug: str,
         risk_label: str
     ) -> Dict:
-        """Fallback explanation when LLM fails."""
+        """Template explanation, used when the LLM fails or is not called."""
         mechanism_templates = {
             "Safe": f"The {gene} gene encodes an enzyme responsible for metabolizing {drug}. The detected {diplotype} diplotype results in {phenotype} metabolizer status, indicating normal enzyme function.",
             "Adjust Dosage": f"The {gene} {diplotype} diplotype indicates {phenotype} metabolizer status, resulting in altered {drug} metabolism. Dose adjustment is necessary to achieve optimal therapeutic effect.",
@@ -1,21 +1,33 @@
+import os
+import queue
+import threading
 import requests
 import time
 from typing import Dict, List, Optional
-from cachetools import TTLCache
 import logging
 
+from services.cache_backend import SharedRateLimiter, get_cache
+from services.tracing import tracer
+
 logger = logging.getLogger(__name__)
 
 # PharmVar API base URL
 PHARMVAR_BASE_URL = "https://www.pharmvar.org/api-service"
 
-# Cache for API responses (TTL: 1 hour, max 1000 items)
-# This helps avoid rate limits (2 calls/second)
-api_cache = TTLCache(maxsize=1000, ttl=3600)
+# Responses are kept on disk (the shared SQLite cache file) so restarts
+# and new workers start warm
+PHARMVAR_CACHE_MAX_BYTES = int(os.getenv('PHARMVAR_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Served as is for this long after being fetched or revalidated, seconds
+PHARMVAR_FRESH_TTL = float(os.getenv('PHARMVAR_FRESH_TTL', 3600))
+# After that, served stale while a background request revalidates it;
+# older entries are refetched before use
+PHARMVAR_MAX_STALE = float(os.getenv('PHARMVAR_MAX_STALE', 30 * 24 * 3600))
+
+api_cache = get_cache('pharmvar_http', max_bytes=PHARMVAR_CACHE_MAX_BYTES, persistent=True)
 
-# Rate limiting
-last_request_time = 0
+# Rate limiting, shared by every process using the cache file
 MIN_REQUEST_INTERVAL = 0.5  # 2 requests per second max
+rate_limiter = SharedRateLimiter('pharmvar', MIN_REQUEST_INTERVAL)
 
 
 class PharmVarService:
@@ -28,44 +40,116 @@ class PharmVarService:
             'Accept': 'application/json',
             'User-Agent': 'PharmaGuard/1.0'
         })
+        self._refresh_queue: Optional[queue.Queue] = None
+        self._refresh_pid: Optional[int] = None
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
     
     def _rate_limit(self):
         """Ensure we don't exceed rate limits (2 calls/second)."""
-        global last_request_time
-        current_time = time.time()
-        time_since_last = current_time - last_request_time
-        
-        if time_since_last < MIN_REQUEST_INTERVAL:
-            time.sleep(MIN_REQUEST_INTERVAL - time_since_last)
-        
-        last_request_time = time.time()
+        rate_limiter.wait()
     
     def _get(self, endpoint: str) -> Optional[Dict]:
-        """Make a GET request to PharmVar API with caching and rate limiting."""
-        cache_key = f"pharmvar:{endpoint}"
-        
-        # Check cache first
-        if cache_key in api_cache:
-            logger.info(f"Cache hit for {endpoint}")
-            return api_cache[cache_key]
-        
-        # Rate limit
-        self._rate_limit()
+        """
+        Make a GET request to PharmVar API with caching and rate limiting.
+
+        Fresh cached responses are returned directly; stale ones are
+        returned directly too while a background request revalidates them.
+        Only a missing (or very old) entry waits for the API.
+        """
+        entry = api_cache.get_json(f"pharmvar:{endpoint}")
+        if entry is not None:
+            age = time.time() - entry['fetched_at']
+            if age < PHARMVAR_FRESH_TTL:
+                logger.debug(f"Cache hit for {endpoint}")
+                return entry['data']
+            if age < PHARMVAR_MAX_STALE:
+                logger.debug(f"Stale cache hit for {endpoint}, revalidating in background")
+                self._schedule_refresh(endpoint)
+                return entry['data']
         
-        try:
-            url = f"{self.base_url}{endpoint}"
-            logger.info(f"Fetching from PharmVar: {url}")
+        refreshed = self._fetch(endpoint, entry)
+        if refreshed is not None:
+            return refreshed['data']
+        # PharmVar unavailable: an old answer beats none
+        return entry['data'] if entry is not None else None
+    
+    def _fetch(self, endpoint: str, entry: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Fetch `endpoint` and store it. With a cached `entry` the request is
+        conditional, and a 304 only renews the entry. None on error.
+        """
+        with tracer.span('pharmvar.get', endpoint=endpoint) as span:
+            # Rate limit
+            self._rate_limit()
             
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
+            try:
+                url = f"{self.base_url}{endpoint}"
+                logger.info(f"Fetching from PharmVar: {url}")
+                
+                headers = {}
+                traceparent = tracer.traceparent()
+                if traceparent:
+                    headers['traceparent'] = traceparent
+                if entry is not None:
+                    if entry.get('etag'):
+                        headers['If-None-Match'] = entry['etag']
+                    if entry.get('last_modified'):
+                        headers['If-Modified-Since'] = entry['last_modified']
+                response = self.session.get(url, timeout=10, headers=headers or None)
+                span.set_attribute('http.status_code', response.status_code)
+                
+                if response.status_code == 304 and entry is not None:
+                    entry = dict(entry, fetched_at=time.time())
+                else:
+                    response.raise_for_status()
+                    entry = {
+                        'data': response.json(),
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'fetched_at': time.time()
+                    }
+                api_cache.set_json(f"pharmvar:{endpoint}", entry)
+                return entry
             
-            data = response.json()
-            api_cache[cache_key] = data
-            return data
-        
-        except requests.exceptions.RequestException as e:
-            logger.error(f"PharmVar API error for {endpoint}: {e}")
-            return None
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.error(f"PharmVar API error for {endpoint}: {e}")
+                span.set_attribute('error', str(e))
+                return None
+    
+    # ── Background revalidation ───────────────────────────────────────────
+    
+    def _schedule_refresh(self, endpoint: str):
+        """Queue `endpoint` for revalidation unless it is already queued."""
+        with self._refresh_lock:
+            if endpoint in self._refreshing:
+                return
+            self._refreshing.add(endpoint)
+            # Started lazily and again after fork, since threads do not survive it
+            if self._refresh_queue is None or self._refresh_pid != os.getpid():
+                self._refresh_queue = queue.Queue()
+                self._refresh_pid = os.getpid()
+                self._refreshing = {endpoint}
+                threading.Thread(
+                    target=self._refresh_loop, args=(self._refresh_queue,),
+                    name='pharmvar-refresh', daemon=True
+                ).start()
+            self._refresh_queue.put(endpoint)
+    
+    def _refresh_loop(self, pending: queue.Queue):
+        # One thread, so background refreshes take at most one rate limit slot at a time
+        while True:
+            endpoint = pending.get()
+            try:
+                entry = api_cache.get_json(f"pharmvar:{endpoint}")
+                # Another worker may have revalidated it meanwhile
+                if entry is None or time.time() - entry['fetched_at'] >= PHARMVAR_FRESH_TTL:
+                    self._fetch(endpoint, entry)
+            except Exception:
+                logger.exception(f"PharmVar refresh failed for {endpoint}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(endpoint)
     
     def get_gene_info(self, gene_symbol: str) -> Optional[Dict]:
         """Get gene information from PharmVar."""
@@ -1,8 +1,8 @@
-import json
-import os
 from typing import Tuple
 import logging
 
+from services.knowledge_base import load_frozen
+
 logger = logging.getLogger(__name__)
 
 
@@ -12,14 +12,8 @@ class PhenotypeEngine:
         self.phenotype_tables = self._load_phenotype_tables()
 
     def _load_phenotype_tables(self) -> dict:
-        """Load phenotype tables from static JSON."""
-        data_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)),
-            'data',
-            'phenotype_tables.json'
-        )
-        with open(data_path, 'r') as f:
-            return json.load(f)
+        """Phenotype tables from static JSON (frozen, shared per process)."""
+        return load_frozen('phenotype_tables.json')
 
     def determine_phenotype(
         self,
@@ -0,0 +1,89 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from services.analysis_pipeline import AnalysisPipeline, GeneCall
+from services.vcf_parser import VCFQC, Variant
+
+logger = logging.getLogger(__name__)
+
+# Uploads at or above this size are parsed and profiled in a worker process;
+# smaller ones stay on the in-process fast path.
+PROCESS_POOL_THRESHOLD_BYTES = int(os.getenv('PROCESS_POOL_THRESHOLD_BYTES', 256 * 1024))
+PROCESS_POOL_WORKERS = int(os.getenv('PROCESS_POOL_WORKERS', os.cpu_count() or 1))
+
+# Per-worker pipeline, built once by the pool initializer
+_worker_pipeline: Optional[AnalysisPipeline] = None
+
+
+def _init_worker():
+    """Load the knowledge base once when a worker process starts."""
+    global _worker_pipeline
+    _worker_pipeline = AnalysisPipeline()
+
+
+def _parse_and_call(file_content: bytes) -> Tuple[Dict[str, List[Variant]], List[GeneCall], VCFQC]:
+    """
+    Worker entry point. Returns variants, gene calls and QC as plain records;
+    Variant pickles as a bare tuple, so nothing model-sized crosses the pipe.
+    """
+    qc = VCFQC()
+    variants_by_gene = _worker_pipeline.parse(file_content, qc)
+    return variants_by_gene, _worker_pipeline.call_genes(variants_by_gene), qc
+
+
+class ProcessPoolService:
+    """Offloads CPU-bound parsing and gene calling for large uploads."""
+
+    def __init__(
+        self,
+        max_workers: int = PROCESS_POOL_WORKERS,
+        threshold_bytes: int = PROCESS_POOL_THRESHOLD_BYTES
+    ):
+        self.max_workers = max(1, max_workers)
+        self.threshold_bytes = threshold_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def should_offload(self, content_size: int) -> bool:
+        """Small inputs are cheaper to handle in-process than to ship."""
+        return self.threshold_bytes > 0 and content_size >= self.threshold_bytes
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: never fork a process that is running an event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+            logger.info(f"Started profiling process pool ({self.max_workers} workers)")
+        return self._executor
+
+    async def parse_and_call(
+        self,
+        file_content: bytes
+    ) -> Tuple[Dict[str, List[Variant]], List[GeneCall], VCFQC]:
+        """Run parsing and gene calling in a worker without blocking the loop."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._get_executor(), _parse_and_call, file_content
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); drop the pool so the next call rebuilds it
+            logger.error("Profiling process pool broken, restarting")
+            self.shutdown()
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Singleton instance
+process_pool_service = ProcessPoolService()
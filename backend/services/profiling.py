@@ -0,0 +1,213 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import pstats
+import shutil
+import cProfile
+import logging
+import tempfile
+import threading
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Profiling is available only when an admin token is configured
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+PROFILE_DIR = os.getenv(
+    'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'pharmaguard-profiles')
+)
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 20))
+PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', 25))
+# Stack depth recorded per allocation
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv('PROFILE_TRACEMALLOC_FRAMES', 10))
+
+PROFILE_HEADER = 'x-profile'
+ADMIN_TOKEN_HEADER = 'x-admin-token'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Constant-time check of a supplied admin token."""
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+class ProfilerBusy(Exception):
+    """Raised when another profiled request is still running."""
+
+
+def _module_for(filename: str) -> str:
+    """Group frames by app module (services.vcf_parser), package or stdlib."""
+    if filename.startswith('~') or filename.startswith('<'):
+        return 'builtins'
+    path = os.path.abspath(filename)
+    if path.startswith(BACKEND_DIR + os.sep) and 'site-packages' not in path:
+        rel = os.path.relpath(path, BACKEND_DIR)
+        return rel[:-3].replace(os.sep, '.') if rel.endswith('.py') else rel
+    if 'site-packages' in path:
+        return path.split('site-packages' + os.sep, 1)[1].split(os.sep, 1)[0]
+    return 'stdlib'
+
+
+def _site(filename: str, module: str, line: int, function: Optional[str] = None) -> str:
+    """App frames as module:line; library frames keep their file name."""
+    if not module.startswith(('services.', 'routes.', 'schemas.')) and module != 'builtins':
+        module = f"{module}/{os.path.basename(filename)}"
+    return f"{module}:{function}:{line}" if function else f"{module}:{line}"
+
+
+def summarize_cpu(profile: cProfile.Profile, top_n: int = PROFILE_TOP_N) -> Dict:
+    stats = pstats.Stats(profile).stats
+    per_module: Dict[str, Dict] = {}
+    functions = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.items():
+        module = _module_for(filename)
+        totals = per_module.setdefault(module, {'module': module, 'self_ms': 0.0, 'calls': 0})
+        totals['self_ms'] += tottime * 1000
+        totals['calls'] += calls
+        functions.append({
+            'function': _site(filename, module, line, function),
+            'calls': calls,
+            'self_ms': round(tottime * 1000, 3),
+            'cumulative_ms': round(cumtime * 1000, 3)
+        })
+
+    functions.sort(key=lambda f: f['self_ms'], reverse=True)
+    modules = sorted(per_module.values(), key=lambda m: m['self_ms'], reverse=True)
+    for module in modules:
+        module['self_ms'] = round(module['self_ms'], 3)
+    return {'by_module': modules, 'top_functions': functions[:top_n]}
+
+
+def summarize_allocations(snapshot: tracemalloc.Snapshot, top_n: int = PROFILE_TOP_N) -> Dict:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    per_module: Dict[str, Dict] = {}
+    sites = []
+    for stat in snapshot.statistics('lineno'):
+        frame = stat.traceback[0]
+        module = _module_for(frame.filename)
+        totals = per_module.setdefault(module, {'module': module, 'kb': 0.0, 'blocks': 0})
+        totals['kb'] += stat.size / 1024
+        totals['blocks'] += stat.count
+        if len(sites) < top_n:
+            sites.append({
+                'site': _site(frame.filename, module, frame.lineno),
+                'kb': round(stat.size / 1024, 2),
+                'blocks': stat.count
+            })
+
+    modules = sorted(per_module.values(), key=lambda m: m['kb'], reverse=True)
+    for module in modules:
+        module['kb'] = round(module['kb'], 2)
+    return {'by_module': modules, 'top_sites': sites}
+
+
+class RequestProfiler:
+    """
+    Runs one callable under cProfile and tracemalloc and keeps the result
+    on disk: a summary (per service module and top frames/allocation
+    sites) plus the raw pstats file for snakeviz/pstats.
+
+    Only one profiled run at a time. cProfile sees the calling thread
+    only; tracemalloc is process-wide, so allocations from concurrent
+    requests can show up in the snapshot.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def run(self, fn: Callable, *args, label: str = '') -> Tuple[object, str]:
+        """Returns (fn's result, profile id)."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("Another request is being profiled")
+        try:
+            was_tracing = tracemalloc.is_tracing()
+            if not was_tracing:
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            elif hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+                tracemalloc.reset_peak()
+            profile = cProfile.Profile()
+
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                result = fn(*args)
+            finally:
+                profile.disable()
+                wall = time.perf_counter() - start
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                if not was_tracing:
+                    tracemalloc.stop()
+
+            profile_id = uuid.uuid4().hex[:12]
+            summary = {
+                'profile_id': profile_id,
+                'label': label,
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'wall_ms': round(wall * 1000, 3),
+                'peak_traced_kb': round(peak / 1024, 2),
+                'cpu': summarize_cpu(profile),
+                'allocations': summarize_allocations(snapshot)
+            }
+            self._save(profile_id, profile, summary)
+            return result, profile_id
+        finally:
+            self._lock.release()
+
+    def _save(self, profile_id: str, profile: cProfile.Profile, summary: Dict):
+        path = os.path.join(self.directory, profile_id)
+        os.makedirs(path, exist_ok=True)
+        profile.dump_stats(os.path.join(path, 'cpu.prof'))
+        with open(os.path.join(path, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=1)
+        self._prune()
+
+    def _prune(self):
+        runs = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory)),
+            key=os.path.getmtime
+        )
+        for old in runs[:-self.keep] if self.keep > 0 else []:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def _path(self, profile_id: str, name: str) -> Optional[str]:
+        # Ids are generated hex; reject anything that could escape the directory
+        if not profile_id.isalnum():
+            return None
+        path = os.path.join(self.directory, profile_id, name)
+        return path if os.path.exists(path) else None
+
+    def get_summary(self, profile_id: str) -> Optional[Dict]:
+        path = self._path(profile_id, 'summary.json')
+        if path is None:
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def stats_path(self, profile_id: str) -> Optional[str]:
+        return self._path(profile_id, 'cpu.prof')
+
+    def list(self) -> List[Dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        summaries = [self.get_summary(name) for name in os.listdir(self.directory)]
+        summaries = [s for s in summaries if s]
+        summaries.sort(key=lambda s: s['created_at'], reverse=True)
+        return [
+            {k: s[k] for k in ('profile_id', 'label', 'created_at', 'wall_ms', 'peak_traced_kb')}
+            for s in summaries
+        ]
+
+
+# Singleton instance
+request_profiler = RequestProfiler()
@@ -0,0 +1,63 @@
+import re
+from typing import Iterable, List, Tuple
+
+# Llama-family tokenizers average about four characters of English per
+# token; close enough for budgeting without shipping a tokenizer
+CHARS_PER_TOKEN = 4
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_WORD = re.compile(r'[a-z0-9*]+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of `text`."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """`text` cut at a word boundary to fit `max_tokens`."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(' ', 1)[0].rstrip(' ,;:') + '…'
+
+
+def select_context(
+    passages: Iterable[Tuple[str, str]],
+    terms: Iterable[str],
+    max_tokens: int
+) -> List[str]:
+    """
+    Most relevant sentences from (source, text) passages within a token
+    budget, as "[source] sentence" lines, best first.
+
+    Sentences are scored by how many of `terms` (gene, drug, alleles...)
+    they mention; sentences mentioning none, and sentences already seen
+    in another passage (search engines often return mirrors of the same
+    guideline text), are dropped.
+    """
+    wanted = {t.lower() for term in terms for t in _WORD.findall(term.lower())}
+    seen = set()
+    scored = []
+    for order, (source, text) in enumerate(passages):
+        for sentence in _SENTENCE_END.split(_WHITESPACE.sub(' ', text).strip()):
+            words = _WORD.findall(sentence.lower())
+            key = ' '.join(words)
+            if not words or key in seen:
+                continue
+            seen.add(key)
+            score = len(wanted.intersection(words))
+            if score:
+                # Ties keep search-rank and reading order
+                scored.append((-score, order, len(scored), source, sentence))
+
+    lines, used = [], 0
+    for _, _, _, source, sentence in sorted(scored):
+        line = f"[{source}] {sentence}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            continue
+        lines.append(line)
+        used += cost
+    return lines
@@ -0,0 +1,229 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from services.analysis_pipeline import AnalysisPipeline
+from services.drug_analysis import DrugAnalyzer, UnsupportedDrugError
+from services.knowledge_base import dependency_digests
+from services.result_store import ResultStore
+from services.vcf_parser import Variant
+from schemas.response_schema import AnalysisResponse, GeneProfile
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; runs there are not coordinated across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Recompute stale stored results in the background when the app starts
+REANALYZE_ON_STARTUP = os.getenv('REANALYZE_ON_STARTUP', 'true').lower() == 'true'
+# Results loaded, recomputed and written per transaction
+REANALYSIS_BATCH_SIZE = int(os.getenv('REANALYSIS_BATCH_SIZE', 500))
+
+
+class Reanalyzer:
+    """
+    Brings stored results up to date after a knowledge base edit.
+
+    Every stored result records the digest of each KB part it read (allele
+    definitions and phenotype table per gene, rules per drug). A run finds
+    the results whose digests differ from the current KB and recomputes
+    only what changed:
+
+    - allele definitions of a gene: that gene is called again from the
+      stored variants (results stored without variants keep their
+      diplotype and only get the phenotype re-derived);
+    - phenotype table of a gene: the phenotype is looked up again;
+    - anything else the drug depends on: the drug rule is re-evaluated.
+
+    Results whose recomputed body is identical are only marked current.
+    Explanations are kept when the (gene, diplotype, phenotype, risk)
+    they explain is unchanged, otherwise taken from the explanation
+    bundle or the template; the LLM is never called.
+    """
+
+    def __init__(self, store: ResultStore, pipeline: AnalysisPipeline, drug_analyzer: DrugAnalyzer):
+        self.store = store
+        self.pipeline = pipeline
+        self.drug_analyzer = drug_analyzer
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._last_run: Optional[Dict] = None
+
+    def start(self) -> bool:
+        """Run in a background thread. False if a run is already in progress."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._run_logged, name='reanalysis', daemon=True)
+            self._thread.start()
+            return True
+
+    def status(self) -> Dict:
+        running = self._thread is not None and self._thread.is_alive()
+        return {'running': running, 'last_run': self._last_run}
+
+    def _run_logged(self):
+        try:
+            self.run()
+        except Exception:
+            logger.exception("Reanalysis failed")
+
+    def run(self, batch_size: int = REANALYSIS_BATCH_SIZE) -> Dict:
+        """Recompute every stale result now. Returns run statistics."""
+        start = time.perf_counter()
+        stats = {
+            'started_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'stale': 0, 'updated': 0, 'unchanged': 0, 'unsupported': 0, 'failed': 0,
+            'without_variants': 0
+        }
+        with self._exclusive() as acquired:
+            if not acquired:
+                logger.info("Reanalysis already running in another process")
+                stats['skipped'] = True
+                return stats
+
+            current = dependency_digests()
+            stale_ids = self.store.stale_result_ids(current)
+            stats['stale'] = len(stale_ids)
+            if stale_ids:
+                logger.info(f"Reanalyzing {len(stale_ids)} results affected by knowledge base changes")
+
+            for offset in range(0, len(stale_ids), batch_size):
+                batch = self.store.load_for_reanalysis(stale_ids[offset:offset + batch_size])
+                # Results of one sample share a variant set and usually the changed genes
+                gene_cache: Dict[Tuple, GeneProfile] = {}
+                updates = []
+                for stored in batch:
+                    try:
+                        response = self._recompute(stored, current, gene_cache, stats)
+                    except UnsupportedDrugError:
+                        # Kept as is but marked current, so it is not retried
+                        # every run; adding the drug back makes it stale again
+                        stats['unsupported'] += 1
+                        logger.warning(
+                            f"Result {stored['result_id']}: drug "
+                            f"'{stored['analysis'].drug}' no longer supported, left as is"
+                        )
+                        updates.append((stored['result_id'], None))
+                        continue
+                    updates.append((stored['result_id'], response))
+                    stats['updated' if response is not None else 'unchanged'] += 1
+                self.store.apply_reanalysis(updates)
+
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+        self._last_run = stats
+        if stats['stale']:
+            logger.info(
+                f"Reanalysis done: {stats['updated']} updated, {stats['unchanged']} unchanged, "
+                f"{stats['unsupported']} no longer supported, {stats['failed']} failed in {stats['seconds']}s"
+            )
+        return stats
+
+    def _recompute(
+        self,
+        stored: Dict,
+        current: Dict[str, str],
+        gene_cache: Dict[Tuple, GeneProfile],
+        stats: Dict
+    ) -> Optional[AnalysisResponse]:
+        """The updated response, or None if recomputing changes nothing."""
+        old: AnalysisResponse = stored['analysis']
+        recorded = stored['dependencies']
+        # Results stored before dependencies were recorded: recompute everything
+        changed = {dep for dep, digest in current.items() if recorded.get(dep, digest) != digest}
+        everything = not recorded
+        variants = stored['variants']
+        if variants is None:
+            stats['without_variants'] += 1
+
+        profile = []
+        for gene_profile in old.pharmacogenomic_profile:
+            gene = gene_profile.gene
+            if variants is not None and (everything or f"star_definitions:{gene}" in changed):
+                key = (stored['variant_set'], gene)
+                if key not in gene_cache:
+                    gene_variants = [Variant.from_dict(v) for v in variants.get(gene, [])]
+                    signature = self.pipeline.genotype_signature(gene, gene_variants)
+                    gene_cache[key] = self.pipeline.gene_profile(
+                        self.pipeline.call_signature(signature, gene_variants), gene_variants
+                    )
+                gene_profile = gene_cache[key]
+            elif everything or f"star_definitions:{gene}" in changed or f"phenotype_tables:{gene}" in changed:
+                phenotype, _ = self.pipeline.phenotype_engine.determine_phenotype(
+                    gene, gene_profile.diplotype, gene_profile.star_allele_1, gene_profile.star_allele_2
+                )
+                gene_profile = gene_profile.model_copy(update={'phenotype': phenotype})
+            profile.append(gene_profile)
+
+        # Only the variant count is read when explanations come from the bundle
+        variants_by_gene = {p.gene: p.detected_variants for p in profile}
+        drug = old.canonical_drug or old.drug
+        new = self.drug_analyzer.analyze_panel(variants_by_gene, profile, [drug], explain=True)[0]
+        new.drug = old.drug
+
+        gene = self.drug_analyzer.drug_engine.get_relevant_gene(drug)
+        if (self._explained(old, gene) == self._explained(new, gene)
+                and old.risk_assessment.risk_label == new.risk_assessment.risk_label):
+            new.llm_generated_explanation = old.llm_generated_explanation
+            new.quality_metrics.llm_explanation_generated = old.quality_metrics.llm_explanation_generated
+
+        # Parse-time QC is kept; only definition coverage depends on the KB
+        qc = old.quality_metrics.vcf_qc
+        if qc is not None and variants is not None:
+            qc = qc.model_copy(update={'uncovered_definition_sites': self.pipeline.uncovered_definition_sites(
+                {gene: (v['rsid'] for v in gene_variants) for gene, gene_variants in variants.items()}
+            )})
+        new.quality_metrics.vcf_qc = qc
+
+        new.patient_id = old.patient_id
+        new.timestamp = old.timestamp
+        if new == old:
+            return None
+        new.timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        return new
+
+    @staticmethod
+    def _explained(response: AnalysisResponse, gene: str) -> Tuple:
+        for p in response.pharmacogenomic_profile:
+            if p.gene == gene:
+                return p.diplotype, p.phenotype
+        return None, None
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold a lock file next to the store so forked workers don't all run it."""
+        if fcntl is None:
+            yield True
+            return
+        with open(f"{self.store.path}.reanalysis.lock", 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _default_reanalyzer() -> Reanalyzer:
+    from services.drug_engine import DrugEngine
+    from services.explanation_bundle import explanation_bundle
+    from services.result_store import result_store
+
+    pipeline = AnalysisPipeline()
+    drug_analyzer = DrugAnalyzer(
+        DrugEngine(), pipeline.phenotype_engine, explanation_bundle=explanation_bundle
+    )
+    return Reanalyzer(result_store, pipeline, drug_analyzer)
+
+
+# Singleton instance
+reanalyzer = _default_reanalyzer()
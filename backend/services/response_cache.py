@@ -0,0 +1,97 @@
+import os
+import hmac
+import hashlib
+import logging
+import secrets
+from typing import List, NamedTuple, Optional
+
+from services.cache_backend import get_cache
+from services.knowledge_base import knowledge_base_version
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+# Total size of cached response bodies
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Responses hold patient data, so shared caches must revalidate and not store by default
+RESPONSE_CACHE_CONTROL = os.getenv('RESPONSE_CACHE_CONTROL', 'private, no-cache')
+# Keys are an HMAC under this secret, so a key (and the cached analysis at
+# /api/analyze/cached/{key}) cannot be derived from the VCF. Random per
+# process unless set; workers sharing CACHE_BACKEND=sqlite need the same
+# value to share entries (serve.py workers inherit the master's)
+RESPONSE_CACHE_SECRET = (os.getenv('RESPONSE_CACHE_SECRET') or secrets.token_hex(32)).encode()
+
+# Analysis modes that produce different bodies for the same inputs
+MODE_FULL = 'full'
+MODE_DETERMINISTIC = 'deterministic'
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    body: bytes
+
+
+def cache_key(file_digest: str, drugs: Optional[List[str]], mode: str, sample_id: str) -> str:
+    """
+    Key of one analysis: upload digest, requested drugs (as requested,
+    since responses echo them, in request order), mode and the sample it is stored under, plus the
+    knowledge base version so KB edits never serve stale results. The
+    same VCF uploaded for another sample misses, so it is analyzed and
+    stored for that sample too. Keyed with RESPONSE_CACHE_SECRET, so only
+    the server can compute it.
+    """
+    drug_part = 'all' if drugs is None else ','.join(drugs)
+    raw = '|'.join((file_digest, drug_part, mode, sample_id, knowledge_base_version()))
+    return hmac.new(RESPONSE_CACHE_SECRET, raw.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag: a digest of the exact body bytes."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(','))
+    return any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in candidates)
+
+
+class ResponseCache:
+    """
+    Serialized analysis responses on the shared cache backend, bounded by
+    total size. Entries are stored as ETag + newline + body.
+
+    A cached body is returned byte for byte (including its patient_id
+    and timestamp), so its ETag stays valid for as long as it is cached.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.enabled = enabled
+        self._cache = get_cache('responses', max_bytes)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        if not self.enabled:
+            return None
+        value = self._cache.get(key)
+        if value is None:
+            return None
+        etag, body = value.split(b'\n', 1)
+        return CachedResponse(etag.decode(), body)
+
+    def put(self, key: str, body: bytes) -> str:
+        """Cache a body and return its ETag (computed even when not cached)."""
+        etag = make_etag(body)
+        if self.enabled:
+            self._cache.set(key, etag.encode() + b'\n' + body)
+        return etag
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+# Singleton instance
+response_cache = ResponseCache()
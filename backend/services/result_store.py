@@ -0,0 +1,633 @@
+import os
+import json
+import queue
+import hashlib
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from schemas.response_schema import AnalysisResponse
+from services.knowledge_base import result_dependencies
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_ENABLED = os.getenv('RESULT_STORE_ENABLED', 'true').lower() == 'true'
+RESULT_STORE_PATH = os.getenv(
+    'RESULT_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'results.db')
+)
+# Writes are grouped into one transaction per batch, or per flush interval
+RESULT_STORE_BATCH_SIZE = int(os.getenv('RESULT_STORE_BATCH_SIZE', 100))
+RESULT_STORE_FLUSH_INTERVAL = float(os.getenv('RESULT_STORE_FLUSH_INTERVAL', 0.5))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    sample_id   TEXT NOT NULL,
+    patient_id  TEXT NOT NULL,
+    drug        TEXT NOT NULL,
+    risk_label  TEXT NOT NULL,
+    severity    TEXT NOT NULL,
+    created_at  TEXT NOT NULL,
+    body        TEXT NOT NULL,
+    variant_set TEXT REFERENCES variant_sets(digest)
+);
+CREATE TABLE IF NOT EXISTS result_genes (
+    result_id   INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+    gene        TEXT NOT NULL,
+    diplotype   TEXT NOT NULL,
+    phenotype   TEXT NOT NULL,
+    PRIMARY KEY (result_id, gene)
+) WITHOUT ROWID;
+-- Parsed variants a result was computed from, stored once per distinct set
+CREATE TABLE IF NOT EXISTS variant_sets (
+    digest      TEXT PRIMARY KEY,
+    variants    TEXT NOT NULL
+) WITHOUT ROWID;
+-- Knowledge base parts (see knowledge_base.dependency_digests) each result read
+CREATE TABLE IF NOT EXISTS result_dependencies (
+    result_id   INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+    dependency  TEXT NOT NULL,
+    digest      TEXT NOT NULL,
+    PRIMARY KEY (result_id, dependency)
+) WITHOUT ROWID;
+-- Each sample's current calls (from its latest result) and the cohort
+-- counters derived from them, kept up to date by every write
+CREATE TABLE IF NOT EXISTS sample_genes (
+    sample_id   TEXT NOT NULL,
+    gene        TEXT NOT NULL,
+    result_id   INTEGER NOT NULL,
+    diplotype   TEXT NOT NULL,
+    phenotype   TEXT NOT NULL,
+    PRIMARY KEY (sample_id, gene)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sample_drugs (
+    sample_id   TEXT NOT NULL,
+    drug        TEXT NOT NULL,
+    result_id   INTEGER NOT NULL,
+    risk_label  TEXT NOT NULL,
+    PRIMARY KEY (sample_id, drug)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stat_gene_calls (
+    gene        TEXT NOT NULL,
+    diplotype   TEXT NOT NULL,
+    phenotype   TEXT NOT NULL,
+    count       INTEGER NOT NULL,
+    PRIMARY KEY (gene, diplotype, phenotype)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stat_drug_risks (
+    drug        TEXT NOT NULL,
+    risk_label  TEXT NOT NULL,
+    count       INTEGER NOT NULL,
+    PRIMARY KEY (drug, risk_label)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stat_totals (
+    name        TEXT PRIMARY KEY,
+    count       INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_results_sample ON results(sample_id, id);
+CREATE INDEX IF NOT EXISTS idx_results_drug ON results(drug, id);
+CREATE INDEX IF NOT EXISTS idx_results_risk ON results(risk_label, id);
+CREATE INDEX IF NOT EXISTS idx_result_genes_diplotype ON result_genes(gene, diplotype, result_id);
+CREATE INDEX IF NOT EXISTS idx_result_genes_phenotype ON result_genes(gene, phenotype, result_id);
+CREATE INDEX IF NOT EXISTS idx_result_genes_any_diplotype ON result_genes(diplotype, result_id);
+CREATE INDEX IF NOT EXISTS idx_result_genes_any_phenotype ON result_genes(phenotype, result_id);
+CREATE INDEX IF NOT EXISTS idx_result_dependencies ON result_dependencies(dependency, digest, result_id);
+"""
+
+# Counter table -> key columns (each also has a `count` column)
+STAT_TABLES = {
+    'stat_gene_calls': ('gene', 'diplotype', 'phenotype'),
+    'stat_drug_risks': ('drug', 'risk_label'),
+    'stat_totals': ('name',)
+}
+
+# Exact cohort statistics straight from the results: each sample counts
+# once per gene and per drug, with the calls of its latest result
+EXACT_GENE_CALLS = """
+SELECT g.gene, g.diplotype, g.phenotype, COUNT(*) FROM result_genes g
+JOIN (
+    SELECT r.sample_id, lg.gene, MAX(lg.result_id) AS result_id
+    FROM result_genes lg JOIN results r ON r.id = lg.result_id
+    GROUP BY r.sample_id, lg.gene
+) latest ON latest.result_id = g.result_id AND latest.gene = g.gene
+GROUP BY g.gene, g.diplotype, g.phenotype
+"""
+EXACT_DRUG_RISKS = """
+SELECT r.drug, r.risk_label, COUNT(*) FROM results r
+JOIN (SELECT MAX(id) AS id FROM results GROUP BY sample_id, drug) latest ON latest.id = r.id
+GROUP BY r.drug, r.risk_label
+"""
+EXACT_TOTALS = "SELECT 'samples', COUNT(DISTINCT sample_id) FROM results UNION ALL SELECT 'results', COUNT(*) FROM results"
+
+# Sentinel put on the queue to stop the writer thread
+_STOP = object()
+
+
+class ResultStore:
+    """
+    SQLite-backed store of AnalysisResponse objects.
+
+    Requests only enqueue; a background writer thread drains the queue and
+    commits in batches, so the request path never waits on disk.
+    """
+
+    def __init__(self, path: str = RESULT_STORE_PATH, enabled: bool = RESULT_STORE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        if self.enabled:
+            with closing(self._connect()) as conn:
+                self._migrate(conn)
+                had_stats = self._has_table(conn, 'stat_totals')
+                conn.executescript(SCHEMA)
+                if not had_stats:
+                    # Results stored before counters existed
+                    with conn:
+                        self._rebuild_stats(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Bring databases created by older versions up to SCHEMA."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+        if columns and 'variant_set' not in columns:
+            conn.execute("ALTER TABLE results ADD COLUMN variant_set TEXT REFERENCES variant_sets(digest)")
+
+    def _has_table(self, conn: sqlite3.Connection, name: str) -> bool:
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone() is not None
+
+    # ── Writes ─────────────────────────────────────────────────────────────
+
+    def submit(self, sample_id: str, responses: List[AnalysisResponse],
+               variants_by_gene: Optional[Mapping[str, List]] = None):
+        """
+        Queue responses for storage. Never blocks on the database.
+        `variants_by_gene` (the parsed input) lets the results be recomputed
+        after allele definition changes; without it only phenotype and
+        drug rule changes can be applied to them.
+        """
+        if not self.enabled or not responses:
+            return
+        self._ensure_writer()
+        self._queue.put((sample_id, responses, variants_by_gene))
+
+    def flush(self):
+        """Block until everything queued so far is committed."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        """Flush pending writes and stop the writer thread."""
+        with self._lock:
+            writer = self._writer
+            self._writer = None
+        if writer is not None:
+            self._queue.put(_STOP)
+            writer.join()
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_loop, name='result-store-writer', daemon=True
+                )
+                self._writer.start()
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    self._queue.task_done()
+                    return
+                batch = [item]
+                # Gather whatever else arrives within the flush interval
+                stop = False
+                while len(batch) < RESULT_STORE_BATCH_SIZE:
+                    try:
+                        item = self._queue.get(timeout=RESULT_STORE_FLUSH_INTERVAL)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+
+                try:
+                    self._write_batch(conn, batch)
+                except Exception as e:
+                    logger.error(f"Result store write failed ({len(batch)} items): {e}")
+                finally:
+                    for _ in range(len(batch) + (1 if stop else 0)):
+                        self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Tuple]):
+        created_at = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        with conn:
+            for sample_id, responses, variants_by_gene in batch:
+                variant_set = self._put_variant_set(conn, variants_by_gene)
+                for response in responses:
+                    cursor = conn.execute(
+                        "INSERT INTO results "
+                        "(sample_id, patient_id, drug, risk_label, severity, created_at, body, variant_set) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            sample_id,
+                            response.patient_id,
+                            (response.canonical_drug or response.drug).lower(),
+                            response.risk_assessment.risk_label,
+                            response.risk_assessment.severity,
+                            created_at,
+                            response.model_dump_json(),
+                            variant_set
+                        )
+                    )
+                    self._insert_details(conn, cursor.lastrowid, response)
+                    self._count_result(conn, sample_id, cursor.lastrowid, response)
+
+    def _put_variant_set(self, conn: sqlite3.Connection, variants_by_gene: Optional[Mapping[str, List]]) -> Optional[str]:
+        if variants_by_gene is None:
+            return None
+        variants = json.dumps(
+            {gene: [v.to_dict() for v in variants] for gene, variants in sorted(variants_by_gene.items())},
+            separators=(',', ':')
+        )
+        digest = hashlib.sha256(variants.encode()).hexdigest()[:32]
+        conn.execute("INSERT OR IGNORE INTO variant_sets (digest, variants) VALUES (?, ?)", (digest, variants))
+        return digest
+
+    def _insert_details(self, conn: sqlite3.Connection, result_id: int, response: AnalysisResponse):
+        """Gene profile rows and knowledge base dependencies of one result."""
+        conn.executemany(
+            "INSERT INTO result_genes (result_id, gene, diplotype, phenotype) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (result_id, p.gene, p.diplotype, p.phenotype)
+                for p in response.pharmacogenomic_profile
+            ]
+        )
+        self._record_dependencies(conn, result_id, result_dependencies(
+            response.canonical_drug or response.drug, [p.gene for p in response.pharmacogenomic_profile]
+        ))
+
+    def _record_dependencies(self, conn: sqlite3.Connection, result_id: int, dependencies: Mapping[str, str]):
+        conn.execute("DELETE FROM result_dependencies WHERE result_id = ?", (result_id,))
+        conn.executemany(
+            "INSERT INTO result_dependencies (result_id, dependency, digest) VALUES (?, ?, ?)",
+            [(result_id, dependency, digest) for dependency, digest in dependencies.items()]
+        )
+
+    # ── Reanalysis ─────────────────────────────────────────────────────────
+
+    def stale_result_ids(self, current: Mapping[str, str]) -> List[int]:
+        """
+        Ids of results whose recorded dependencies differ from `current`
+        (dependency -> digest), plus results stored before dependencies
+        were recorded. Each dependency is two index range scans that skip
+        the results already on the current digest, so the cost follows
+        the number of stale results rather than the size of the store.
+        """
+        if not self.enabled:
+            return []
+        stale = set()
+        with closing(self._connect()) as conn:
+            for dependency, digest in current.items():
+                for op in ('<', '>'):
+                    stale.update(row[0] for row in conn.execute(
+                        f"SELECT result_id FROM result_dependencies "
+                        f"WHERE dependency = ? AND digest {op} ?",
+                        (dependency, digest)
+                    ))
+            stale.update(row[0] for row in conn.execute(
+                "SELECT id FROM results r WHERE NOT EXISTS "
+                "(SELECT 1 FROM result_dependencies d WHERE d.result_id = r.id)"
+            ))
+        return sorted(stale)
+
+    def load_for_reanalysis(self, result_ids: List[int]) -> List[Dict]:
+        """
+        Stored responses with what is needed to recompute them: recorded
+        dependencies and the parsed variants (None for results stored
+        without them).
+        """
+        if not self.enabled or not result_ids:
+            return []
+        placeholders = ','.join('?' * len(result_ids))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT r.id, r.body, r.variant_set, v.variants FROM results r "
+                f"LEFT JOIN variant_sets v ON v.digest = r.variant_set "
+                f"WHERE r.id IN ({placeholders}) ORDER BY r.id",
+                result_ids
+            ).fetchall()
+            dependencies: Dict[int, Dict[str, str]] = {}
+            for result_id, dependency, digest in conn.execute(
+                f"SELECT result_id, dependency, digest FROM result_dependencies "
+                f"WHERE result_id IN ({placeholders})",
+                result_ids
+            ):
+                dependencies.setdefault(result_id, {})[dependency] = digest
+
+        return [
+            {
+                'result_id': result_id,
+                'analysis': AnalysisResponse.model_validate_json(body),
+                'dependencies': dependencies.get(result_id, {}),
+                'variant_set': variant_set,
+                'variants': json.loads(variants) if variants is not None else None
+            }
+            for result_id, body, variant_set, variants in rows
+        ]
+
+    def apply_reanalysis(self, updates: Iterable[Tuple[int, Optional[AnalysisResponse]]]):
+        """
+        Store recomputed results in one transaction: (result_id, response)
+        replaces the result; (result_id, None) marks it current without
+        changing it.
+        """
+        if not self.enabled:
+            return
+        with closing(self._connect()) as conn, conn:
+            for result_id, response in updates:
+                if response is None:
+                    row = conn.execute("SELECT body FROM results WHERE id = ?", (result_id,)).fetchone()
+                    if row is None:
+                        continue
+                    stored = json.loads(row[0])
+                    self._record_dependencies(conn, result_id, result_dependencies(
+                        stored.get('canonical_drug') or stored['drug'],
+                        [p['gene'] for p in stored['pharmacogenomic_profile']]
+                    ))
+                    continue
+                conn.execute(
+                    "UPDATE results SET risk_label = ?, severity = ?, body = ? WHERE id = ?",
+                    (
+                        response.risk_assessment.risk_label,
+                        response.risk_assessment.severity,
+                        response.model_dump_json(),
+                        result_id
+                    )
+                )
+                conn.execute("DELETE FROM result_genes WHERE result_id = ?", (result_id,))
+                self._insert_details(conn, result_id, response)
+                sample_id = conn.execute(
+                    "SELECT sample_id FROM results WHERE id = ?", (result_id,)
+                ).fetchone()[0]
+                self._count_result(conn, sample_id, result_id, response, new=False)
+
+    # ── Cohort statistics ──────────────────────────────────────────────────
+
+    def _count_result(self, conn: sqlite3.Connection, sample_id: str, result_id: int,
+                      response: AnalysisResponse, new: bool = True):
+        """
+        Apply one stored (or updated) result to the counters. A sample is
+        counted once per gene and drug, by its latest result: a newer
+        result moves the sample's count from its old call to the new one,
+        an update to an older result changes nothing.
+        """
+        drug = (response.canonical_drug or response.drug).lower()
+        risk_label = response.risk_assessment.risk_label
+        row = conn.execute(
+            "SELECT result_id, risk_label FROM sample_drugs WHERE sample_id = ? AND drug = ?",
+            (sample_id, drug)
+        ).fetchone()
+        if new:
+            self._add_count(conn, 'stat_totals', ('results',), 1)
+            if conn.execute("SELECT 1 FROM sample_drugs WHERE sample_id = ? LIMIT 1", (sample_id,)).fetchone() is None:
+                self._add_count(conn, 'stat_totals', ('samples',), 1)
+        if row is None or row[0] <= result_id:
+            if row is not None:
+                self._add_count(conn, 'stat_drug_risks', (drug, row[1]), -1)
+            self._add_count(conn, 'stat_drug_risks', (drug, risk_label), 1)
+            conn.execute(
+                "INSERT OR REPLACE INTO sample_drugs (sample_id, drug, result_id, risk_label) VALUES (?, ?, ?, ?)",
+                (sample_id, drug, result_id, risk_label)
+            )
+
+        for p in response.pharmacogenomic_profile:
+            row = conn.execute(
+                "SELECT result_id, diplotype, phenotype FROM sample_genes WHERE sample_id = ? AND gene = ?",
+                (sample_id, p.gene)
+            ).fetchone()
+            if row is not None and row[0] > result_id:
+                continue
+            if row is not None:
+                self._add_count(conn, 'stat_gene_calls', (p.gene, row[1], row[2]), -1)
+            self._add_count(conn, 'stat_gene_calls', (p.gene, p.diplotype, p.phenotype), 1)
+            conn.execute(
+                "INSERT OR REPLACE INTO sample_genes (sample_id, gene, result_id, diplotype, phenotype) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sample_id, p.gene, result_id, p.diplotype, p.phenotype)
+            )
+
+    def _add_count(self, conn: sqlite3.Connection, table: str, key: tuple, delta: int):
+        columns = STAT_TABLES[table]
+        where = " AND ".join(f"{c} = ?" for c in columns)
+        cursor = conn.execute(f"UPDATE {table} SET count = count + ? WHERE {where}", (delta,) + key)
+        if cursor.rowcount == 0:
+            conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}, count) VALUES ({', '.join('?' * len(columns))}, ?)",
+                key + (delta,)
+            )
+        elif delta < 0:
+            conn.execute(f"DELETE FROM {table} WHERE {where} AND count <= 0", key)
+
+    def _rebuild_stats(self, conn: sqlite3.Connection):
+        """Recompute the per-sample calls and counters from the results."""
+        for table in ('sample_genes', 'sample_drugs') + tuple(STAT_TABLES):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            "INSERT INTO sample_genes (sample_id, gene, result_id, diplotype, phenotype) "
+            "SELECT r.sample_id, g.gene, g.result_id, g.diplotype, g.phenotype FROM result_genes g "
+            "JOIN results r ON r.id = g.result_id "
+            "WHERE g.result_id = (SELECT MAX(lg.result_id) FROM result_genes lg "
+            "JOIN results lr ON lr.id = lg.result_id WHERE lr.sample_id = r.sample_id AND lg.gene = g.gene)"
+        )
+        conn.execute(
+            "INSERT INTO sample_drugs (sample_id, drug, result_id, risk_label) "
+            "SELECT r.sample_id, r.drug, r.id, r.risk_label FROM results r "
+            "JOIN (SELECT MAX(id) AS id FROM results GROUP BY sample_id, drug) latest ON latest.id = r.id"
+        )
+        conn.execute(
+            "INSERT INTO stat_gene_calls (gene, diplotype, phenotype, count) "
+            "SELECT gene, diplotype, phenotype, COUNT(*) FROM sample_genes GROUP BY gene, diplotype, phenotype"
+        )
+        conn.execute(
+            "INSERT INTO stat_drug_risks (drug, risk_label, count) "
+            "SELECT drug, risk_label, COUNT(*) FROM sample_drugs GROUP BY drug, risk_label"
+        )
+        conn.execute(f"INSERT INTO stat_totals (name, count) {EXACT_TOTALS}")
+
+    def stats(self, exact: bool = False) -> Dict:
+        """
+        Cohort statistics: diplotype and phenotype frequencies per gene and
+        risk label distribution per drug, counting each sample once by its
+        latest result. Read from the maintained counters (a few hundred
+        rows whatever the number of results); `exact` recomputes them from
+        the results instead, for audits.
+        """
+        if not self.enabled:
+            return _format_stats([], [], [])
+        with closing(self._connect()) as conn:
+            if exact:
+                queries = (EXACT_GENE_CALLS, EXACT_DRUG_RISKS, EXACT_TOTALS)
+            else:
+                queries = (
+                    "SELECT gene, diplotype, phenotype, count FROM stat_gene_calls",
+                    "SELECT drug, risk_label, count FROM stat_drug_risks",
+                    "SELECT name, count FROM stat_totals"
+                )
+            # One read transaction, so the three queries see the same writes
+            with conn:
+                conn.execute("BEGIN")
+                rows = [conn.execute(q).fetchall() for q in queries]
+        return _format_stats(*rows)
+
+    def rebuild_stats(self):
+        """Reset the counters to the exact statistics."""
+        if not self.enabled:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._rebuild_stats(conn)
+
+    # ── Reads ──────────────────────────────────────────────────────────────
+
+    def query(
+        self,
+        sample_id: Optional[str] = None,
+        gene: Optional[str] = None,
+        diplotype: Optional[str] = None,
+        phenotype: Optional[str] = None,
+        drug: Optional[str] = None,
+        risk_label: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[int] = None
+    ) -> Tuple[List[Dict], Optional[int]]:
+        """
+        Page through stored results, newest first.
+
+        gene/diplotype/phenotype match a single gene profile row of the
+        result (e.g. gene=CYP2C19 & phenotype=PM). `cursor` is the last
+        result id of the previous page (keyset pagination, no OFFSET scans).
+
+        Returns: (rows, next_cursor)
+        """
+        if not self.enabled:
+            return [], None
+
+        sql = ["SELECT r.id, r.sample_id, r.created_at, r.body FROM results r"]
+        where, params = [], []
+
+        if gene or diplotype or phenotype:
+            # EXISTS rather than a join: a result with several matching gene
+            # rows is still returned once, so `limit` and `cursor` hold
+            gene_where = ["g.result_id = r.id"]
+            for column, value in (('gene', gene), ('diplotype', diplotype), ('phenotype', phenotype)):
+                if value:
+                    gene_where.append(f"g.{column} = ?")
+                    params.append(value)
+            where.append(f"EXISTS (SELECT 1 FROM result_genes g WHERE {' AND '.join(gene_where)})")
+
+        for column, value in (('sample_id', sample_id), ('risk_label', risk_label)):
+            if value:
+                where.append(f"r.{column} = ?")
+                params.append(value)
+        if drug:
+            where.append("r.drug = ?")
+            params.append(drug.lower())
+        if cursor is not None:
+            where.append("r.id < ?")
+            params.append(cursor)
+
+        if where:
+            sql.append("WHERE " + " AND ".join(where))
+        sql.append("ORDER BY r.id DESC LIMIT ?")
+        params.append(limit + 1)
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(" ".join(sql), params).fetchall()
+
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [self._row_to_dict(row) for row in rows[:limit]], next_cursor
+
+    def get(self, result_id: int) -> Optional[Dict]:
+        """Fetch one stored result by id."""
+        if not self.enabled:
+            return None
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, sample_id, created_at, body FROM results WHERE id = ?",
+                (result_id,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def iter_results(self, batch_size: int = 500) -> Iterator[Dict]:
+        """Stream every stored result in id order without loading them all."""
+        if not self.enabled:
+            return
+        last_id = 0
+        with closing(self._connect()) as conn:
+            while True:
+                rows = conn.execute(
+                    "SELECT id, sample_id, created_at, body FROM results "
+                    "WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+                if not rows:
+                    return
+                for row in rows:
+                    yield self._row_to_dict(row)
+                last_id = rows[-1][0]
+
+    def _row_to_dict(self, row: tuple) -> Dict:
+        result_id, sample_id, created_at, body = row
+        return {
+            'result_id': result_id,
+            'sample_id': sample_id,
+            'stored_at': created_at,
+            'analysis': json.loads(body)
+        }
+
+
+def _format_stats(gene_rows: List[tuple], drug_rows: List[tuple], total_rows: List[tuple]) -> Dict:
+    totals = dict(total_rows)
+    genes: Dict[str, Dict] = {}
+    for gene, diplotype, phenotype, count in gene_rows:
+        entry = genes.setdefault(gene, {'samples': 0, 'diplotypes': {}, 'phenotypes': {}})
+        entry['samples'] += count
+        entry['diplotypes'][diplotype] = entry['diplotypes'].get(diplotype, 0) + count
+        entry['phenotypes'][phenotype] = entry['phenotypes'].get(phenotype, 0) + count
+    drugs: Dict[str, Dict] = {}
+    for drug, risk_label, count in drug_rows:
+        entry = drugs.setdefault(drug, {'samples': 0, 'risk_labels': {}})
+        entry['samples'] += count
+        entry['risk_labels'][risk_label] = count
+    return {
+        'samples': totals.get('samples', 0),
+        'results': totals.get('results', 0),
+        'genes': {gene: genes[gene] for gene in sorted(genes)},
+        'drugs': {drug: drugs[drug] for drug in sorted(drugs)}
+    }
+
+
+# Singleton instance
+result_store = ResultStore()
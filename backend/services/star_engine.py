@@ -1,8 +1,9 @@
-import json
-import os
-from typing import List, Dict
+from typing import List, Dict, FrozenSet, Optional, Tuple
 import logging
 
+from services.knowledge_base import freeze, load_frozen
+from services.vcf_parser import Variant
+
 logger = logging.getLogger(__name__)
 
 
@@ -10,21 +11,78 @@ class StarAlleleEngine:
     def __init__(self, use_api=False):
         # Always use static JSON — no runtime API calls
         self.star_definitions = self._load_from_static_json()
+        self.variant_index = self._build_variant_index()
 
     def _load_from_static_json(self) -> Dict:
-        """Load star allele definitions from static JSON file."""
-        data_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)),
-            'data',
-            'star_definitions.json'
-        )
-        with open(data_path, 'r') as f:
-            return json.load(f)
+        """Star allele definitions from static JSON (frozen, shared per process)."""
+        return load_frozen('star_definitions.json')
+
+    def _build_variant_index(self) -> Dict[str, Dict[Tuple[str, str], Tuple[str, ...]]]:
+        """
+        Inverted index: gene -> (rsid, alt) -> alleles defined by that variant.
+        Lets candidate lookup touch only alleles the sample can explain.
+        """
+        index = {}
+        for gene, definitions in self.star_definitions.items():
+            gene_index = {}
+            for star_allele, definition in definitions.items():
+                for def_variant in definition:
+                    site = (def_variant['rsid'], def_variant['alt'])
+                    gene_index.setdefault(site, []).append(star_allele)
+            index[gene] = {site: tuple(alleles) for site, alleles in gene_index.items()}
+        return freeze(index)
+
+    def get_candidate_alleles(
+        self,
+        gene: str,
+        variants: List[Variant]
+    ) -> Optional[Dict[str, FrozenSet[Tuple[str, str]]]]:
+        """
+        Return every allele whose defining variants are ALL carried by the
+        sample, mapped to its set of (rsid, alt) sites.
+
+        Only alleles reachable from a carried variant through the inverted
+        index are checked. Returns None when the gene has no definitions or
+        the VCF supplies INFO STAR tags (those are used as-is).
+        """
+        if gene not in self.variant_index or self._get_star_from_info(variants):
+            return None
+        return self._match_candidates(gene, variants)
+
+    def _match_candidates(
+        self,
+        gene: str,
+        variants: List[Variant]
+    ) -> Dict[str, FrozenSet[Tuple[str, str]]]:
+        """Fully-matching alleles, found through the inverted index."""
+        gene_index = self.variant_index[gene]
+
+        # Accept any genotype that carries the alt allele
+        carried = set()
+        for variant in variants:
+            gt = variant.genotype
+            if '1' in gt or '2' in gt:
+                carried.add((variant.rsid, variant.alt))
+
+        hits: Dict[str, int] = {}
+        for site in carried:
+            for star_allele in gene_index.get(site, ()):
+                hits[star_allele] = hits.get(star_allele, 0) + 1
+
+        gene_definitions = self.star_definitions[gene]
+        candidates = {}
+        for star_allele, count in hits.items():
+            definition = gene_definitions[star_allele]
+            if count >= len(definition):
+                sites = frozenset((d['rsid'], d['alt']) for d in definition)
+                if sites <= carried:
+                    candidates[star_allele] = sites
+        return candidates
 
     def determine_star_alleles(
         self,
         gene: str,
-        variants: List[Dict]
+        variants: List[Variant]
     ) -> List[str]:
         """
         Determine star alleles for a gene based on variants.
@@ -52,10 +110,10 @@ class StarAlleleEngine:
         gene_definitions = self.star_definitions[gene]
 
         # Collect all fully-matching alleles with their specificity score
-        matches: List[tuple] = []  # (allele_name, variant_count)
-        for star_allele, definition in gene_definitions.items():
-            if self._matches_star_definition(variants, definition):
-                matches.append((star_allele, len(definition)))
+        matches: List[tuple] = [  # (allele_name, variant_count)
+            (star_allele, len(gene_definitions[star_allele]))
+            for star_allele in self._match_candidates(gene, variants)
+        ]
 
         if not matches:
             return ["*1"]
@@ -67,44 +125,20 @@ class StarAlleleEngine:
         )
         return best_alleles
 
-    def _get_star_from_info(self, variants: List[Dict]) -> List[str]:
+    def _get_star_from_info(self, variants: List[Variant]) -> List[str]:
         """Extract star alleles from INFO STAR tag if present."""
         stars = set()
         for variant in variants:
-            if variant.get('star'):
-                stars.add(variant['star'])
+            if variant.star:
+                stars.add(variant.star)
         if stars:
             return sorted(list(stars))
         return []
 
-    def _matches_star_definition(
-        self,
-        variants: List[Dict],
-        definition: List[Dict]
-    ) -> bool:
-        """
-        Return True only if ALL variants in the definition are present
-        in the patient variants with a non-reference genotype (GT contains
-        at least one copy of ALT allele).
-        """
-        for def_variant in definition:
-            found = False
-            for variant in variants:
-                if (variant['rsid'] == def_variant['rsid'] and
-                        variant['alt'] == def_variant['alt']):
-                    gt = variant.get('genotype', '')
-                    # Accept any genotype that carries the alt allele
-                    if '1' in gt or '2' in gt:
-                        found = True
-                        break
-            if not found:
-                return False
-        return True
-
     def get_alleles_from_genotype(
         self,
         gene: str,
-        variants: List[Dict]
+        variants: List[Variant]
     ) -> Dict[str, any]:
         """
         Get complete allele information including genotype context.
@@ -119,11 +153,11 @@ class StarAlleleEngine:
             'reference_count': self._count_reference_alleles(variants)
         }
 
-    def _count_reference_alleles(self, variants: List[Dict]) -> int:
+    def _count_reference_alleles(self, variants: List[Variant]) -> int:
         """Count reference alleles based on genotypes."""
         ref_count = 0
         for variant in variants:
-            gt = variant.get('genotype', '')
+            gt = variant.genotype
             if gt == '0/0':
                 ref_count += 2
             elif gt in ['0/1', '1/0']:
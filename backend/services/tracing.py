@@ -0,0 +1,259 @@
+import os
+import json
+import heapq
+import itertools
+import random
+import secrets
+import threading
+import time
+import logging
+import contextvars
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests traced; 0 disables tracing entirely
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.0))
+# 'memory' keeps recent traces in-process; 'file' also appends them as JSON lines
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'memory')
+TRACE_FILE = os.getenv(
+    'TRACE_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'traces.jsonl')
+)
+TRACE_MEMORY_LIMIT = int(os.getenv('TRACE_MEMORY_LIMIT', 200))
+TRACE_SLOWEST_LIMIT = int(os.getenv('TRACE_SLOWEST_LIMIT', 50))
+
+TRACE_ID_HEADER = b'x-trace-id'
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('pharmaguard_span', default=None)
+
+
+class _NullSpan:
+    """Stand-in when the request is not sampled: every operation is a no-op."""
+
+    __slots__ = ()
+    trace_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    __slots__ = ('trace_id', 'spans', 'start')
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.start = time.time()
+
+
+class Span:
+    __slots__ = ('tracer', 'trace', 'span_id', 'parent_id', 'name', 'attributes',
+                 'start', 'duration', 'error', 'is_root', '_t0', '_token')
+
+    def __init__(self, tracer: "Tracer", trace: Trace, name: str,
+                 parent_id: Optional[str], attributes: Dict, is_root: bool = False):
+        self.tracer = tracer
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.duration = None
+        self.error = None
+        self.is_root = is_root
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._t0
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        # list.append is atomic, so spans may end on worker threads
+        self.trace.spans.append(self)
+        if self.is_root:
+            self.tracer._finish(self)
+        return False
+
+    def to_dict(self) -> Dict:
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'offset_ms': round((self.start - self.trace.start) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+
+class Tracer:
+    """
+    Minimal in-process tracer. A sampled request gets a root span; code
+    anywhere below it opens child spans with `tracer.span(...)`, which
+    find their parent through a context variable (asyncio tasks inherit
+    it; thread-pool work needs `bind_context`). Outside a sampled trace
+    `span()` returns a shared no-op object, so instrumentation costs one
+    context variable lookup.
+    """
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, exporter: str = TRACE_EXPORTER,
+                 path: str = TRACE_FILE):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.path = path
+        self._recent = deque(maxlen=TRACE_MEMORY_LIMIT)
+        self._slowest: List = []
+        # Tiebreaker so equal durations and trace ids never compare records
+        self._finished = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes):
+        """
+        Root span for one request, or NULL_SPAN if not sampled. An incoming
+        W3C `traceparent` keeps the caller's trace id, and its sampled
+        flag forces sampling.
+        """
+        trace_id, parent_id, sampled = None, None, False
+        if traceparent:
+            parts = traceparent.strip().split('-')
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                trace_id, parent_id = parts[1], parts[2]
+                sampled = parts[3] == '01'
+        if not sampled and not (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return NULL_SPAN
+        trace = Trace(trace_id or secrets.token_hex(16))
+        return Span(self, trace, name, parent_id, attributes, is_root=True)
+
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            return NULL_SPAN
+        return Span(self, parent.trace, name, parent.span_id, attributes)
+
+    def current_span(self):
+        return _current_span.get() or NULL_SPAN
+
+    def traceparent(self) -> Optional[str]:
+        """Header value for propagating the current trace to outgoing calls."""
+        span = _current_span.get()
+        if span is None:
+            return None
+        return f"00-{span.trace_id}-{span.span_id}-01"
+
+    def _finish(self, root: Span):
+        trace = root.trace
+        record = {
+            'trace_id': trace.trace_id,
+            'name': root.name,
+            'start': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(trace.start)),
+            'duration_ms': round(root.duration * 1000, 3),
+            'attributes': root.attributes,
+            'spans': sorted((s.to_dict() for s in trace.spans), key=lambda s: s['offset_ms'])
+        }
+        with self._lock:
+            self._recent.append(record)
+            entry = (record['duration_ms'], trace.trace_id, next(self._finished), record)
+            if len(self._slowest) < TRACE_SLOWEST_LIMIT:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+            if self.exporter == 'file':
+                try:
+                    with open(self.path, 'a') as f:
+                        f.write(json.dumps(record) + '\n')
+                except OSError as e:
+                    logger.error(f"Trace export failed: {e}")
+
+    def slowest(self, limit: int = 10) -> List[Dict]:
+        with self._lock:
+            entries = heapq.nlargest(limit, self._slowest)
+        return [record for *_, record in entries]
+
+    def get(self, trace_id: str) -> Optional[Dict]:
+        with self._lock:
+            for record in self._recent:
+                if record['trace_id'] == trace_id:
+                    return record
+            for *_, record in self._slowest:
+                if record['trace_id'] == trace_id:
+                    return record
+        return None
+
+
+def bind_context(fn: Callable) -> Callable:
+    """
+    Run `fn` in a copy of the caller's context, so spans opened on a
+    thread-pool thread attach to the current trace.
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a root span per HTTP request under `prefix`
+    and returning the trace id in an X-Trace-Id header when sampled.
+    """
+
+    def __init__(self, app, tracer: "Tracer", prefix: str = '/api'):
+        self.app = app
+        self.tracer = tracer
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope['headers']:
+            if key == b'traceparent':
+                traceparent = value.decode('latin-1')
+                break
+
+        root = self.tracer.start_trace(f"{scope['method']} {scope['path']}", traceparent)
+        if root is NULL_SPAN:
+            await self.app(scope, receive, send)
+            return
+
+        async def traced_send(message):
+            if message['type'] == 'http.response.start':
+                root.set_attribute('http.status_code', message['status'])
+                message = {**message, 'headers': [
+                    *message.get('headers', []), (TRACE_ID_HEADER, root.trace_id.encode())
+                ]}
+            await send(message)
+
+        with root:
+            await self.app(scope, receive, traced_send)
+
+
+# Singleton instance
+tracer = Tracer()
@@ -1,108 +1,474 @@
-from typing import List, Dict
+import os
+import re
+import sys
+import threading
+from typing import List, Dict, Iterator, Optional, Union
 
 
 SUPPORTED_GENES = ["CYP2D6", "CYP2C19", "CYP2C9", "SLCO1B1", "TPMT", "DPYD"]
 
+# Raw INFO/FORMAT keys the engines need, looked up directly in the bytes
+_GENE_TAG = b'GENE='
+_STAR_TAG = b'STAR='
+_RS_TAG = b'RS='
+
+VCFContent = Union[bytes, bytearray, memoryview, str]
+
+# Inputs are flagged low quality when more than this share of kept records
+# has no usable genotype ...
+QC_MAX_MISSING_GT_RATE = float(os.getenv('QC_MAX_MISSING_GT_RATE', 0.1))
+# ... or fails a FILTER
+QC_MAX_FILTERED_RATE = float(os.getenv('QC_MAX_FILTERED_RATE', 0.2))
+
+# Well-formed GT: allele indexes or '.', separated by '/' or '|'
+_GT = re.compile(r'(?:\d+|\.)(?:[/|](?:\d+|\.))*')
+
+
+def _info_value(info: bytes, tag: bytes) -> Optional[bytes]:
+    """Return the raw value of `tag` (e.g. b'GENE=') in an INFO column, or None."""
+    start = 0
+    while True:
+        idx = info.find(tag, start)
+        if idx < 0:
+            return None
+        # Only accept whole keys: start of column or right after a ';'
+        if idx == 0 or info[idx - 1] == 59:
+            begin = idx + len(tag)
+            end = info.find(b';', begin)
+            return info[begin:] if end < 0 else info[begin:end]
+        start = idx + 1
+
+
+class Variant:
+    """
+    Compact record for one kept variant.
+
+    Slotted instead of a dict; chrom, gene and genotype are interned so the
+    handful of distinct values are shared across every record.
+
+    `genotype` is the raw GT; it is stored with '/' separators and `phased`
+    records whether it was written with '|' (allele order = haplotype order).
+    """
+
+    __slots__ = ('chrom', 'pos', 'rsid', 'ref', 'alt', 'gene', 'star', 'genotype', 'phased')
+
+    def __init__(self, chrom: str, pos: str, rsid: Optional[str], ref: str,
+                 alt: str, gene: str, star: Optional[str], genotype: str):
+        self.chrom = sys.intern(chrom)
+        self.pos = pos
+        self.rsid = rsid
+        self.ref = ref
+        self.alt = alt
+        self.gene = sys.intern(gene)
+        self.star = star
+        self.phased = '|' in genotype
+        self.genotype = sys.intern(genotype.replace('|', '/') if self.phased else genotype)
+
+    def to_dict(self) -> Dict:
+        return {
+            'chrom': self.chrom,
+            'pos': self.pos,
+            'rsid': self.rsid,
+            'ref': self.ref,
+            'alt': self.alt,
+            'gene': self.gene,
+            'star': self.star,
+            'genotype': self.genotype,
+            'phased': self.phased
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Variant':
+        """Inverse of to_dict."""
+        genotype = data['genotype'].replace('/', '|') if data.get('phased') else data['genotype']
+        return cls(data['chrom'], data['pos'], data['rsid'], data['ref'], data['alt'],
+                   data['gene'], data['star'], genotype)
+
+    def __reduce__(self):
+        # Pickle as a bare constructor tuple (used when crossing process pools)
+        genotype = self.genotype.replace('/', '|') if self.phased else self.genotype
+        return (Variant, (self.chrom, self.pos, self.rsid, self.ref, self.alt,
+                          self.gene, self.star, genotype))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Variant):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __hash__(self) -> int:
+        # Over the same fields as __eq__; records are not modified after parsing
+        return hash(tuple(getattr(self, f) for f in self.__slots__))
+
+    def __repr__(self) -> str:
+        return (f"Variant({self.gene} {self.chrom}:{self.pos} {self.rsid} "
+                f"{self.ref}>{self.alt} {self.genotype})")
+
+
+class VCFQC:
+    """
+    Quality figures for one VCF, gathered by parse_vcf in the pass that
+    extracts the variants. Per-record figures cover the kept records
+    (GENE-tagged, supported gene); every other data line is only counted.
+    `uncovered_definition_sites` is filled in by the pipeline, which knows
+    the allele definitions.
+    """
+
+    __slots__ = ('records_seen', 'records_kept', 'malformed_records', 'variants_per_gene',
+                 'missing_genotypes', 'malformed_genotypes', 'filtered_records',
+                 'multiallelic_sites', 'uncovered_definition_sites')
+
+    def __init__(self):
+        self.records_seen = 0
+        self.records_kept = 0
+        self.malformed_records = 0
+        self.variants_per_gene: Dict[str, int] = {}
+        self.missing_genotypes = 0
+        self.malformed_genotypes = 0
+        self.filtered_records = 0
+        self.multiallelic_sites = 0
+        self.uncovered_definition_sites: Dict[str, int] = {}
+
+    def add(self, fields: List[bytes], gene: str, genotype: str):
+        """Account for one kept record."""
+        self.records_kept += 1
+        self.variants_per_gene[gene] = self.variants_per_gene.get(gene, 0) + 1
+        if fields[6] not in (b'PASS', b'.'):
+            self.filtered_records += 1
+        if b',' in fields[4]:
+            self.multiallelic_sites += 1
+        if genotype == "Unknown":
+            self.missing_genotypes += 1
+        elif not _GT.fullmatch(genotype):
+            self.malformed_genotypes += 1
+        elif '.' in genotype:
+            self.missing_genotypes += 1
+
+    @property
+    def genotype_missing_rate(self) -> float:
+        """Share of kept records whose GT is missing or malformed."""
+        if not self.records_kept:
+            return 0.0
+        return (self.missing_genotypes + self.malformed_genotypes) / self.records_kept
+
+    @property
+    def low_quality(self) -> bool:
+        if not self.records_kept:
+            return self.malformed_records > 0
+        return (self.genotype_missing_rate > QC_MAX_MISSING_GT_RATE
+                or self.filtered_records / self.records_kept > QC_MAX_FILTERED_RATE)
+
+    def to_dict(self) -> Dict:
+        return {
+            'records_seen': self.records_seen,
+            'records_kept': self.records_kept,
+            'malformed_records': self.malformed_records,
+            'variants_per_gene': dict(self.variants_per_gene),
+            'missing_genotypes': self.missing_genotypes,
+            'malformed_genotypes': self.malformed_genotypes,
+            'genotype_missing_rate': round(self.genotype_missing_rate, 4),
+            'filtered_records': self.filtered_records,
+            'multiallelic_sites': self.multiallelic_sites,
+            'uncovered_definition_sites': dict(self.uncovered_definition_sites),
+            'low_quality': self.low_quality
+        }
+
+
+class QCStats:
+    """Running VCF quality totals over the uploads parsed by this process."""
+
+    _COUNTS = ('records_seen', 'records_kept', 'malformed_records', 'missing_genotypes',
+               'malformed_genotypes', 'filtered_records', 'multiallelic_sites')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = 0
+        self.low_quality_files = 0
+        self.totals = dict.fromkeys(self._COUNTS, 0)
+
+    def record(self, qc: VCFQC):
+        with self._lock:
+            self.files += 1
+            self.low_quality_files += int(qc.low_quality)
+            for name in self._COUNTS:
+                self.totals[name] += getattr(qc, name)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            kept = max(self.totals['records_kept'], 1)
+            unusable = self.totals['missing_genotypes'] + self.totals['malformed_genotypes']
+            return {
+                'files': self.files,
+                'low_quality_files': self.low_quality_files,
+                **self.totals,
+                'genotype_missing_rate': round(unusable / kept, 4)
+            }
+
+
+class VCFRecord:
+    """
+    Lazy view over a single VCF data line.
+
+    CHROM, POS, ID, REF, ALT, the GENE/STAR/RS INFO tags and GT are decoded
+    eagerly because every engine needs them. Everything else stays as raw
+    bytes and is decoded only when the property is accessed.
+    """
+
+    __slots__ = ('_fields', 'chrom', 'pos', 'id', 'ref', 'alt',
+                 'gene', 'star', 'rs', 'genotype')
+
+    def __init__(self, fields: List[bytes], gene: str, star: Optional[str],
+                 rs: Optional[str], genotype: str):
+        self._fields = fields
+        self.chrom = fields[0].decode()
+        self.pos = fields[1].decode()
+        self.id = fields[2].decode() if fields[2] != b'.' else None
+        self.ref = fields[3].decode()
+        self.alt = fields[4].decode()
+        self.gene = gene
+        self.star = star
+        self.rs = rs if rs is not None else self.id
+        self.genotype = genotype
+
+    @property
+    def qual(self) -> str:
+        return self._fields[5].decode()
+
+    @property
+    def filter(self) -> str:
+        return self._fields[6].decode()
+
+    @property
+    def info(self) -> str:
+        return self._fields[7].decode()
+
+    @property
+    def format(self) -> str:
+        return self._fields[8].decode()
+
+    @property
+    def samples(self) -> List[str]:
+        """All sample columns, decoded."""
+        if len(self._fields) < 10:
+            return []
+        return [s.decode().rstrip('\r') for s in self._fields[9].split(b'\t')]
+
+    def info_value(self, key: str) -> Optional[str]:
+        """Decode a single INFO value on request."""
+        value = _info_value(self._fields[7], key.encode() + b'=')
+        return value.decode() if value is not None else None
+
+    def to_variant(self) -> Variant:
+        """Compact record in the shape the engines consume."""
+        return Variant(self.chrom, self.pos, self.rs, self.ref, self.alt,
+                       self.gene, self.star, self.genotype)
+
 
 class VCFParser:
     def __init__(self):
         self.supported_genes = SUPPORTED_GENES
-    
-    def parse_vcf(self, file_content: str) -> Dict[str, List[Dict]]:
+        # Raw GENE value -> shared str, so matching genes are never re-decoded
+        self._gene_lookup = {gene.encode(): gene for gene in SUPPORTED_GENES}
+
+    def parse_vcf(
+        self,
+        file_content: VCFContent,
+        qc: Optional[VCFQC] = None
+    ) -> Dict[str, List[Variant]]:
         """
         Parse VCF file and extract variants for supported genes.
-        
-        Returns: Dict with gene names as keys and list of variants as values
+
+        Accepts the raw upload bytes (a str is encoded first for callers that
+        already decoded it). Pass a VCFQC to have it filled in on the way.
+
+        Returns: Dict with gene names as keys and list of Variant records as values
         """
         variants_by_gene = {gene: [] for gene in self.supported_genes}
-        lines = file_content.strip().split('\n')
-        
-        for line in lines:
-            if line.startswith('#'):
+        if qc is not None:
+            for gene in self.supported_genes:
+                qc.variants_per_gene.setdefault(gene, 0)
+
+        for fields, gene, star, rs, genotype in self._iter_raw(file_content, True, qc):
+            try:
+                rsid = fields[2]
+                variant = Variant(
+                    fields[0].decode(),
+                    fields[1].decode(),
+                    rs if rs is not None else (rsid.decode() if rsid != b'.' else None),
+                    fields[3].decode(),
+                    fields[4].decode(),
+                    gene,
+                    star,
+                    genotype
+                )
+            except UnicodeDecodeError:
+                if qc is not None:
+                    qc.malformed_records += 1
                 continue
-            
-            variant = self._parse_variant_line(line)
-            if variant and variant['gene'] in self.supported_genes:
-                variants_by_gene[variant['gene']].append(variant)
-        
+            variants_by_gene[gene].append(variant)
+            if qc is not None:
+                qc.add(fields, gene, genotype)
+
         return variants_by_gene
-    
-    def _parse_variant_line(self, line: str) -> Dict:
-        """Parse a single VCF variant line."""
-        if not line.strip():
-            return None
-        
+
+    def iter_records(
+        self,
+        file_content: VCFContent,
+        supported_only: bool = False
+    ) -> Iterator[VCFRecord]:
+        """
+        Yield a VCFRecord for every GENE-tagged data line.
+
+        Unused columns stay undecoded until they are accessed on the record.
+        """
+        for parsed in self._iter_raw(file_content, supported_only):
+            try:
+                yield VCFRecord(*parsed)
+            except UnicodeDecodeError:
+                continue
+
+    def _iter_raw(
+        self,
+        file_content: VCFContent,
+        supported_only: bool,
+        qc: Optional[VCFQC] = None
+    ) -> Iterator[tuple]:
+        """
+        Yield (fields, gene, star, rs, genotype) for every GENE-tagged line.
+
+        Lines without a GENE tag are skipped before any field is split or
+        decoded, which is where almost all of a WGS file goes.
+        """
+        if isinstance(file_content, str):
+            data = file_content.encode('utf-8')
+        else:
+            data = bytes(file_content)
+
+        seen = 0
+        for line in data.split(b'\n'):
+            if not line or line[0] == 35:  # '#'
+                continue
+            seen += 1
+            if _GENE_TAG not in line:
+                continue
+
+            parsed = self._parse_record(line, supported_only, qc)
+            if parsed is not None:
+                yield parsed
+
+        if qc is not None:
+            qc.records_seen += seen
+
+    def _parse_record(
+        self,
+        line: bytes,
+        supported_only: bool,
+        qc: Optional[VCFQC] = None
+    ) -> Optional[tuple]:
+        """Split a raw data line and decode only the INFO tags and GT."""
         try:
-            fields = line.split('\t')
+            fields = line.split(b'\t', 9)
             if len(fields) < 9:
+                if qc is not None:
+                    qc.malformed_records += 1
                 return None
-            
-            chrom = fields[0]
-            pos = fields[1]
-            rsid = fields[2] if fields[2] != '.' else None
-            ref = fields[3]
-            alt = fields[4]
+
             info = fields[7]
-            format_field = fields[8]
-            sample = fields[9] if len(fields) > 9 else None
-            
-            # Extract INFO tags
-            info_dict = self._parse_info(info)
-            gene = info_dict.get('GENE')
-            star = info_dict.get('STAR')
-            rs = info_dict.get('RS', rsid)
-            
-            # Extract genotype
-            genotype = self._extract_genotype(format_field, sample)
-            
-            if not gene:
+            gene_raw = _info_value(info, _GENE_TAG)
+            if not gene_raw:
                 return None
-            
-            return {
-                'chrom': chrom,
-                'pos': pos,
-                'rsid': rs,
-                'ref': ref,
-                'alt': alt,
-                'gene': gene,
-                'star': star,
-                'genotype': genotype
-            }
-        except Exception as e:
+
+            gene = self._gene_lookup.get(gene_raw)
+            if gene is None:
+                if supported_only:
+                    return None
+                gene = gene_raw.decode()
+
+            star = _info_value(info, _STAR_TAG) if _STAR_TAG in info else None
+            rs = _info_value(info, _RS_TAG) if _RS_TAG in info else None
+            sample = fields[9] if len(fields) > 9 else None
+
+            return (
+                fields,
+                gene,
+                star.decode() if star else None,
+                rs.decode() if rs is not None else None,
+                self._extract_genotype(fields[8], sample)
+            )
+        except UnicodeDecodeError:
+            if qc is not None:
+                qc.malformed_records += 1
             return None
-    
-    def _parse_info(self, info_str: str) -> Dict:
-        """Parse INFO field into dictionary."""
-        info_dict = {}
-        for item in info_str.split(';'):
-            if '=' in item:
-                key, value = item.split('=', 1)
-                info_dict[key] = value
-            else:
-                info_dict[item] = True
-        return info_dict
-    
-    def _extract_genotype(self, format_field: str, sample: str) -> str:
-        """Extract genotype (GT) from sample field."""
+
+    def _extract_genotype(self, format_field: bytes, sample: Optional[bytes]) -> str:
+        """Extract the raw genotype (GT) from the first sample column."""
         if not sample or not format_field:
             return "Unknown"
-        
-        format_keys = format_field.split(':')
-        sample_values = sample.split(':')
-        
-        if 'GT' in format_keys:
-            gt_index = format_keys.index('GT')
-            if gt_index < len(sample_values):
-                gt = sample_values[gt_index]
-                # Normalize genotype separators
-                return gt.replace('|', '/')
-        
-        return "Unknown"
-    
-    def validate_vcf_header(self, content: str) -> bool:
+
+        # Only the first sample column is genotyped
+        end = sample.find(b'\t')
+        if end >= 0:
+            sample = sample[:end]
+
+        # GT is required to be the first FORMAT key; avoid splitting for it
+        if format_field == b'GT' or format_field.startswith(b'GT:'):
+            end = sample.find(b':')
+            gt = sample if end < 0 else sample[:end]
+        else:
+            format_keys = format_field.split(b':')
+            if b'GT' not in format_keys:
+                return "Unknown"
+            gt_index = format_keys.index(b'GT')
+            sample_values = sample.split(b':', gt_index + 1)
+            if gt_index >= len(sample_values):
+                return "Unknown"
+            gt = sample_values[gt_index]
+
+        # Separators are normalized by the record so phase is not lost
+        return gt.rstrip(b'\r').decode()
+
+    def validate_vcf_header(self, content: VCFContent) -> bool:
         """Validate VCF file has proper header."""
-        lines = content.split('\n')
-        for line in lines[:20]:
-            if line.startswith('##fileformat=VCF'):
-                return True
-        return False
+        if isinstance(content, str):
+            lines = content.split('\n', 20)[:20]
+            return any(line.startswith('##fileformat=VCF') for line in lines)
+
+        lines = bytes(content[:64 * 1024]).split(b'\n', 20)[:20]
+        return any(line.startswith(b'##fileformat=VCF') for line in lines)
+
+    def is_utf8(self, content: VCFContent) -> bool:
+        """
+        Whether the whole upload is valid UTF-8. ASCII, which nearly every
+        VCF is, is recognized without decoding anything.
+        """
+        if isinstance(content, str):
+            return True
+        data = bytes(content)
+        if data.isascii():
+            return True
+        try:
+            data.decode('utf-8')
+        except UnicodeDecodeError:
+            return False
+        return True
+
+    def decode_header(self, content: VCFContent) -> Optional[str]:
+        """
+        Decode the meta/header lines only. Returns None when they are not
+        valid UTF-8; data lines are decoded per field while parsing.
+        """
+        data = bytes(content) if not isinstance(content, str) else content.encode('utf-8')
+        header_end = 0
+        while data.startswith(b'#', header_end):
+            newline = data.find(b'\n', header_end)
+            if newline < 0:
+                header_end = len(data)
+                break
+            header_end = newline + 1
+        try:
+            return data[:header_end].decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+
+# Process-wide totals, reported by /health
+qc_stats = QCStats()
@@ -1,10 +1,20 @@
 import os
 import logging
-from typing import List, Dict
+from typing import Iterable, List, Dict
 from urllib.parse import urlparse
 
+from services.cache_backend import get_cache
+from services.prompt_budget import select_context
+from services.tracing import tracer
+
 logger = logging.getLogger(__name__)
 
+# Successful searches are reused across requests and workers
+SEARCH_CACHE_MAX_BYTES = int(os.getenv('SEARCH_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', 24 * 3600))
+# Search context allowed into one LLM prompt
+SEARCH_CONTEXT_TOKENS = int(os.getenv('SEARCH_CONTEXT_TOKENS', 120))
+
 
 class WebSearchService:
     """Service to search the web using Tavily API for pharmacogenomic context."""
@@ -12,6 +22,7 @@ class WebSearchService:
     def __init__(self):
         self.api_key = os.getenv('TAVILY_API_KEY')
         self._client = None
+        self.cache = get_cache('web_search', SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_TTL)
         if self.api_key:
             try:
                 from tavily import TavilyClient
@@ -30,26 +41,35 @@ class WebSearchService:
         if not self._client:
             return []
 
-        try:
-            response = self._client.search(
-                query=query,
-                search_depth="basic",
-                max_results=max_results,
-                include_answer=False
-            )
-            results = []
-            for r in response.get('results', []):
-                results.append({
-                    'title':   r.get('title', ''),
-                    'snippet': r.get('content', ''),
-                    'url':     r.get('url', ''),
-                    'source':  self._extract_domain(r.get('url', ''))
-                })
-            logger.info(f"Tavily returned {len(results)} results for: {query[:60]}")
-            return results
-        except Exception as e:
-            logger.error(f"Web search error: {e}")
-            return []
+        cache_key = f"{max_results}:{query}"
+        cached = self.cache.get_json(cache_key)
+        if cached is not None:
+            return cached
+
+        with tracer.span('tavily.search', query=query[:120]) as span:
+            try:
+                response = self._client.search(
+                    query=query,
+                    search_depth="basic",
+                    max_results=max_results,
+                    include_answer=False
+                )
+                results = []
+                for r in response.get('results', []):
+                    results.append({
+                        'title':   r.get('title', ''),
+                        'snippet': r.get('content', ''),
+                        'url':     r.get('url', ''),
+                        'source':  self._extract_domain(r.get('url', ''))
+                    })
+                logger.info(f"Tavily returned {len(results)} results for: {query[:60]}")
+                span.set_attribute('results', len(results))
+                self.cache.set_json(cache_key, results)
+                return results
+            except Exception as e:
+                logger.error(f"Web search error: {e}")
+                span.set_attribute('error', str(e))
+                return []
 
     # ── Public methods (same interface as before) ──────────────────────────
 
@@ -75,17 +95,24 @@ class WebSearchService:
         query = f"{gene} {phenotype} metabolizer clinical implications"
         return self._search(query, max_results=2)
 
-    def format_search_results_for_llm(self, results: List[Dict]) -> str:
-        """Format search results for inclusion in LLM prompt."""
-        if not results:
-            return "No web search results available."
-
-        formatted = "Web Search Results:\n\n"
-        for i, r in enumerate(results, 1):
-            formatted += f"{i}. {r['title']}\n"
-            formatted += f"   Source: {r['source']}\n"
-            formatted += f"   {r['snippet'][:200]}...\n\n"
-        return formatted
+    def format_search_results_for_llm(
+        self,
+        results: List[Dict],
+        terms: Iterable[str] = (),
+        max_tokens: int = SEARCH_CONTEXT_TOKENS
+    ) -> str:
+        """
+        Search results as compact prompt context: the sentences that mention
+        `terms` (gene, drug, diplotype...), deduplicated across results,
+        best first and within `max_tokens`. Without terms, every sentence
+        counts as relevant. Empty when nothing qualifies.
+        """
+        passages = [
+            (r['source'], r['snippet']) for r in {r['url'] or r['snippet']: r for r in results}.values()
+        ]
+        if not terms:
+            terms = [word for _, snippet in passages for word in snippet.split()]
+        return '\n'.join(select_context(passages, terms, max_tokens))
 
     # ── Helpers ────────────────────────────────────────────────────────────
 
@@ -0,0 +1,40 @@
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+from services.columnar_export import (  # noqa: E402
+    GENE_PROFILES, RISK_ASSESSMENTS, ColumnarExporter, read_columns
+)
+
+
+def _analysis(phenotype: str, risk_label: str) -> dict:
+    return {
+        'patient_id': 'p1',
+        'drug': 'Plavix',
+        'canonical_drug': 'clopidogrel',
+        'timestamp': '2026-01-01T00:00:00Z',
+        'risk_assessment': {'risk_label': risk_label, 'severity': 'moderate', 'confidence_score': 0.9},
+        'pharmacogenomic_profile': [{
+            'gene': 'CYP2C19', 'star_allele_1': '*1', 'star_allele_2': '*2',
+            'diplotype': '*1/*2', 'phenotype': phenotype, 'detected_variants': []
+        }]
+    }
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_export_spans_several_row_groups(tmp_path, fmt):
+    # One row per group, with different values per group, so each group
+    # would build its own dictionaries
+    with ColumnarExporter(str(tmp_path), fmt=fmt, row_group_size=1,
+                          drug_genes={'clopidogrel': 'CYP2C19'}) as exporter:
+        exporter.write_results('s1', [_analysis('IM', 'Adjust Dosage')])
+        exporter.write_results('s2', [_analysis('PM', 'Ineffective')])
+        exporter.write_results('s3', [_analysis('IM', 'Adjust Dosage')])
+
+    profiles = read_columns(exporter.path_for(GENE_PROFILES))
+    assert profiles.column('sample_id').to_pylist() == ['s1', 's2', 's3']
+    assert profiles.column('phenotype').to_pylist() == ['IM', 'PM', 'IM']
+
+    risks = read_columns(exporter.path_for(RISK_ASSESSMENTS), columns=['drug', 'risk_label'])
+    assert risks.column('drug').to_pylist() == ['clopidogrel'] * 3
+    assert risks.column('risk_label').to_pylist() == ['Adjust Dosage', 'Ineffective', 'Adjust Dosage']
@@ -193,7 +193,7 @@ function App() {
               </p>
               <div className="grid grid-cols-2 lg:grid-cols-4 gap-0 border-l border-black">
                 {[
-                  ['01', 'Upload', 'VCF genomic file up to 5 MB'],
+                  ['01', 'Upload', 'VCF genomic file, filtered in-browser'],
                   ['02', 'Select', 'Choose one or more target medications'],
                   ['03', 'Analyze', '6 pharmacogenomic genes assessed via CPIC'],
                   ['04', 'Review', 'Receive personalized risk and dosing guidance'],
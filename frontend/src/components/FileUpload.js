@@ -1,10 +1,25 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
+
+// Files below this are sent as-is; filtering them would not save anything
+const PREFILTER_MIN_BYTES = 256 * 1024;
 
 function FileUpload({ onFileSelect, selectedFile }) {
   const [dragActive, setDragActive] = useState(false);
   const [fileError, setFileError] = useState('');
+  const [filtering, setFiltering] = useState(null);
+  const [originalSize, setOriginalSize] = useState(null);
+  const workerRef = useRef(null);
   const maxSizeBytes = 5 * 1024 * 1024;
 
+  const stopWorker = () => {
+    if (workerRef.current) {
+      workerRef.current.terminate();
+      workerRef.current = null;
+    }
+  };
+
+  useEffect(() => stopWorker, []);
+
   const handleDrag = (e) => {
     e.preventDefault();
     e.stopPropagation();
@@ -18,11 +33,54 @@ function FileUpload({ onFileSelect, selectedFile }) {
       setFileError('Invalid file type. Only .vcf files are accepted.');
       return false;
     }
+    return true;
+  };
+
+  const acceptFile = (file, original) => {
     if (file.size > maxSizeBytes) {
-      setFileError(`File too large (${(file.size / 1024 / 1024).toFixed(2)} MB). Maximum is 5 MB.`);
-      return false;
+      setFileError(`File too large (${(file.size / 1024 / 1024).toFixed(2)} MB after filtering). Maximum is 5 MB.`);
+      onFileSelect(null);
+      return;
     }
-    return true;
+    setOriginalSize(file === original ? null : original.size);
+    onFileSelect(file);
+  };
+
+  // Stream the file through a worker that keeps only the header and the
+  // records the backend reads, and upload that instead of the whole file
+  const prefilterFile = (file) => {
+    stopWorker();
+    onFileSelect(null);
+    if (file.size < PREFILTER_MIN_BYTES || typeof Worker === 'undefined') {
+      acceptFile(file, file);
+      return;
+    }
+
+    const worker = new Worker(new URL('../workers/vcfPrefilter.worker.js', import.meta.url));
+    workerRef.current = worker;
+    setFiltering({ name: file.name, progress: 0 });
+
+    worker.onmessage = (e) => {
+      const msg = e.data;
+      if (msg.type === 'progress') {
+        setFiltering({ name: file.name, progress: msg.loaded / msg.total });
+        return;
+      }
+      stopWorker();
+      setFiltering(null);
+      if (msg.type === 'done') {
+        acceptFile(new File([msg.blob], file.name, { type: file.type || 'text/plain' }), file);
+      } else {
+        // Let the server validate and report on the original file
+        acceptFile(file, file);
+      }
+    };
+    worker.onerror = () => {
+      stopWorker();
+      setFiltering(null);
+      acceptFile(file, file);
+    };
+    worker.postMessage({ file });
   };
 
   const handleDrop = (e) => {
@@ -31,7 +89,7 @@ function FileUpload({ onFileSelect, selectedFile }) {
     setDragActive(false);
     if (e.dataTransfer.files && e.dataTransfer.files[0]) {
       const file = e.dataTransfer.files[0];
-      if (validateFile(file)) onFileSelect(file);
+      if (validateFile(file)) prefilterFile(file);
     }
   };
 
@@ -39,10 +97,13 @@ function FileUpload({ onFileSelect, selectedFile }) {
     e.preventDefault();
     if (e.target.files && e.target.files[0]) {
       const file = e.target.files[0];
-      if (validateFile(file)) onFileSelect(file);
+      if (validateFile(file)) prefilterFile(file);
     }
   };
 
+  const formatSize = (bytes) =>
+    bytes >= 1024 * 1024 ? `${(bytes / 1024 / 1024).toFixed(2)} MB` : `${(bytes / 1024).toFixed(1)} KB`;
+
   return (
     <div className="w-full" style={{ fontFamily: "'Oswald', sans-serif" }}>
       <form onDragEnter={handleDrag} onDragLeave={handleDrag} onDragOver={handleDrag} onDrop={handleDrop}>
@@ -71,11 +132,23 @@ function FileUpload({ onFileSelect, selectedFile }) {
             {dragActive ? 'Release to Upload' : 'Drop VCF File or Click to Browse'}
           </p>
           <p className="text-xs tracking-wider text-black font-light mt-1.5" style={{ opacity: 0.35 }}>
-            VCF v4.2&nbsp;&nbsp;/&nbsp;&nbsp;Max 5 MB
+            VCF v4.2&nbsp;&nbsp;/&nbsp;&nbsp;Filtered to 6 genes in your browser
           </p>
         </label>
       </form>
 
+      {filtering && (
+        <div className="mt-3 border border-black px-5 py-4">
+          <div className="flex items-center justify-between">
+            <p className="text-xs tracking-widest uppercase font-semibold text-black">Filtering {filtering.name}</p>
+            <p className="text-xs tracking-wider font-light text-black opacity-50">{Math.round(filtering.progress * 100)}%</p>
+          </div>
+          <div className="mt-2 h-0.5 bg-black bg-opacity-10">
+            <div className="h-0.5 bg-black transition-all" style={{ width: `${filtering.progress * 100}%` }} />
+          </div>
+        </div>
+      )}
+
       {selectedFile && !fileError && (
         <div className="mt-3 bg-black text-white px-5 py-4 flex items-center justify-between">
           <div className="flex items-center gap-4">
@@ -85,7 +158,9 @@ function FileUpload({ onFileSelect, selectedFile }) {
             <div>
               <p className="text-xs tracking-widest uppercase font-semibold">{selectedFile.name}</p>
               <p className="text-xs font-light mt-0.5 opacity-50 tracking-wider">
-                {(selectedFile.size / 1024 / 1024).toFixed(2)} MB
+                {originalSize
+                  ? `${formatSize(originalSize)} → ${formatSize(selectedFile.size)} pharmacogene records`
+                  : formatSize(selectedFile.size)}
               </p>
             </div>
           </div>
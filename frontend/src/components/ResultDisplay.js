@@ -1,31 +1,172 @@
-import React, { useState } from 'react';
+import React, { useMemo, useState } from 'react';
+import VirtualList from './VirtualList';
 
 const FONT = { fontFamily: "'Oswald', sans-serif" };
 
+const riskStyles = {
+  Safe:           { border: '#16a34a', label: 'SAFE' },
+  'Adjust Dosage':{ border: '#b45309', label: 'ADJUST DOSAGE' },
+  Toxic:          { border: '#dc2626', label: 'TOXIC' },
+  Ineffective:    { border: '#6b7280', label: 'INEFFECTIVE' },
+  Unknown:        { border: '#9ca3af', label: 'UNKNOWN' },
+};
+
+const severityColors = {
+  none:     '#9ca3af',
+  low:      '#3b82f6',
+  moderate: '#b45309',
+  high:     '#ea580c',
+  critical: '#dc2626',
+};
+
+const SEVERITY_RANK = { none: 0, low: 1, moderate: 2, high: 3, critical: 4 };
+
+// Variant rows rendered per expansion step of a gene
+const VARIANT_PAGE = 50;
+const PATIENT_ROW_HEIGHT = 56;
+const PATIENT_LIST_HEIGHT = 336;
+
+// One entry per patient, in response order. Every drug result for a
+// patient carries the same profile, so it is kept (and rendered) once.
+function groupByPatient(results) {
+  const patients = [];
+  const byId = new Map();
+  results.forEach((r) => {
+    let patient = byId.get(r.patient_id);
+    if (!patient) {
+      patient = { id: r.patient_id, profile: r.pharmacogenomic_profile, results: [], worst: r };
+      byId.set(r.patient_id, patient);
+      patients.push(patient);
+    }
+    patient.results.push(r);
+    if ((SEVERITY_RANK[r.risk_assessment.severity] || 0) > (SEVERITY_RANK[patient.worst.risk_assessment.severity] || 0)) {
+      patient.worst = r;
+    }
+  });
+  return patients;
+}
+
+function VariantRows({ variants }) {
+  const [shown, setShown] = useState(VARIANT_PAGE);
+  if (variants.length === 0) {
+    return (
+      <p className="text-xs tracking-wider font-light text-black opacity-40">
+        No variants detected — reference allele
+      </p>
+    );
+  }
+  return (
+    <div className="space-y-1">
+      {variants.slice(0, shown).map((v, vi) => (
+        <p key={vi} className="text-xs font-light text-black tracking-wider font-mono">
+          {v.rsid} &nbsp; {v.ref} &rarr; {v.alt} &nbsp; GT: {v.genotype}
+        </p>
+      ))}
+      {variants.length > shown && (
+        <button
+          onClick={() => setShown(shown + VARIANT_PAGE * 4)}
+          className="text-xs tracking-widest uppercase font-semibold text-black opacity-40 hover:opacity-80 pt-1"
+        >
+          Show more ({variants.length - shown} remaining)
+        </button>
+      )}
+    </div>
+  );
+}
+
+// Memoized on the profile array, so switching between a patient's drugs
+// does not re-render it; gene details mount only when expanded
+const GeneProfile = React.memo(function GeneProfile({ profile }) {
+  const [expandedGene, setExpandedGene] = useState(null);
+
+  return (
+    <div className="border border-black mb-8">
+      <div className="border-b border-black px-6 py-4">
+        <p className="text-xs tracking-widest uppercase font-semibold text-black">
+          Pharmacogenomic Profile
+        </p>
+      </div>
+
+      {profile.map((gene) => (
+        <div key={gene.gene} className="border-b border-black last:border-b-0">
+          <div
+            className="px-6 py-4 flex items-center justify-between cursor-pointer hover:bg-black hover:bg-opacity-5 transition-colors"
+            onClick={() => setExpandedGene(expandedGene === gene.gene ? null : gene.gene)}
+          >
+            <div className="flex items-center gap-8">
+              <div>
+                <p className="text-lg font-bold uppercase tracking-wider text-black">{gene.gene}</p>
+                <p className="text-xs tracking-wider font-light text-black opacity-60">
+                  {gene.diplotype}
+                </p>
+              </div>
+              <div className="hidden sm:block">
+                <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-40 mb-0.5">Phenotype</p>
+                <p className="text-sm font-semibold tracking-wider text-black">{gene.phenotype}</p>
+              </div>
+            </div>
+            <svg
+              className={`w-4 h-4 text-black transition-transform ${expandedGene === gene.gene ? 'rotate-180' : ''}`}
+              fill="currentColor"
+              viewBox="0 0 20 20"
+            >
+              <path fillRule="evenodd"
+                d="M5.293 7.293a1 1 0 011.414 0L10 10.586l3.293-3.293a1 1 0 111.414 1.414l-4 4a1 1 0 01-1.414 0l-4-4a1 1 0 010-1.414z"
+                clipRule="evenodd" />
+            </svg>
+          </div>
+
+          {expandedGene === gene.gene && (
+            <div className="px-6 pb-5 bg-black bg-opacity-5">
+              <div className="flex gap-8 pt-4 mb-4">
+                <div>
+                  <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-50 mb-0.5">Allele 1</p>
+                  <p className="text-sm font-semibold text-black">{gene.star_allele_1}</p>
+                </div>
+                <div>
+                  <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-50 mb-0.5">Allele 2</p>
+                  <p className="text-sm font-semibold text-black">{gene.star_allele_2}</p>
+                </div>
+                <div>
+                  <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-50 mb-0.5">Phenotype</p>
+                  <p className="text-sm font-semibold text-black">{gene.phenotype}</p>
+                </div>
+              </div>
+              <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-50 mb-2">Detected Variants</p>
+              <VariantRows variants={gene.detected_variants} />
+            </div>
+          )}
+        </div>
+      ))}
+    </div>
+  );
+});
+
 function ResultDisplay({ results }) {
+  const [activePatient, setActivePatient] = useState(0);
   const [activeTab, setActiveTab] = useState(0);
-  const [expandedGene, setExpandedGene] = useState(null);
   const [showJson, setShowJson] = useState(false);
 
-  const result = results[activeTab];
+  const patients = useMemo(() => groupByPatient(results), [results]);
+  const patient = patients[Math.min(activePatient, patients.length - 1)];
+  const patientResults = patient.results;
+  const result = patientResults[Math.min(activeTab, patientResults.length - 1)];
 
-  const riskStyles = {
-    Safe:           { border: '#16a34a', label: 'SAFE' },
-    'Adjust Dosage':{ border: '#b45309', label: 'ADJUST DOSAGE' },
-    Toxic:          { border: '#dc2626', label: 'TOXIC' },
-    Ineffective:    { border: '#6b7280', label: 'INEFFECTIVE' },
-    Unknown:        { border: '#9ca3af', label: 'UNKNOWN' },
-  };
+  // Only the selected patient, and only while the panel is open
+  const rawJson = useMemo(
+    () => (showJson ? JSON.stringify(patientResults, null, 2) : ''),
+    [showJson, patientResults]
+  );
 
-  const severityColors = {
-    none:     '#9ca3af',
-    low:      '#3b82f6',
-    moderate: '#b45309',
-    high:     '#ea580c',
-    critical: '#dc2626',
+  const selectPatient = (i) => {
+    setActivePatient(i);
+    setActiveTab(0);
+    setShowJson(false);
   };
 
   const risk = riskStyles[result.risk_assessment.risk_label] || riskStyles.Unknown;
+  // Pass/fail flags only; vcf_qc holds the detailed input statistics
+  const qualityChecks = Object.entries(result.quality_metrics).filter(([, value]) => typeof value === 'boolean');
 
   const downloadJson = () => {
     const blob = new Blob([JSON.stringify(results, null, 2)], { type: 'application/json' });
@@ -43,21 +184,55 @@ function ResultDisplay({ results }) {
   return (
     <div style={FONT} className="w-full space-y-0">
 
+      {/* Patient list — windowed, for batch results */}
+      {patients.length > 1 && (
+        <div className="border border-black mb-10">
+          <div className="border-b border-black px-6 py-4 flex items-center justify-between">
+            <p className="text-xs tracking-widest uppercase font-semibold text-black">Patients</p>
+            <p className="text-xs tracking-wider text-black opacity-30 font-light">
+              {patients.length} patients · {results.length} results
+            </p>
+          </div>
+          <VirtualList
+            items={patients}
+            rowHeight={PATIENT_ROW_HEIGHT}
+            height={PATIENT_LIST_HEIGHT}
+            renderRow={(p, i) => {
+              const worst = riskStyles[p.worst.risk_assessment.risk_label] || riskStyles.Unknown;
+              return (
+                <button
+                  onClick={() => selectPatient(i)}
+                  className={`w-full h-full px-6 flex items-center justify-between border-b border-black border-opacity-10 text-left transition-colors ${
+                    patient === p ? 'bg-black text-white' : 'bg-white text-black hover:bg-black hover:bg-opacity-5'
+                  }`}
+                  style={{ borderLeft: `4px solid ${worst.border}` }}
+                >
+                  <span className="text-sm font-mono tracking-wider">{p.id}</span>
+                  <span className="text-xs tracking-widest uppercase font-semibold opacity-60">
+                    {p.results.length} drug{p.results.length > 1 ? 's' : ''} · {worst.label}
+                  </span>
+                </button>
+              );
+            }}
+          />
+        </div>
+      )}
+
       {/* Drug tab bar */}
-      {results.length > 1 && (
+      {patientResults.length > 1 && (
         <div className="flex border-b-2 border-black overflow-x-auto mb-10">
-          {results.map((r, i) => {
+          {patientResults.map((r, i) => {
             const rStyle = riskStyles[r.risk_assessment.risk_label] || riskStyles.Unknown;
             return (
               <button
-                key={i}
-                onClick={() => { setActiveTab(i); setExpandedGene(null); setShowJson(false); }}
+                key={r.drug}
+                onClick={() => { setActiveTab(i); setShowJson(false); }}
                 className={`relative px-8 py-4 text-xs tracking-widest uppercase font-semibold border-r border-black whitespace-nowrap transition-colors ${
-                  activeTab === i ? 'bg-black text-white' : 'bg-white text-black hover:bg-black hover:bg-opacity-5'
+                  result === r ? 'bg-black text-white' : 'bg-white text-black hover:bg-black hover:bg-opacity-5'
                 }`}
               >
                 {r.drug}
-                {activeTab === i && (
+                {result === r && (
                   <span
                     className="absolute bottom-0 left-0 right-0 h-0.5"
                     style={{ backgroundColor: rStyle.border }}
@@ -67,7 +242,7 @@ function ResultDisplay({ results }) {
             );
           })}
         </div>
-      )}  
+      )}
 
       {/* Results Title */}
       <div className="border-b-2 border-black pb-6 mb-10">
@@ -178,89 +353,19 @@ function ResultDisplay({ results }) {
         </div>
       </div>
 
-      {/* Pharmacogenomic Profile */}
-      <div className="border border-black mb-8">
-        <div className="border-b border-black px-6 py-4">
-          <p className="text-xs tracking-widest uppercase font-semibold text-black">
-            Pharmacogenomic Profile
-          </p>
-        </div>
-
-        {result.pharmacogenomic_profile.map((gene, index) => (
-          <div key={index} className="border-b border-black last:border-b-0">
-            <div
-              className="px-6 py-4 flex items-center justify-between cursor-pointer hover:bg-black hover:bg-opacity-5 transition-colors"
-              onClick={() => setExpandedGene(expandedGene === `${activeTab}-${index}` ? null : `${activeTab}-${index}`)}
-            >
-              <div className="flex items-center gap-8">
-                <div>
-                  <p className="text-lg font-bold uppercase tracking-wider text-black">{gene.gene}</p>
-                  <p className="text-xs tracking-wider font-light text-black opacity-60">
-                    {gene.diplotype}
-                  </p>
-                </div>
-                <div className="hidden sm:block">
-                  <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-40 mb-0.5">Phenotype</p>
-                  <p className="text-sm font-semibold tracking-wider text-black">{gene.phenotype}</p>
-                </div>
-              </div>
-              <svg
-                className={`w-4 h-4 text-black transition-transform ${expandedGene === `${activeTab}-${index}` ? 'rotate-180' : ''}`}
-                fill="currentColor"
-                viewBox="0 0 20 20"
-              >
-                <path fillRule="evenodd"
-                  d="M5.293 7.293a1 1 0 011.414 0L10 10.586l3.293-3.293a1 1 0 111.414 1.414l-4 4a1 1 0 01-1.414 0l-4-4a1 1 0 010-1.414z"
-                  clipRule="evenodd" />
-              </svg>
-            </div>
-
-            {expandedGene === `${activeTab}-${index}` && (
-              <div className="px-6 pb-5 bg-black bg-opacity-5">
-                <div className="flex gap-8 pt-4 mb-4">
-                  <div>
-                    <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-50 mb-0.5">Allele 1</p>
-                    <p className="text-sm font-semibold text-black">{gene.star_allele_1}</p>
-                  </div>
-                  <div>
-                    <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-50 mb-0.5">Allele 2</p>
-                    <p className="text-sm font-semibold text-black">{gene.star_allele_2}</p>
-                  </div>
-                  <div>
-                    <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-50 mb-0.5">Phenotype</p>
-                    <p className="text-sm font-semibold text-black">{gene.phenotype}</p>
-                  </div>
-                </div>
-                <p className="text-xs tracking-widest uppercase font-semibold text-black opacity-50 mb-2">Detected Variants</p>
-                {gene.detected_variants.length > 0 ? (
-                  <div className="space-y-1">
-                    {gene.detected_variants.map((v, vi) => (
-                      <p key={vi} className="text-xs font-light text-black tracking-wider font-mono">
-                        {v.rsid} &nbsp; {v.ref} &rarr; {v.alt} &nbsp; GT: {v.genotype}
-                      </p>
-                    ))}
-                  </div>
-                ) : (
-                  <p className="text-xs tracking-wider font-light text-black opacity-40">
-                    No variants detected — reference allele
-                  </p>
-                )}
-              </div>
-            )}
-          </div>
-        ))}
-      </div>
+      {/* Pharmacogenomic Profile — shared by all of this patient's drugs */}
+      <GeneProfile key={patient.id} profile={patient.profile} />
 
       {/* Quality Metrics */}
       <div className="border border-black mb-10">
         <div className="border-b border-black px-6 py-4 flex items-center justify-between">
           <p className="text-xs tracking-widest uppercase font-semibold text-black">Quality Metrics</p>
           <p className="text-xs tracking-wider text-black opacity-30 font-light">
-            {Object.values(result.quality_metrics).filter(Boolean).length} / {Object.values(result.quality_metrics).length} passed
+            {qualityChecks.filter(([, value]) => value).length} / {qualityChecks.length} passed
           </p>
         </div>
         <div className="p-6 grid grid-cols-2 md:grid-cols-3 gap-y-4 gap-x-8">
-          {Object.entries(result.quality_metrics).map(([key, value]) => (
+          {qualityChecks.map(([key, value]) => (
             <div key={key} className="flex items-center gap-3">
               <svg
                 className={`w-3.5 h-3.5 flex-shrink-0 ${value ? 'text-black' : 'text-black opacity-20'}`}
@@ -318,7 +423,7 @@ function ResultDisplay({ results }) {
         {showJson && (
           <div className="mt-3 border border-black bg-black overflow-auto max-h-96">
             <pre className="p-5 text-xs text-green-400 font-mono leading-relaxed">
-              {JSON.stringify(results, null, 2)}
+              {rawJson}
             </pre>
           </div>
         )}
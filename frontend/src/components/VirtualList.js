@@ -0,0 +1,32 @@
+import React, { useState } from 'react';
+
+// Fixed-height windowed list: only the rows inside the viewport (plus a
+// few either side) are mounted, so thousands of rows cost a screenful.
+function VirtualList({ items, rowHeight, height, renderRow, overscan = 6, className = '' }) {
+  const [scrollTop, setScrollTop] = useState(0);
+
+  const viewport = Math.min(height, items.length * rowHeight);
+  const first = Math.max(0, Math.floor(scrollTop / rowHeight) - overscan);
+  const last = Math.min(items.length, Math.ceil((scrollTop + viewport) / rowHeight) + overscan);
+
+  const rows = [];
+  for (let i = first; i < last; i++) {
+    rows.push(
+      <div key={i} style={{ position: 'absolute', top: i * rowHeight, left: 0, right: 0, height: rowHeight }}>
+        {renderRow(items[i], i)}
+      </div>
+    );
+  }
+
+  return (
+    <div
+      className={`overflow-y-auto ${className}`}
+      style={{ height: viewport, position: 'relative' }}
+      onScroll={(e) => setScrollTop(e.currentTarget.scrollTop)}
+    >
+      <div style={{ height: items.length * rowHeight, position: 'relative' }}>{rows}</div>
+    </div>
+  );
+}
+
+export default VirtualList;
@@ -0,0 +1,68 @@
+/* eslint-disable no-restricted-globals */
+
+// Reduces a VCF to what the backend actually reads: the header lines and
+// records whose INFO column carries GENE=<one of these genes>. Every other
+// record is dropped server-side, so a WGS file shrinks to a few KB here
+// instead of being uploaded in full.
+const SUPPORTED_GENES = new Set(['CYP2D6', 'CYP2C19', 'CYP2C9', 'SLCO1B1', 'TPMT', 'DPYD']);
+
+const CHUNK_BYTES = 4 * 1024 * 1024;
+
+function geneOf(line) {
+  // Cheap reject before splitting: most WGS records have no GENE tag
+  if (line.indexOf('GENE=') < 0) return null;
+  const fields = line.split('\t', 8);
+  if (fields.length < 8) return null;
+  for (const entry of fields[7].split(';')) {
+    if (entry.startsWith('GENE=')) return entry.slice(5);
+  }
+  return null;
+}
+
+async function prefilter(file) {
+  // fatal: invalid UTF-8 aborts filtering, and the original file is sent so
+  // the server reports the encoding error
+  const decoder = new TextDecoder('utf-8', { fatal: true });
+  const kept = [];
+  let remainder = '';
+  let records = 0;
+  let keptRecords = 0;
+
+  const handle = (line) => {
+    if (!line) return;
+    if (line[0] === '#') {
+      kept.push(line);
+      return;
+    }
+    records += 1;
+    if (SUPPORTED_GENES.has(geneOf(line))) {
+      kept.push(line);
+      keptRecords += 1;
+    }
+  };
+
+  for (let offset = 0; offset < file.size; offset += CHUNK_BYTES) {
+    const buffer = await file.slice(offset, offset + CHUNK_BYTES).arrayBuffer();
+    const text = remainder + decoder.decode(buffer, { stream: true });
+    const lines = text.split('\n');
+    remainder = lines.pop();
+    lines.forEach(handle);
+    self.postMessage({ type: 'progress', loaded: Math.min(offset + CHUNK_BYTES, file.size), total: file.size });
+  }
+  handle(remainder + decoder.decode());
+
+  return {
+    blob: new Blob([kept.join('\n') + '\n'], { type: file.type || 'text/plain' }),
+    records,
+    keptRecords,
+  };
+}
+
+self.onmessage = async (e) => {
+  try {
+    const result = await prefilter(e.data.file);
+    self.postMessage({ type: 'done', ...result });
+  } catch (err) {
+    self.postMessage({ type: 'error', message: err.message || String(err) });
+  }
+};